@@ -0,0 +1,105 @@
+from PyQt5 import QtCore
+
+from collections import OrderedDict
+
+from metrics import METRICS
+
+
+def display(value):
+    return "" if value is None else str(value)
+
+
+class ColumnarTableModel(QtCore.QAbstractTableModel):
+    """Table over a ColumnarFile, only the columns and rows on screen are ever read.
+
+    Cells are converted to display strings a block of blocksize rows of one column at a
+    time, the most recently used maxblocks blocks are kept. Row r is line r + 1 of the
+    text view, whose line 0 holds the column names. Sorting is left to the owner through
+    sortRequested, which answers with setRowMap.
+    """
+    sortRequested = QtCore.pyqtSignal(int, bool)  # column, ascending
+
+    MAXROWS = 2 ** 31 - 1  # Qt counts rows in an int
+
+    def __init__(self, columnar, blocksize=1000, maxblocks=256, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent=parent)
+        self.columnar = columnar
+        self.header = list(columnar.columns)
+        self.firstrow = 1  # line number of the first row
+        self.blocksize = blocksize
+        self.maxblocks = maxblocks
+        self.rowmap = None  # line number of every row while the table is sorted
+        self._blocks = OrderedDict()
+
+    def linenumber(self, row):
+        if self.rowmap is not None:
+            return int(self.rowmap[row])
+        return row + self.firstrow
+
+    def row(self, linenumber):
+        """Row showing linenumber, None while sorted"""
+        if self.rowmap is not None:
+            return None
+        return max(linenumber - self.firstrow, 0)
+
+    def setRowMap(self, rowmap):
+        """Show the lines in the order of rowmap, or in file order if it is None"""
+        self.beginResetModel()
+        self.rowmap = rowmap
+        self._blocks.clear()
+        self.endResetModel()
+
+    def setLineCount(self, linecount):
+        """A columnar file knows its size from the start"""
+
+    def _block(self, number, col):
+        key = (number, col)
+        block = self._blocks.get(key)
+        if block is None:
+            first = number * self.blocksize
+            with METRICS.timer("columnar_block_load"):
+                if self.rowmap is None:
+                    values = self.columnar.slice(col, first, self.blocksize)
+                else:
+                    rows = self.rowmap[first:first + self.blocksize].astype("int64") - self.firstrow
+                    values = self.columnar.take(col, rows)
+                block = [display(value) for value in values]
+            self._blocks[key] = block
+            if len(self._blocks) > self.maxblocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(key)
+        return block
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return QtCore.QVariant()
+
+        if orientation == QtCore.Qt.Horizontal:
+            if section < len(self.header):
+                return self.header[section]
+            return str(section)
+        return str(self.linenumber(section))
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return QtCore.QVariant()
+        if METRICS.enabled:
+            METRICS.count("columnar_data")
+
+        number, offset = divmod(index.row(), self.blocksize)
+        block = self._block(number, index.column())
+        if offset >= len(block):
+            return QtCore.QVariant()
+        return block[offset]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if self.rowmap is not None:
+            return min(len(self.rowmap), self.MAXROWS)
+        return min(self.columnar.num_rows, self.MAXROWS)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.header)
+
+    def sort(self, column, order):
+        self.sortRequested.emit(column, order == QtCore.Qt.AscendingOrder)
@@ -0,0 +1,213 @@
+from PyQt5 import QtCore, QtWidgets
+
+import logging
+from functools import partial
+
+from LineView import LineView
+from filediff import diff_files
+from largefile import LargeFile
+from jobs import LOW
+
+logger = logging.getLogger(__name__)
+
+
+class DiffView(QtWidgets.QWidget):
+    """Two files side by side, the lines which differ marked and the panes scrolled together.
+
+    Both files are opened and indexed as the viewer does, through the index cache, and
+    compared by a job of scheduler, whose dispatch has to hand posts over to the GUI
+    thread. Until the comparison is done both panes show the same line numbers, after
+    that each shows the lines matching those of the other.
+    """
+
+    def __init__(self, scheduler, chunkcache=None, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.jobs = scheduler
+        self.chunkcache = chunkcache
+        self.files = [None, None]  # LargeFile of each side
+        self.diff = None
+        self.diffjob = None
+        self.hunk = None  # number of the difference gone to last
+        self._syncing = False
+        self.setWindowFlags(QtCore.Qt.Window)
+        self.resize(1200, 700)
+        self.initUI()
+
+    def initUI(self):
+        vLayout = QtWidgets.QVBoxLayout(self)
+        hLayout = QtWidgets.QHBoxLayout()
+        self.prevBtn = QtWidgets.QPushButton("Previous difference", self)
+        self.prevBtn.clicked.connect(self.previousDifference)
+        hLayout.addWidget(self.prevBtn)
+        self.nextBtn = QtWidgets.QPushButton("Next difference", self)
+        self.nextBtn.clicked.connect(self.nextDifference)
+        hLayout.addWidget(self.nextBtn)
+        self.summaryLabel = QtWidgets.QLabel(self)
+        hLayout.addWidget(self.summaryLabel, 1)
+        self.progressBar = QtWidgets.QProgressBar(self)
+        self.progressBar.setRange(0, 1000)
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        hLayout.addWidget(self.progressBar)
+        vLayout.addLayout(hLayout)
+
+        hLayoutNames = QtWidgets.QHBoxLayout()
+        hLayoutPanes = QtWidgets.QHBoxLayout()
+        self.nameLabels = []
+        self.panes = []
+        for side in (0, 1):
+            label = QtWidgets.QLabel(self)
+            label.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+            hLayoutNames.addWidget(label)
+            pane = LineView(self)
+            pane.setLineNumbers(True)
+            pane.topLineChanged.connect(lambda topline, side=side: self._scrolled(side, topline))
+            hLayoutPanes.addWidget(pane)
+            self.nameLabels.append(label)
+            self.panes.append(pane)
+        vLayout.addLayout(hLayoutNames)
+        vLayout.addLayout(hLayoutPanes)
+        self._enableNavigation()
+
+        self.progressTimer = QtCore.QTimer(self)
+        self.progressTimer.setInterval(200)
+        self.progressTimer.timeout.connect(self._show_progress)
+
+    def compare(self, fileA, fileB):
+        """Open both files and start comparing them"""
+        self.cancel()
+        if self.diffjob is not None and not self.diffjob.finished.is_set():
+            logger.warning(f"Comparing {self.files} is still going on.")
+        else:
+            self.close_files()
+        self.diff = None
+        self.hunk = None
+        self.files = [LargeFile(name, chunkcache=self.chunkcache) for name in (fileA, fileB)]
+        self.setWindowTitle(f"Compare {fileA} with {fileB}")
+        for label, name in zip(self.nameLabels, (fileA, fileB)):
+            label.setText(name)
+        for pane in self.panes:
+            pane.setSource(lambda start, n: [], 0)
+            pane.setMarks(None)
+        self.summaryLabel.setText("Indexing...")
+        self._enableNavigation()
+        self.diffjob = self.jobs.submit(compare_files, *self.files, self._indexed, priority=LOW, name="Comparing",
+                                        group=self, done=self._compared)
+        self.progressTimer.start()
+
+    def _indexed(self, side, index):
+        large = self.files[side]
+        self.panes[side].setSource(lambda start, n: large.lines(start, n, index), len(index))
+        self.summaryLabel.setText("Comparing...")
+
+    def _compared(self, diff):
+        self.diff = diff
+        for side, pane in enumerate(self.panes):
+            pane.setMarks(diff.changed(side))
+        summary = diff.summary()
+        if not len(diff):
+            self.summaryLabel.setText("The files are the same.")
+        else:
+            text = f"{summary['hunks']} differences, {summary['deleted']} lines only on the left, " \
+                   f"{summary['inserted']} only on the right."
+            if summary["coarse"]:
+                text += f" {summary['coarse']} too large to compare line by line."
+            self.summaryLabel.setText(text)
+        self._enableNavigation()
+        self._scrolled(0, self.panes[0].topline)
+
+    def _show_progress(self):
+        if self.diffjob is None or self.diffjob.finished.is_set():
+            self.progressTimer.stop()
+            self.progressBar.hide()
+            if self.diffjob is not None and self.diffjob.state == "failed":
+                self.summaryLabel.setText(f"Comparing failed. {self.diffjob.error}")
+            return
+        if self.diffjob.fraction is not None:
+            self.progressBar.setValue(int(self.diffjob.fraction * 1000))
+            self.progressBar.show()
+
+    def _enableNavigation(self):
+        found = self.diff is not None and len(self.diff) > 0
+        self.prevBtn.setEnabled(found)
+        self.nextBtn.setEnabled(found)
+
+    def _scrolled(self, side, topline):
+        """Scroll the other pane to the lines matching those at the top of pane side"""
+        if self._syncing:
+            return
+        self.hunk = None
+        other = self.panes[1 - side]
+        line = topline if self.diff is None else self.diff.counterpart(topline, side)
+        self._syncing = True
+        try:
+            other.scrollToLine(line, current=False)
+        finally:
+            self._syncing = False
+
+    def showDifference(self, n):
+        """Show difference n at the top of both panes"""
+        self.hunk = n
+        _, a1, _, b1, _ = self.diff[n]
+        self._syncing = True
+        try:
+            for pane, line in zip(self.panes, (a1, b1)):
+                pane.scrollToLine(line)
+        finally:
+            self._syncing = False
+        self.summaryLabel.setText(f"Difference {n + 1} of {len(self.diff)}")
+
+    def nextDifference(self):
+        if self.hunk is None:
+            n = self.diff.next_hunk(self.panes[0].topline - 1)
+        else:
+            n = self.hunk + 1 if self.hunk + 1 < len(self.diff) else None
+        if n is not None:
+            self.showDifference(n)
+
+    def previousDifference(self):
+        if self.hunk is None:
+            n = self.diff.previous_hunk(self.panes[0].topline)
+        else:
+            n = self.hunk - 1 if self.hunk > 0 else None
+        if n is not None:
+            self.showDifference(n)
+
+    def cancel(self):
+        if self.diffjob is not None:
+            self.diffjob.cancel()
+            self.diffjob.wait(timeout=1)
+
+    def close_files(self):
+        prefetcher = None if self.chunkcache is None else self.chunkcache.scheduler
+        for large in self.files:
+            if large is None:
+                continue
+            if prefetcher is not None:  # reads ahead in the file must not outlive it
+                prefetcher.wait(prefetcher.cancel(group=large.source.filename), timeout=1)
+            large.close()
+        self.files = [None, None]
+
+    def closeEvent(self, event):
+        self.cancel()
+        self.progressTimer.stop()
+        if self.diffjob is None or self.diffjob.finished.is_set():
+            for pane in self.panes:
+                pane.setSource(lambda start, n: [], 0)
+            self.close_files()
+        QtWidgets.QWidget.closeEvent(self, event)
+
+
+def compare_files(job, a, b, indexed):
+    """Index both LargeFiles, posting indexed(side, index) for each, then diff them"""
+    sizes = [a.source.estimated_size(), b.source.estimated_size()]
+    total = 2 * sum(sizes)  # indexing and hashing each byte
+
+    def progress(offset, done, _):
+        job.progress(offset + done, total)
+
+    for side, large in enumerate((a, b)):
+        if not large.load_index():
+            large.build_index(token=job.token, progress=partial(progress, sum(sizes[:side])))
+        job.post(indexed, side, large.file_index)
+    return diff_files(a, b, token=job.token, progress=partial(progress, sum(sizes)))
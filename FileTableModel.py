@@ -0,0 +1,141 @@
+from PyQt5 import QtCore
+
+import csv
+from collections import OrderedDict
+
+from metrics import METRICS
+from schema import parse_rows
+
+
+class FileTableModel(QtCore.QAbstractTableModel):
+    """Table over every line of a delimited file, rows are parsed when they are shown.
+
+    Lines come from fetch(start, n) and are parsed in blocks of blocksize rows.
+    dtypes, the column types inferred for the whole file, keep the display the same on every block.
+    The most recently used maxblocks blocks are kept, each as a list of display strings
+    per column which is only built once a column of the block is painted.
+    Sorting is left to the owner through sortRequested, which answers with setRowMap.
+    """
+    sortRequested = QtCore.pyqtSignal(int, bool)  # column, ascending
+
+    MAXROWS = 2 ** 31 - 1  # Qt counts rows in an int
+
+    def __init__(self, fetch, linecount, header, has_header, dialect, dtypes=None, blocksize=1000, maxblocks=64,
+                 parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent=parent)
+        self.fetch = fetch
+        self.header = list(header or [])
+        self.firstrow = 1 if has_header else 0  # line number of the first row
+        self.dialect = dialect or csv.excel
+        self.dtypes = list(dtypes or [])
+        self.blocksize = blocksize
+        self.maxblocks = maxblocks
+        self.rowmap = None  # line number of every row while the table is sorted
+        self._linecount = linecount
+        self._rows = self._rowcount(linecount)
+        self._blocks = OrderedDict()
+
+    def _rowcount(self, linecount):
+        if self.rowmap is not None:
+            return min(len(self.rowmap), self.MAXROWS)
+        return min(max(linecount - self.firstrow, 0), self.MAXROWS)
+
+    def linenumber(self, row):
+        if self.rowmap is not None:
+            return int(self.rowmap[row])
+        return row + self.firstrow
+
+    def row(self, linenumber):
+        """Row showing linenumber, None while sorted"""
+        if self.rowmap is not None:
+            return None
+        return max(linenumber - self.firstrow, 0)
+
+    def setRowMap(self, rowmap):
+        """Show the lines in the order of rowmap, or in file order if it is None"""
+        self.beginResetModel()
+        self.rowmap = rowmap
+        self._rows = self._rowcount(self._linecount)
+        self._blocks.clear()
+        self.endResetModel()
+
+    def setLineCount(self, linecount):
+        """The file got indexed further or grew"""
+        self._linecount = linecount
+        if self.rowmap is not None:  # the order does not cover the new lines
+            self.setRowMap(None)
+            return
+        rows = self._rowcount(linecount)
+        if rows > self._rows:
+            self.beginInsertRows(QtCore.QModelIndex(), self._rows, rows - 1)
+            self._blocks.pop((self._rows - 1) // self.blocksize, None)  # last block may have been incomplete
+            self._rows = rows
+            self.endInsertRows()
+        elif rows < self._rows:
+            self.beginResetModel()
+            self._rows = rows
+            self._blocks.clear()
+            self.endResetModel()
+
+    def _block(self, number):
+        block = self._blocks.get(number)
+        if block is None:
+            first = number * self.blocksize
+            with METRICS.timer("table_block_load"):
+                if self.rowmap is None:
+                    lines = self.fetch(self.linenumber(first), self.blocksize)
+                else:
+                    lines = [''.join(self.fetch(int(n), 1)) for n in self.rowmap[first:first + self.blocksize]]
+                rows = parse_rows(list(lines), self.dialect)  # one row per line, whatever its quotes
+            block = {"rows": rows, "columns": {}}
+            self._blocks[number] = block
+            if len(self._blocks) > self.maxblocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(number)
+        return block
+
+    def _column(self, block, col):
+        column = block["columns"].get(col)
+        if column is None:
+            column = [row[col] if col < len(row) else '' for row in block["rows"]]
+            block["columns"][col] = column
+        return column
+
+    def _numeric(self, col):
+        return col < len(self.dtypes) and self.dtypes[col] in ("int64", "float64")
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.ToolTipRole and orientation == QtCore.Qt.Horizontal and section < len(self.dtypes):
+            return self.dtypes[section]
+        if role != QtCore.Qt.DisplayRole:
+            return QtCore.QVariant()
+
+        if orientation == QtCore.Qt.Horizontal:
+            if self.firstrow and section < len(self.header):
+                return self.header[section]
+            return str(section)
+        return str(self.linenumber(section))
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.TextAlignmentRole and index.isValid() and self._numeric(index.column()):
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return QtCore.QVariant()
+        if METRICS.enabled:
+            METRICS.count("table_data")
+
+        number, offset = divmod(index.row(), self.blocksize)
+        column = self._column(self._block(number), index.column())
+        if offset >= len(column):
+            return QtCore.QVariant()
+        return column[offset]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return self._rows
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.header)
+
+    def sort(self, column, order):
+        self.sortRequested.emit(column, order == QtCore.Qt.AscendingOrder)
@@ -0,0 +1,35 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class HitMap(QtWidgets.QWidget):
+    """Narrow strip showing where in the file the hits of a search are, click to jump there"""
+    lineClicked = QtCore.pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.results = None
+        self.linecount = 0
+        self.setFixedWidth(12)
+        self.setCursor(QtCore.Qt.PointingHandCursor)
+
+    def setResults(self, results, linecount):
+        self.results = results
+        self.linecount = linecount
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        if self.results is not None and len(self.results) and self.linecount:
+            counts = self.results.density(max(self.height(), 1), self.linecount)
+            color = self.palette().color(QtGui.QPalette.Highlight)
+            peak = counts.max()
+            for y in counts.nonzero()[0].tolist():
+                # a single hit must stay visible next to dense regions
+                color.setAlphaF(0.35 + 0.65 * counts[y] / peak)
+                painter.fillRect(0, y, self.width(), 1, color)
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if self.linecount:
+            self.lineClicked.emit(int(event.y() / max(self.height(), 1) * self.linecount))
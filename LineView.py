@@ -0,0 +1,159 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class LineView(QtWidgets.QAbstractScrollArea):
+    """Read only text view which only asks for and paints the lines on screen.
+
+    Lines come from fetch(start, n), which returns the text of up to n lines starting at
+    line start, so scrolling costs the same for a file of any size. The vertical scrollbar
+    spans every line of the file and line numbers are painted in a gutter.
+    """
+    topLineChanged = QtCore.pyqtSignal(int)
+
+    MAXSCROLL = 2 ** 30  # a scrollbar holds an int, beyond that one step covers several lines
+
+    def __init__(self, parent=None):
+        QtWidgets.QAbstractScrollArea.__init__(self, parent)
+        self.fetch = lambda start, n: []
+        self.linecount = 0
+        self.topline = 0
+        self.currentline = None
+        self.marks = None  # lines to highlight, anything supporting in
+        self.linenumbers = False
+        self.gutterpadding = 6
+        self._scale = 1
+        self._maxwidth = 0
+
+        self.setFont(QtGui.QFont('Courier New', 10))
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.verticalScrollBar().valueChanged.connect(self._scrolled)
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update)
+
+    def setSource(self, fetch, linecount):
+        self.fetch = fetch
+        self.topline = 0
+        self.currentline = None
+        self._maxwidth = 0
+        self.setLineCount(linecount)
+
+    def setLineCount(self, linecount):
+        self.linecount = linecount
+        self._scale = max(1, -(-linecount // self.MAXSCROLL))
+        self._updateScrollbars()
+        self.viewport().update()
+
+    def setMarks(self, marks):
+        self.marks = marks
+        self.viewport().update()
+
+    def setLineNumbers(self, enabled):
+        self.linenumbers = enabled
+        self.viewport().update()
+
+    def pagelines(self):
+        """How many lines fit in the view"""
+        return max(self.viewport().height() // self.fontMetrics().lineSpacing(), 1)
+
+    def lastTopLine(self):
+        return max(self.linecount - self.pagelines(), 0)
+
+    def scrollToLine(self, linenumber, current=True):
+        """Show linenumber at the top of the view, or the last page if it is near the end"""
+        self.topline = min(max(linenumber, 0), self.lastTopLine())
+        if current:
+            self.currentline = linenumber
+        scrollbar = self.verticalScrollBar()
+        scrollbar.blockSignals(True)
+        scrollbar.setValue(self.topline // self._scale)
+        scrollbar.blockSignals(False)
+        self.viewport().update()
+        self.topLineChanged.emit(self.topline)
+
+    def visibleLines(self):
+        return self.fetch(self.topline, self.pagelines())
+
+    def _scrolled(self, value):
+        self.topline = min(value * self._scale, self.lastTopLine())
+        self.viewport().update()
+        self.topLineChanged.emit(self.topline)
+
+    def _gutterwidth(self):
+        if not self.linenumbers:
+            return 0
+        return self.fontMetrics().horizontalAdvance(str(max(self.linecount - 1, 0))) + 2 * self.gutterpadding
+
+    def _updateScrollbars(self):
+        pagelines = self.pagelines()
+        scrollbar = self.verticalScrollBar()
+        scrollbar.setRange(0, -(-self.lastTopLine() // self._scale))
+        scrollbar.setPageStep(max(pagelines // self._scale, 1))
+        scrollbar.setSingleStep(1)
+
+        textwidth = self.viewport().width() - self._gutterwidth()
+        self.horizontalScrollBar().setRange(0, max(self._maxwidth - textwidth, 0))
+        self.horizontalScrollBar().setPageStep(max(textwidth, 1))
+        self.horizontalScrollBar().setSingleStep(self.fontMetrics().horizontalAdvance("x"))
+
+    def resizeEvent(self, event):
+        QtWidgets.QAbstractScrollArea.resizeEvent(self, event)
+        self._updateScrollbars()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        lineheight = metrics.lineSpacing()
+        charwidth = metrics.horizontalAdvance("x")
+        gutter = self._gutterwidth()
+        width = self.viewport().width()
+        xoffset = self.horizontalScrollBar().value()
+        firstcolumn = xoffset // charwidth
+        columns = (width - gutter) // charwidth + 2
+
+        lines = self.fetch(self.topline, self.pagelines() + 1)
+        markcolor = self.palette().color(QtGui.QPalette.Highlight)
+        markcolor.setAlphaF(0.25)
+        maxwidth = self._maxwidth
+        for row, line in enumerate(lines):
+            linenumber = self.topline + row
+            y = row * lineheight
+            if linenumber == self.currentline:
+                painter.fillRect(gutter, y, width - gutter, lineheight, self.palette().alternateBase())
+            if self.marks is not None and linenumber in self.marks:
+                painter.fillRect(gutter, y, width - gutter, lineheight, markcolor)
+
+            line = line.expandtabs()
+            maxwidth = max(maxwidth, len(line) * charwidth)
+            # monospaced font, only the characters which are in view get painted
+            painter.drawText(gutter - xoffset % charwidth, y + metrics.ascent(),
+                             line[firstcolumn:firstcolumn + columns])
+
+        if gutter:
+            painter.fillRect(0, 0, gutter, self.viewport().height(), self.palette().window())
+            painter.setPen(self.palette().color(QtGui.QPalette.Disabled, QtGui.QPalette.Text))
+            for row in range(len(lines)):
+                painter.drawText(0, row * lineheight, gutter - self.gutterpadding, lineheight,
+                                 QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter, str(self.topline + row))
+        painter.end()
+
+        if maxwidth > self._maxwidth:
+            self._maxwidth = maxwidth
+            self._updateScrollbars()
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if event.matches(QtGui.QKeySequence.Copy):
+            QtWidgets.QApplication.clipboard().setText("\n".join(self.visibleLines()))
+        elif key == QtCore.Qt.Key_Up:
+            self.scrollToLine(self.topline - 1, current=False)
+        elif key == QtCore.Qt.Key_Down:
+            self.scrollToLine(self.topline + 1, current=False)
+        elif key == QtCore.Qt.Key_PageUp:
+            self.scrollToLine(self.topline - self.pagelines(), current=False)
+        elif key == QtCore.Qt.Key_PageDown:
+            self.scrollToLine(self.topline + self.pagelines(), current=False)
+        elif key == QtCore.Qt.Key_Home and event.modifiers() & QtCore.Qt.ControlModifier:
+            self.scrollToLine(0, current=False)
+        elif key == QtCore.Qt.Key_End and event.modifiers() & QtCore.Qt.ControlModifier:
+            self.scrollToLine(self.linecount, current=False)
+        else:
+            QtWidgets.QAbstractScrollArea.keyPressEvent(self, event)
@@ -0,0 +1,158 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from metrics import Profile, Sampler
+
+COLUMNS = ["Metric", "Count / value", "Total ms", "Mean ms", "Max ms"]
+PROFILERS = {"cProfile": Profile, "Sampling": Sampler}
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:,.3f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+class MetricsPanel(QtWidgets.QWidget):
+    """Live view of the metrics, with switches to record them and to profile an action meanwhile.
+
+    The table is refreshed every second while the panel is shown.
+    A profile runs from pressing Profile until pressing it again, its report is shown below
+    the table and can be saved, cProfile stats as .prof and sampled stacks as .folded.
+    """
+
+    def __init__(self, metrics, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.metrics = metrics
+        self.profiler = None
+        self.setWindowFlags(QtCore.Qt.Window)
+        self.setWindowTitle("Metrics")
+        self.resize(640, 560)
+        self.initUI()
+
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setInterval(1000)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+    def initUI(self):
+        vLayout = QtWidgets.QVBoxLayout(self)
+        hLayout = QtWidgets.QHBoxLayout()
+        self.enableCheck = QtWidgets.QCheckBox("Record", self)
+        self.enableCheck.setChecked(self.metrics.enabled)
+        self.enableCheck.toggled.connect(self.setRecording)
+        hLayout.addWidget(self.enableCheck)
+        self.resetBtn = QtWidgets.QPushButton("Reset", self)
+        self.resetBtn.clicked.connect(self.reset)
+        hLayout.addWidget(self.resetBtn)
+        self.jsonBtn = QtWidgets.QPushButton("Save JSON", self)
+        self.jsonBtn.clicked.connect(lambda: self.saveDump("json"))
+        hLayout.addWidget(self.jsonBtn)
+        self.prometheusBtn = QtWidgets.QPushButton("Save Prometheus", self)
+        self.prometheusBtn.clicked.connect(lambda: self.saveDump("prometheus"))
+        hLayout.addWidget(self.prometheusBtn)
+        hLayout.addStretch()
+        self.profilerCombo = QtWidgets.QComboBox(self)
+        self.profilerCombo.addItems(list(PROFILERS))
+        self.profilerCombo.setToolTip("cProfile traces the user interface thread, sampling sees every thread")
+        hLayout.addWidget(self.profilerCombo)
+        self.profileBtn = QtWidgets.QPushButton("Profile", self)
+        self.profileBtn.setCheckable(True)
+        self.profileBtn.toggled.connect(self.toggleProfile)
+        hLayout.addWidget(self.profileBtn)
+        self.saveProfileBtn = QtWidgets.QPushButton("Save profile", self)
+        self.saveProfileBtn.clicked.connect(self.saveProfile)
+        self.saveProfileBtn.setEnabled(False)
+        hLayout.addWidget(self.saveProfileBtn)
+        vLayout.addLayout(hLayout)
+
+        self.table = QtWidgets.QTableWidget(self)
+        self.table.setColumnCount(len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setFont(QtGui.QFont('Arial', 8))
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        vLayout.addWidget(self.table, 3)
+
+        self.reportEdit = QtWidgets.QPlainTextEdit(self)
+        self.reportEdit.setReadOnly(True)
+        self.reportEdit.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.reportEdit.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        self.reportEdit.hide()
+        vLayout.addWidget(self.reportEdit, 2)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refreshTimer.start()
+        QtWidgets.QWidget.showEvent(self, event)
+
+    def hideEvent(self, event):
+        self.refreshTimer.stop()
+        QtWidgets.QWidget.hideEvent(self, event)
+
+    def setRecording(self, enabled):
+        self.metrics.enable(enabled)
+        self.refresh()
+
+    def reset(self):
+        self.metrics.reset()
+        self.refresh()
+
+    def refresh(self):
+        """Show the counters, gauges and timers as they are now"""
+        snapshot = self.metrics.snapshot()
+        rows = [(name, value, None, None, None) for name, value in sorted(snapshot["counters"].items())]
+        rows += [(name, value, None, None, None) for name, value in sorted(snapshot["gauges"].items())]
+        rows += [(name, timer["count"], timer["sum"] * 1000, timer["mean"] * 1000, timer["max"] * 1000)
+                 for name, timer in sorted(snapshot["timers"].items())]
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem("" if value is None else _format(value))
+                if column:
+                    item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def dump(self, format):
+        return self.metrics.to_json(indent=1) if format == "json" else self.metrics.to_prometheus()
+
+    def saveDump(self, format):
+        suffix = "json" if format == "json" else "prom"
+        fileName, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save metrics", f"metrics.{suffix}",
+                                                            f"Metrics (*.{suffix});;All files (*)")
+        if fileName:
+            with open(fileName, "w") as out:
+                out.write(self.dump(format))
+
+    def toggleProfile(self, checked):
+        """Start profiling, or stop and show the report"""
+        if checked:
+            self.profiler = PROFILERS[self.profilerCombo.currentText()]()
+            self.profiler.start()
+            self.profilerCombo.setEnabled(False)
+            self.saveProfileBtn.setEnabled(False)
+            return
+        self.profiler.stop()
+        self.profilerCombo.setEnabled(True)
+        self.saveProfileBtn.setEnabled(True)
+        self.reportEdit.setPlainText(self.profiler.report())
+        self.reportEdit.show()
+
+    def saveProfile(self):
+        sampled = isinstance(self.profiler, Sampler)
+        suffix = "folded" if sampled else "prof"
+        fileName, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save profile", f"profile.{suffix}",
+                                                            f"Profile (*.{suffix});;All files (*)")
+        if not fileName:
+            return
+        if sampled:
+            with open(fileName, "w") as out:
+                out.write(self.profiler.folded())
+        else:
+            self.profiler.save(fileName)
+
+    def closeEvent(self, event):
+        if self.profileBtn.isChecked():
+            self.profileBtn.setChecked(False)
+        QtWidgets.QWidget.closeEvent(self, event)
@@ -1,11 +1,39 @@
 from PyQt5 import QtCore
 
 import pandas as pd
+from collections import OrderedDict
 
-class PandasModel(QtCore.QAbstractTableModel): 
-    def __init__(self, df = pd.DataFrame(), parent=None): 
+class PandasModel(QtCore.QAbstractTableModel):
+    """Table model over a DataFrame.
+
+    Display strings are formatted a block of rows at a time into a numpy array and
+    header labels are converted once, so data and headerData do no pandas indexing.
+    """
+
+    def __init__(self, df = pd.DataFrame(), parent=None, blocksize=256, maxblocks=64):
         QtCore.QAbstractTableModel.__init__(self, parent=parent)
         self._df = df
+        self.blocksize = blocksize
+        self.maxblocks = maxblocks
+        self._invalidate()
+
+    def _invalidate(self):
+        """Drop the formatted strings, the frame has changed"""
+        self._columns = [str(c) for c in self._df.columns]
+        self._index = [str(i) for i in self._df.index]
+        self._blocks = OrderedDict()
+
+    def _block(self, number):
+        block = self._blocks.get(number)
+        if block is None:
+            start = number * self.blocksize
+            block = self._df.iloc[start:start + self.blocksize].astype(str).to_numpy(dtype=object)
+            self._blocks[number] = block
+            if len(self._blocks) > self.maxblocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(number)
+        return block
 
     def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
         if role != QtCore.Qt.DisplayRole:
@@ -13,13 +41,12 @@ class PandasModel(QtCore.QAbstractTableModel):
 
         if orientation == QtCore.Qt.Horizontal:
             try:
-                return self._df.columns.tolist()[section]
+                return self._columns[section]
             except (IndexError, ):
                 return QtCore.QVariant()
         elif orientation == QtCore.Qt.Vertical:
             try:
-                # return self.df.index.tolist()
-                return self._df.index.tolist()[section]
+                return self._index[section]
             except (IndexError, ):
                 return QtCore.QVariant()
 
@@ -30,31 +57,35 @@ class PandasModel(QtCore.QAbstractTableModel):
         if not index.isValid():
             return QtCore.QVariant()
 
-        return QtCore.QVariant(str(self._df.ix[index.row(), index.column()]))
+        number, offset = divmod(index.row(), self.blocksize)
+        return self._block(number)[offset, index.column()]
 
     def setData(self, index, value, role):
-        row = self._df.index[index.row()]
-        col = self._df.columns[index.column()]
+        row = index.row()
+        col = index.column()
         if hasattr(value, 'toPyObject'):
             # PyQt4 gets a QVariant
             value = value.toPyObject()
         else:
             # PySide gets an unicode
-            dtype = self._df[col].dtype
+            dtype = self._df.dtypes.iloc[col]
             if dtype != object:
                 value = None if value == '' else dtype.type(value)
-        self._df.set_value(row, col, value)
+        self._df.iat[row, col] = value
+        self._blocks.pop(row // self.blocksize, None)
+        self.dataChanged.emit(index, index)
         return True
 
-    def rowCount(self, parent=QtCore.QModelIndex()): 
-        return len(self._df.index)
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return len(self._index)
 
-    def columnCount(self, parent=QtCore.QModelIndex()): 
-        return len(self._df.columns)
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self._columns)
 
     def sort(self, column, order):
-        colname = self._df.columns.tolist()[column]
+        colname = self._df.columns[column]
         self.layoutAboutToBeChanged.emit()
         self._df.sort_values(colname, ascending= order == QtCore.Qt.AscendingOrder, inplace=True)
         self._df.reset_index(inplace=True, drop=True)
-        self.layoutChanged.emit()
\ No newline at end of file
+        self._invalidate()
+        self.layoutChanged.emit()
@@ -0,0 +1,45 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+FIELDS = [("Type", "dtype"), ("Count", "count"), ("Nulls", "nulls"), ("Distinct ≈", "distinct"), ("Min", "min"),
+          ("Max", "max"), ("Mean", "mean"), ("25 % ≈", "p25"), ("Median ≈", "p50"), ("75 % ≈", "p75")]
+
+
+def _format(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value).replace("\n", " ")
+
+
+class StatsPane(QtWidgets.QTableWidget):
+    """Statistics of every column of the file, a row per column"""
+
+    def __init__(self, parent=None):
+        QtWidgets.QTableWidget.__init__(self, parent)
+        self.setColumnCount(len(FIELDS))
+        self.setHorizontalHeaderLabels([label for label, _ in FIELDS])
+        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.setFont(QtGui.QFont('Arial', 8))
+        self.setWordWrap(False)
+        self.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+
+    def setStats(self, header, summaries):
+        """Show the summary of each column, header names the rows"""
+        self.clearContents()
+        self.setRowCount(len(summaries))
+        self.setVerticalHeaderLabels([str(name) for name in header[:len(summaries)]] +
+                                     [str(n) for n in range(len(header), len(summaries))])
+        for row, summary in enumerate(summaries):
+            for column, (_, key) in enumerate(FIELDS):
+                item = QtWidgets.QTableWidgetItem(_format(summary.get(key)))
+                if key != "dtype" and (key not in ("min", "max") or summary["dtype"] != "str"):
+                    item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.setItem(row, column, item)
+        self.resizeColumnsToContents()
+
+    def clearStats(self):
+        self.clearContents()
+        self.setRowCount(0)
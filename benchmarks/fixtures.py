@@ -0,0 +1,148 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+NEEDLE = "needle"  # term planted in one row of every block, for search benchmarks
+UNITS = {"kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3, "tb": 1024 ** 4, "b": 1}
+WORDS = np.array(["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliett",
+                  "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango"])
+LEVELS = np.array(["DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR"])
+ROWS = 20000  # rows per block
+POOL = 64  # blocks of random rows, files repeat them with their own row numbers
+POOL_BYTES = 256 * 1024 ** 2  # fewer of them where rows are long
+
+
+def parse_size(text):
+    """Bytes of a size like 1MB, 512kb or 20GB"""
+    text = text.strip().lower()
+    for unit, factor in UNITS.items():
+        if text.endswith(unit) and text[:-len(unit)].replace(".", "", 1).isdigit():
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def format_size(size):
+    for unit in ("GB", "MB", "KB"):
+        if size >= UNITS[unit.lower()] and size % UNITS[unit.lower()] == 0:
+            return f"{size // UNITS[unit.lower()]}{unit}"
+    return f"{size}B"
+
+
+def _words(rng, n, count):
+    """n strings of count random words each, the needle planted in the eighth"""
+    picked = WORDS[rng.integers(0, len(WORDS), size=(n, count))]
+    words = [" ".join(row) for row in picked.tolist()]
+    if n > 7:
+        words[7] += f" {NEEDLE}"
+    return words
+
+
+# each kind makes the rest of n rows after their number, and puts the number in front of them
+
+def narrow(rng, n, newline="\n"):
+    values = rng.random(n).round(6).tolist()
+    return [f",{name},{value}{newline}" for name, value in zip(_words(rng, n, 2), values)]
+
+
+def crlf(rng, n):
+    return narrow(rng, n, newline="\r\n")
+
+
+def wide(rng, n, columns=48):
+    numbers = rng.integers(0, 1_000_000, size=(n, columns // 2)).tolist()
+    floats = rng.normal(size=(n, columns // 4)).round(4).tolist()
+    texts = WORDS[rng.integers(0, len(WORDS), size=(n, columns // 4 - 1))].tolist()
+    return ["," + ",".join(map(str, [name] + a + b + c)) + "\n"
+            for name, a, b, c in zip(_words(rng, n, 1), numbers, floats, texts)]
+
+
+def tsv(rng, n):
+    counts = rng.integers(0, 10_000, size=n).tolist()
+    values = rng.random((n, 4)).round(5).tolist()
+    return ["\t" + "\t".join(map(str, [name, count] + value)) + "\n"
+            for name, count, value in zip(_words(rng, n, 3), counts, values)]
+
+
+def log(rng, n):
+    """Log lines of a hundred to a few thousand characters, after a timestamp"""
+    levels = LEVELS[rng.integers(0, len(LEVELS), size=n)].tolist()
+    workers = rng.integers(0, 16, size=n).tolist()
+    lengths = rng.integers(20, 600, size=n)
+    messages = _words(rng, n, 1)
+    words = WORDS[rng.integers(0, len(WORDS), size=int(lengths.sum()))].tolist()
+    ends = np.cumsum(lengths).tolist()
+    return [f" {level} worker-{worker} {message} {' '.join(words[end - length:end])}\n"
+            for level, worker, message, end, length in zip(levels, workers, messages, ends, lengths.tolist())]
+
+
+def multiline(rng, n):
+    """CSV with a quoted field holding newlines and doubled quotes in one row out of ten"""
+    spans = (rng.random(n) < 0.1).tolist()
+    values = rng.random(n).round(6).tolist()
+    return [f',"{text}\nsaid ""{value}""\nend",{value}\n' if span else f",{text},{value}\n"
+            for text, span, value in zip(_words(rng, n, 3), spans, values)]
+
+
+def _timestamp(i):
+    seconds = i // 10
+    return f"2024-01-01T{seconds // 3600 % 24:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{i % 10}00"
+
+
+HEADERS = {"narrow": "id,name,value\n", "crlf": "id,name,value\r\n",
+           "wide": ",".join(["id", "name"] + [f"n{c}" for c in range(24)] + [f"f{c}" for c in range(12)] +
+                            [f"t{c}" for c in range(11)]) + "\n",
+           "tsv": "id\tname\tcount\ta\tb\tc\td\n", "log": "", "multiline": "id,text,value\n"}
+KINDS = {"narrow": (narrow, ".csv"), "wide": (wide, ".csv"), "tsv": (tsv, ".tsv"), "log": (log, ".log"),
+         "crlf": (crlf, ".csv"), "multiline": (multiline, ".csv")}
+
+
+def fixture_path(directory, kind, size, seed=0):
+    return Path(directory) / f"{kind}-{format_size(size)}-{seed}{KINDS[kind][1]}"
+
+
+def generate(kind, size, directory, seed=0):
+    """Path of a file of about size bytes of kind, written unless it is there already.
+
+    The content only depends on kind, size and seed: the rows of block n are made by a
+    generator seeded with (seed, n % pool) and numbered in sequence, so every machine
+    writes the same bytes. The file is cut after the last whole row within size.
+    """
+    path = fixture_path(directory, kind, size, seed)
+    if path.exists():
+        return path
+    make, _ = KINDS[kind]
+    number = _timestamp if kind == "log" else str
+    pool, pooled = {}, POOL
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as out:
+        data = HEADERS[kind].encode("utf-8")
+        out.write(data)
+        written, block = len(data), 0
+        while written < size:
+            if block % pooled not in pool:
+                pool[block % pooled] = make(np.random.default_rng([seed, block % pooled]), ROWS)
+            first = block * ROWS
+            data = "".join([number(i) + rest for i, rest in zip(range(first, first + ROWS), pool[block % pooled])])
+            data = data.encode("utf-8")
+            if not block:
+                pooled = max(2, min(POOL, POOL_BYTES // len(data)))
+            block += 1
+            if written + len(data) > size:
+                data = data[:_cut(kind, data, size - written)]
+                if not data:
+                    break
+            out.write(data)
+            written += len(data)
+    os.replace(tmp, path)
+    return path
+
+
+def _cut(kind, data, limit):
+    """Length of the whole rows of data within limit bytes"""
+    cut = data.rfind(b"\n", 0, limit)
+    if kind == "multiline":  # a newline inside a quoted field ends no row
+        while cut >= 0 and data.count(b'"', 0, cut) % 2:
+            cut = data.rfind(b"\n", 0, cut)
+    return cut + 1
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # peak memory is only measured where the platform tells it
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fixtures
+from largefile import LargeFile
+from recordindex import index_records
+
+KINDS = list(fixtures.KINDS)
+SIZES = "1MB,100MB"
+GOTOS = 200  # random lines read for the goto latencies
+PAGE = 50  # lines read per goto, about a screen
+# metric: whether more is better, for comparing runs
+METRICS = {"index_mb_s": True, "index_s": False, "searchindex_mb_s": True, "reopen_s": False, "records_s": False,
+           "goto_p50_ms": False, "goto_p90_ms": False, "goto_p99_ms": False,
+           "search_index_ms": False, "search_grep_s": False, "grep_mb_s": True, "peak_rss_mb": False,
+           "first_render_s": False, "table_render_s": False, "gui_goto_p50_ms": False, "gui_goto_p99_ms": False,
+           "gui_peak_rss_mb": False}
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process and of the worker processes it waited for"""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # bytes on macOS, KB elsewhere
+    peaks = [resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale]
+    try:  # ru_maxrss of the process itself counts what its parent held before exec on Linux
+        with open("/proc/self/status") as status:
+            peaks += [int(line.split()[1]) * 1024 for line in status if line.startswith("VmHWM:")]
+    except OSError:
+        peaks.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)
+    return round(max(peaks) / 1024 ** 2, 1)
+
+
+def _percentiles(prefix, seconds):
+    milliseconds = np.array(seconds) * 1000
+    return {f"{prefix}_p{q}_ms": round(float(np.percentile(milliseconds, q)), 3) for q in (50, 90, 99)}
+
+
+def measure_core(path, seed=0):
+    """Index, reopen, goto and search a file through LargeFile, with an index cache of its own"""
+    size = os.path.getsize(path)
+    result = {}
+    with tempfile.TemporaryDirectory(prefix="lfv-bench-") as cachedir:
+        with LargeFile(path, cachedir=cachedir) as large:
+            started = time.perf_counter()
+            large.build_index()
+            elapsed = time.perf_counter() - started
+            result.update(lines=large.line_count, index_s=round(elapsed, 3),
+                          index_mb_s=round(size / 1e6 / elapsed, 1))
+            started = time.perf_counter()
+            large.build_searchindex()
+            result["searchindex_mb_s"] = round(size / 1e6 / (time.perf_counter() - started), 1)
+            dialect = large.file_properties()["dialect"]
+
+        with LargeFile(path, cachedir=cachedir) as large:
+            started = time.perf_counter()
+            large.load_index()
+            large.load_searchindex()
+            result["reopen_s"] = round(time.perf_counter() - started, 4)
+
+            latencies = []
+            for line in np.random.default_rng(seed).integers(0, large.line_count, size=GOTOS).tolist():
+                started = time.perf_counter()
+                large.lines(line, PAGE)
+                latencies.append(time.perf_counter() - started)
+            result.update(_percentiles("goto", latencies))
+
+            started = time.perf_counter()
+            hits = large.search(fixtures.NEEDLE)
+            result.update(search_index_ms=round((time.perf_counter() - started) * 1000, 3), search_hits=len(hits))
+            started = time.perf_counter()
+            grepped = large.search(rf"\b{fixtures.NEEDLE}\b", regex=True)
+            elapsed = time.perf_counter() - started
+            result.update(search_grep_s=round(elapsed, 3), grep_mb_s=round(size / 1e6 / elapsed, 1),
+                          grep_hits=len(grepped))
+
+    started = time.perf_counter()
+    records = index_records(path, dialect)
+    result.update(records_s=round(time.perf_counter() - started, 3),
+                  records=None if records is None else len(records))
+    return result
+
+
+def measure_gui(path, seed=0):
+    """Time to first render, to show the table and to go to lines in the viewer, indexing from scratch"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    import tableviewer
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    widget = tableviewer.Widget()
+    widget.show()
+    app.processEvents()
+    result = {}
+    try:
+        started = time.perf_counter()
+        widget.openFile(str(path))
+        widget.textwnd.viewport().grab()  # paints, fetching the lines on screen
+        result["first_render_s"] = round(time.perf_counter() - started, 4)
+
+        started = time.perf_counter()
+        widget.tableBtn.setChecked(True)
+        widget._show_as_table()
+        widget.pandasTv.viewport().grab()
+        result["table_render_s"] = round(time.perf_counter() - started, 4)
+        widget.tableBtn.setChecked(False)
+        widget._show_as_table()
+
+        while widget.file_index is None:  # goto over the whole file once it is indexed
+            app.processEvents()
+            time.sleep(0.01)
+        latencies = []
+        for line in np.random.default_rng(seed).integers(0, len(widget.file_index), size=GOTOS).tolist():
+            started = time.perf_counter()
+            widget.loadLine(line)
+            widget.textwnd.viewport().grab()
+            latencies.append(time.perf_counter() - started)
+        result.update(_percentiles("gui_goto", latencies))
+    finally:
+        widget.jobs.cancel()
+        widget.prefetcher.cancel()
+        widget.close()
+    return result
+
+
+def run_case(args):
+    """Measure one file in this process and print the results as JSON"""
+    if args.case == "gui":
+        with tempfile.TemporaryDirectory(prefix="lfv-bench-") as cachedir:
+            os.environ["LFV_CACHE_DIR"] = cachedir
+            result = measure_gui(args.file, seed=args.seed)
+    else:
+        result = measure_core(args.file, seed=args.seed)
+    result["peak_rss_mb" if args.case == "core" else "gui_peak_rss_mb"] = _peak_rss_mb()
+    print(json.dumps(result))
+
+
+def _subprocess(case, path, seed):
+    """Run a case in a process of its own, so that its peak memory and caches are its own"""
+    command = [sys.executable, str(Path(__file__).resolve()), "--case", case, "--seed", str(seed), str(path)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode:
+        return {f"{case}_error": completed.stderr.strip().splitlines()[-1:] or ["failed"]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline):
+    """Print each metric next to the baseline, as the factor it got better (> 1) or worse by"""
+    base = {(r["kind"], r["size"]): r for r in baseline["results"]}
+    for result in results["results"]:
+        previous = base.get((result["kind"], result["size"]))
+        if previous is None:
+            continue
+        print(f"{result['kind']} {result['size']}")
+        for metric, higher in METRICS.items():
+            new, old = result.get(metric), previous.get(metric)
+            if not new or not old:
+                continue
+            factor = new / old if higher else old / new
+            print(f"  {metric:18} {old:>12} -> {new:>12}  {factor:5.2f}x {'better' if factor >= 1 else 'worse'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark indexing, navigation and search on synthetic files.")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"comma separated, of {', '.join(KINDS)}")
+    parser.add_argument("--sizes", default=SIZES, help=f"comma separated file sizes like 1MB or 20GB, default {SIZES}")
+    parser.add_argument("--fixtures", default=Path(tempfile.gettempdir()) / "lfv-fixtures", type=Path,
+                        help="directory the generated files are kept in and reused from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gui", action="store_true", help="also measure the viewer, needs PyQt5")
+    parser.add_argument("--out", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="JSON results of an earlier run to compare with")
+    parser.add_argument("--case", choices=["core", "gui"], help=argparse.SUPPRESS)
+    parser.add_argument("file", nargs="?", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.case:
+        run_case(args)
+        return 0
+
+    results = {"meta": _meta(), "results": []}
+    for size in [fixtures.parse_size(size) for size in args.sizes.split(",")]:
+        for kind in args.kinds.split(","):
+            started = time.perf_counter()
+            path = fixtures.generate(kind, size, args.fixtures, seed=args.seed)
+            result = {"kind": kind, "size": fixtures.format_size(size), "bytes": os.path.getsize(path),
+                      "fixture_s": round(time.perf_counter() - started, 2)}
+            result.update(_subprocess("core", path, args.seed))
+            if args.gui:
+                result.update(_subprocess("gui", path, args.seed))
+            results["results"].append(result)
+            print(json.dumps(result), flush=True)
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=1))
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
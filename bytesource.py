@@ -0,0 +1,429 @@
+import bisect
+import bz2
+import codecs
+import logging
+import mmap
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from metrics import METRICS
+
+try:
+    import zstandard
+except ImportError:  # zstd files need the zstandard package
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+BLOCKSIZE = 16 * 1024 ** 2
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# the utf-32 little endian mark starts with the utf-16 one, it has to be checked first.
+# utf-8-sig drops the utf-8 mark wherever text is decoded from the start of the file.
+BOMS = [(codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+WIDE_ENCODINGS = ("utf-16", "utf-16-le", "utf-16-be", "utf-32")
+DECOMPRESS_ERRORS = (OSError, EOFError, ValueError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+class ByteSource:
+    """Random access to the bytes of a file, whatever it is stored as.
+
+    Offsets are always those of the plain content. blocks yields the content in
+    pieces which end on a line boundary, which is what LineScanner and grep work on.
+    encoding is what the content is decoded with, open_source detects it once per file.
+    identity tells files and their versions apart, for caches of their content.
+    """
+
+    compressed = False
+    snapshots = False
+    encoding = "utf-8"
+
+    def __init__(self, filename):
+        self.filename = os.fspath(filename)
+        self._fd = os.open(self.filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        stat = os.fstat(self._fd)
+        self.identity = (type(self).__name__, os.path.realpath(self.filename), stat.st_dev, stat.st_ino,
+                         stat.st_mtime_ns)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.filename}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def rawsize(self):
+        """Bytes the file takes on disk"""
+        return os.fstat(self._fd).st_size
+
+    @property
+    def size(self):
+        """Bytes of content, None while unknown"""
+        return self.rawsize
+
+    def estimated_size(self):
+        return self.size
+
+    def read(self, offset, nbytes):
+        raise NotImplementedError
+
+    def view(self, offset, nbytes):
+        """memoryview of up to nbytes from offset, without a copy where the source allows it"""
+        return memoryview(self.read(offset, nbytes))
+
+    def blocks(self, start=0, stop=None, blocksize=BLOCKSIZE):
+        """(position, memoryview) of about blocksize bytes from start, each ending after a newline.
+
+        Only lines starting before stop are wanted, the last block may end a little after it.
+        """
+        raise NotImplementedError
+
+
+class FileSource(ByteSource):
+    """Uncompressed file, read through mmap without copying"""
+
+    def __init__(self, filename):
+        ByteSource.__init__(self, filename)
+        self._mmap = None
+
+    def close(self):
+        self._mmap = None  # closed once the last view of it is released
+        ByteSource.close(self)
+
+    def read(self, offset, nbytes):
+        data = os.pread(self._fd, nbytes, offset)
+        METRICS.count("source_read_bytes", len(data))
+        return data
+
+    def view(self, offset, nbytes):
+        size = self.rawsize
+        end = min(offset + nbytes, size)
+        if end <= offset:
+            return memoryview(b"")
+        if self._mmap is None or len(self._mmap) < end:  # mapped again once the file has grown
+            self._mmap = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)[offset:end]
+
+    def blocks(self, start=0, stop=None, blocksize=BLOCKSIZE):
+        size = self.rawsize
+        if size <= start:
+            return
+        with mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                position = start
+                stop = size if stop is None else min(stop, size)
+                while position < stop:
+                    end = min(position + blocksize, stop)
+                    if end < size:
+                        cut = mm.rfind(b"\n", position, end)
+                        if cut < 0:  # one line longer than the block
+                            cut = mm.find(b"\n", end)
+                        end = size if cut < 0 else cut + 1
+                    with memoryview(data[position:end]) as block:
+                        yield position, block
+                    position = end
+            finally:
+                del data  # release the buffer before the mmap is closed
+
+
+class CompressedSource(ByteSource):
+    """Compressed file which is decompressed while it is read.
+
+    Every member, stream or frame of the file starts an independent checkpoint. Within
+    one, a snapshot of the decompressor is kept every spacing bytes of content if the
+    format allows copying it, so a read only inflates from the nearest checkpoint before
+    it. Checkpoints are recorded by whatever reads the file front to back first, usually
+    the index scan. Snapshots live in memory, their number is capped at MAXSNAPSHOTS by
+    doubling the spacing. The independent ones can be exported and restored.
+    """
+
+    compressed = True
+    snapshots = False  # whether the decompressor state can be copied
+    READSIZE = 256 * 1024
+    MAXSNAPSHOTS = 4096
+
+    def __init__(self, filename, spacing=4 * 1024 ** 2):
+        ByteSource.__init__(self, filename)
+        self.spacing = spacing
+        self._size = None
+        self._furthest = (0, 0)  # content and raw offset read up to
+        self._checkpoints = [(0, 0, None)]  # content offset, raw offset, decompressor snapshot or None
+        self._snapshots = 0
+        self._lock = threading.Lock()
+
+    def _new(self):
+        raise NotImplementedError
+
+    def _snapshot(self, decompressor):
+        """Copy of the state of decompressor, None if the format does not allow it"""
+        return None
+
+    @property
+    def size(self):
+        return self._size
+
+    def estimated_size(self):
+        """Content size, extrapolated from the ratio seen so far while it is not known"""
+        if self._size is not None:
+            return self._size
+        position, rawposition = self._furthest
+        if not rawposition:
+            return self.rawsize
+        return max(int(self.rawsize * position / rawposition), position)
+
+    def export_checkpoints(self):
+        """Content and raw offsets of the independent checkpoints as an array"""
+        with self._lock:
+            found = [(position, rawposition) for position, rawposition, state in self._checkpoints if state is None]
+        return np.array(found, dtype=np.uint64).reshape(-1, 2)
+
+    def restore_checkpoints(self, checkpoints, size=None):
+        with self._lock:
+            known = {position for position, _, _ in self._checkpoints}
+            for position, rawposition in checkpoints.tolist():
+                if position not in known:
+                    bisect.insort(self._checkpoints, (position, rawposition, None), key=lambda c: c[0])
+        if size is not None:
+            self._size = size
+
+    def _checkpoint(self, position, rawposition, state):
+        with self._lock:
+            n = bisect.bisect_right(self._checkpoints, position, key=lambda c: c[0])
+            if self._checkpoints[n - 1][0] == position:
+                return
+            if state is not None:
+                following = self._checkpoints[n][0] if n < len(self._checkpoints) else None
+                if position - self._checkpoints[n - 1][0] < self.spacing or \
+                        following is not None and following - position < self.spacing:
+                    return
+                self._snapshots += 1
+            self._checkpoints.insert(n, (position, rawposition, state))
+            if self._snapshots > self.MAXSNAPSHOTS:  # keep every other snapshot
+                self.spacing *= 2
+                keep, snapshots = [], 0
+                for checkpoint in self._checkpoints:
+                    if checkpoint[2] is not None:
+                        snapshots += 1
+                        if snapshots % 2:
+                            continue
+                    keep.append(checkpoint)
+                self._checkpoints = keep
+                self._snapshots = snapshots // 2
+
+    def stream(self, start=0):
+        """Content from start to the end in pieces, recording checkpoints on the way"""
+        with self._lock:
+            n = bisect.bisect_right(self._checkpoints, start, key=lambda c: c[0])
+            position, rawposition, state = self._checkpoints[n - 1]
+        decompressor = self._new() if state is None else state.copy()
+        skip = start - position
+        nextsnapshot = position + self.spacing
+
+        while True:
+            data = os.pread(self._fd, self.READSIZE, rawposition)
+            METRICS.count("source_read_bytes", len(data))
+            if not data:
+                self._size = position
+                return
+            rawposition += len(data)
+            while data:
+                try:
+                    out = decompressor.decompress(data)
+                except DECOMPRESS_ERRORS as e:
+                    if position and not data.strip(b"\0"):  # padding after the last member
+                        data = b""
+                        break
+                    raise OSError(f"{self.filename} is corrupt at byte {rawposition - len(data)}: {e}") from e
+                data = decompressor.unused_data if decompressor.eof else b""
+                position += len(out)
+                if position > self._furthest[0]:
+                    self._furthest = (position, rawposition)
+                if skip < len(out):
+                    yield out[skip:] if skip else out
+                    skip = 0
+                else:
+                    skip -= len(out)
+                if decompressor.eof:  # the next member starts a checkpoint of its own
+                    decompressor = self._new()
+                    self._checkpoint(position, rawposition - len(data), None)
+                    nextsnapshot = position + self.spacing
+                elif position >= nextsnapshot:
+                    snapshot = self._snapshot(decompressor)
+                    if snapshot is not None:
+                        self._checkpoint(position, rawposition, snapshot)
+                    nextsnapshot = position + self.spacing
+
+    def read(self, offset, nbytes):
+        out = bytearray()
+        with METRICS.timer("source_decompress_read"):
+            for piece in self.stream(offset):
+                out += piece[:nbytes - len(out)]
+                if len(out) >= nbytes:
+                    break
+        METRICS.count("source_decompressed_bytes", len(out))
+        return bytes(out)
+
+    def blocks(self, start=0, stop=None, blocksize=BLOCKSIZE):
+        pending = bytearray()
+        position = start
+        for piece in self.stream(start):
+            pending += piece
+            while True:
+                limit = blocksize if stop is None else min(blocksize, stop - position)
+                if len(pending) < max(limit, 1):
+                    break
+                cut = pending.rfind(b"\n", 0, limit)
+                if cut < 0:  # one line longer than the block
+                    cut = pending.find(b"\n", limit)
+                    if cut < 0:
+                        break
+                yield position, memoryview(bytes(pending[:cut + 1]))
+                del pending[:cut + 1]
+                position += cut + 1
+                if stop is not None and position >= stop:
+                    return
+        if pending and (stop is None or position < stop):
+            yield position, memoryview(bytes(pending))
+
+
+class GzipSource(CompressedSource):
+    """gzip, or any concatenation of gzip members like bgzip writes"""
+
+    snapshots = True
+
+    def _new(self):
+        return zlib.decompressobj(wbits=31)
+
+    def _snapshot(self, decompressor):
+        return decompressor.copy()
+
+
+class Bz2Source(CompressedSource):
+    """bzip2, checkpoints at the start of every stream as written by pbzip2"""
+
+    def _new(self):
+        return bz2.BZ2Decompressor()
+
+
+class ZstdSource(CompressedSource):
+    """Zstandard, checkpoints at the start of every frame as in the seekable format"""
+
+    def __init__(self, filename, spacing=4 * 1024 ** 2):
+        if zstandard is None:
+            raise ImportError(f"Reading {filename} needs the zstandard package.")
+        CompressedSource.__init__(self, filename, spacing)
+
+    def _new(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+class Transcoder:
+    """Decompressor look-alike which turns text in another encoding into utf-8"""
+
+    eof = False
+    unused_data = b""
+
+    def __init__(self, encoding, state=None):
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        if state is not None:
+            self._decoder.setstate(state)
+
+    def decompress(self, data):
+        return self._decoder.decode(data).encode("utf-8")
+
+    def copy(self):
+        return Transcoder(self.encoding, self._decoder.getstate())
+
+
+class TranscodedSource(CompressedSource):
+    """utf-16 or utf-32 text, served as utf-8 so that every newline is the single byte the scanners look for.
+
+    Content offsets are those of the utf-8 text, the transcoder is snapshotted like a decompressor.
+    """
+
+    snapshots = True
+
+    def __init__(self, filename, encoding, spacing=4 * 1024 ** 2):
+        CompressedSource.__init__(self, filename, spacing)
+        self.fileencoding = encoding
+
+    def _new(self):
+        return Transcoder(self.fileencoding)
+
+    def _snapshot(self, decompressor):
+        return decompressor.copy()
+
+
+def detect_encoding(head):
+    """Encoding of text starting with the bytes head, from its byte order mark or else its content"""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if len(head) >= 4:  # ascii text in utf-16 has a zero in every other byte
+        even, odd = head[0::2].count(0), head[1::2].count(0)
+        if odd > len(head) // 6 and even < odd // 10:
+            return "utf-16-le"
+        if even > len(head) // 6 and odd < even // 10:
+            return "utf-16-be"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head)  # a character cut off at the end is fine
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        head.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def without_bom(encoding):
+    """Encoding to turn text into bytes of the content with, utf-8-sig would put its mark in front"""
+    return "utf-8" if codecs.lookup(encoding).name == "utf-8-sig" else encoding
+
+
+def open_source(filename, encoding=None):
+    """ByteSource for filename, compressed files are recognized by their first bytes.
+
+    The encoding is detected from the start of the content unless given. utf-16 and utf-32
+    files are transcoded to utf-8, which then is the encoding of the source.
+    """
+    if isinstance(filename, ByteSource):
+        return filename
+    with open(filename, "rb") as myfile:
+        magic = myfile.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        source = GzipSource(filename)
+    elif magic.startswith(BZ2_MAGIC):
+        source = Bz2Source(filename)
+    elif magic.startswith(ZSTD_MAGIC):
+        source = ZstdSource(filename)
+    else:
+        source = FileSource(filename)
+    if encoding is None:
+        encoding = detect_encoding(source.read(0, 64 * 1024))
+    if encoding.lower() in WIDE_ENCODINGS:
+        if source.compressed:
+            logger.warning(f"{filename} is compressed {encoding} text, which is read as utf-8.")
+            return source
+        source.close()
+        source = TranscodedSource(filename, encoding)
+        logger.debug(f"{filename} is {encoding}, transcoded to utf-8.")
+        return source
+    source.encoding = encoding
+    return source
@@ -0,0 +1,131 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from jobs import LOW
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkCache:
+    """Blocks of chunksize bytes of any number of files, kept in memory up to budget bytes.
+
+    Blocks are keyed by (file identity, offset), so reopening an unchanged file finds its
+    blocks again, and the least recently used block goes first once the budget is exceeded.
+    Given a JobScheduler, every read also has the neighbouring blocks fetched in the
+    background, ahead more of them in the direction the reads are moving, so paging
+    through a file on a slow disk or share is served from memory.
+    """
+
+    def __init__(self, budget=64 * 1024 ** 2, chunksize=1024 ** 2, ahead=2, scheduler=None):
+        self.budget = budget
+        self.chunksize = chunksize
+        self.ahead = ahead  # blocks fetched ahead in the direction of travel
+        self.scheduler = scheduler
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._size = 0
+        self._pending = set()  # keys of the blocks being prefetched
+        self._travel = {}  # identity: offset of the last block read and direction
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __repr__(self):
+        return f"<ChunkCache {len(self)} blocks, {self._size} of {self.budget} bytes>"
+
+    @property
+    def nbytes(self):
+        return self._size
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._travel.clear()
+            self._size = 0
+
+    def discard(self, identity):
+        """Forget the blocks of one file"""
+        with self._lock:
+            for key in [key for key in self._blocks if key[0] == identity]:
+                self._size -= len(self._blocks.pop(key))
+            self._travel.pop(identity, None)
+
+    def _put(self, key, block):
+        with self._lock:
+            previous = self._blocks.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._blocks[key] = block
+            self._size += len(block)
+            while self._size > self.budget and len(self._blocks) > 1:
+                _, evicted = self._blocks.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _block(self, source, offset):
+        key = (source.identity, offset)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return block
+            self.misses += 1
+        with METRICS.timer("chunkcache_miss_read"):
+            block = source.read(offset, self.chunksize)
+        self._put(key, block)
+        return block
+
+    def view(self, source, offset, nbytes):
+        """memoryview of up to nbytes from offset of a ByteSource, like source.view"""
+        first = offset - offset % self.chunksize
+        end = offset + nbytes
+        pieces = []
+        position = first
+        while position < end:
+            block = self._block(source, position)
+            if len(block) < self.chunksize and not source.compressed and position + len(block) < end and \
+                    position + len(block) < source.size:  # read before the file grew
+                block = source.read(position, self.chunksize)
+                self._put((source.identity, position), block)
+            pieces.append(block)
+            if len(block) < self.chunksize:
+                break
+            position += self.chunksize
+        self._prefetch(source, first, first + (len(pieces) - 1) * self.chunksize)
+        data = pieces[0] if len(pieces) == 1 else b"".join(pieces)
+        return memoryview(data)[offset - first:end - first]
+
+    def _prefetch(self, source, first, last):
+        """Queue the blocks around first to last which are not cached yet"""
+        if self.scheduler is None:
+            return
+        identity = source.identity
+        with self._lock:
+            previous, direction = self._travel.get(identity, (first, 1))
+            if first != previous:
+                direction = 1 if first > previous else -1
+            self._travel[identity] = (first, direction)
+        edge = last if direction > 0 else first
+        wanted = [first - self.chunksize, last + self.chunksize] + \
+            [edge + direction * n * self.chunksize for n in range(2, self.ahead + 1)]
+        size = source.estimated_size()
+        for offset in wanted:
+            key = (identity, offset)
+            with self._lock:
+                if offset < 0 or size is not None and offset >= size or key in self._blocks or key in self._pending:
+                    continue
+                self._pending.add(key)
+            self.scheduler.submit(self._fetch, source, key, priority=LOW, name="Prefetch", group=source.filename)
+
+    def _fetch(self, job, source, key):
+        try:
+            job.token.check()
+            if key not in self._blocks:
+                self._put(key, source.read(key[1], self.chunksize))
+        finally:
+            with self._lock:
+                self._pending.discard(key)
@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow files need pyarrow
+    pa = pc = pq = None
+
+logger = logging.getLogger(__name__)
+
+PARQUET_MAGIC = b"PAR1"
+ARROW_MAGIC = b"ARROW1"
+
+
+class ColumnarFile:
+    """Rows of a columnar file, read one row group and one column at a time.
+
+    Row counts come from the metadata, nothing is read to open the file. The most recently
+    used maxgroups column chunks are kept as Arrow arrays, values are only converted to
+    Python for the rows asked for. Reads are serialized, jobs and the GUI can share a file.
+    """
+
+    def __init__(self, filename, maxgroups=32):
+        if pa is None:
+            raise ImportError(f"Reading {filename} needs the pyarrow package.")
+        self.filename = os.fspath(filename)
+        self.maxgroups = maxgroups
+        self._groups = OrderedDict()
+        self._lock = threading.RLock()
+        self._open()
+        self.columns = list(self.schema.names)
+        self.starts = np.concatenate(([0], np.cumsum(self._grouprows(), dtype=np.int64)))
+        self.num_rows = int(self.starts[-1])
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.num_rows} rows, {len(self.columns)} columns>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _grouprows(self):
+        """Rows in each row group"""
+        raise NotImplementedError
+
+    def _read(self, group, column):
+        """One column of one row group as an Arrow array"""
+        raise NotImplementedError
+
+    def close(self):
+        self._groups.clear()
+
+    @property
+    def dtypes(self):
+        """int64, float64 or str per column, as inferred for delimited files"""
+        dtypes = []
+        for field in self.schema:
+            if pa.types.is_integer(field.type):
+                dtypes.append("int64")
+            elif pa.types.is_floating(field.type) or pa.types.is_decimal(field.type):
+                dtypes.append("float64")
+            else:
+                dtypes.append("str")
+        return dtypes
+
+    @property
+    def groups(self):
+        return len(self.starts) - 1
+
+    def group(self, group, column):
+        key = (group, column)
+        with self._lock:
+            array = self._groups.get(key)
+            if array is None:
+                array = self._read(group, column)
+                self._groups[key] = array
+                if len(self._groups) > self.maxgroups:
+                    self._groups.popitem(last=False)
+            else:
+                self._groups.move_to_end(key)
+        return array
+
+    def slice(self, column, start, nrows):
+        """Values of column in the rows start to start + nrows"""
+        stop = min(start + nrows, self.num_rows)
+        values = []
+        group = int(np.searchsorted(self.starts, start, side="right")) - 1
+        while start < stop:
+            first = start - int(self.starts[group])
+            count = min(stop, int(self.starts[group + 1])) - start
+            values.extend(self.group(group, column).slice(first, count).to_pylist())
+            start += count
+            group += 1
+        return values
+
+    def take(self, column, rows):
+        """Values of column in the given rows, in that order"""
+        rows = np.asarray(rows, dtype=np.int64)
+        values = [None] * len(rows)
+        groups = np.searchsorted(self.starts, rows, side="right") - 1
+        for group in np.unique(groups).tolist():
+            positions = np.flatnonzero(groups == group)
+            taken = self.group(group, column).take(pa.array(rows[positions] - self.starts[group]))
+            for position, value in zip(positions.tolist(), taken.to_pylist()):
+                values[position] = value
+        return values
+
+    def rows(self, start, nrows):
+        """Values of every column in the rows start to start + nrows, row by row"""
+        columns = [self.slice(column, start, nrows) for column in range(len(self.columns))]
+        return list(zip(*columns))
+
+    def search(self, pattern, regex=False, ignorecase=False, token=None):
+        """Yield, a row group at a time, the numbers of the rows with a value matching pattern"""
+        match = pc.match_substring_regex if regex else pc.match_substring
+        for group in range(self.groups):
+            found = None
+            for column in range(len(self.columns)):
+                if token is not None:
+                    token.check()
+                with self._lock:  # around the cache, so the rows on screen stay in it
+                    array = self._read(group, column)
+                if not pa.types.is_string(array.type) and not pa.types.is_large_string(array.type):
+                    try:
+                        array = pc.cast(array, pa.string())
+                    except pa.ArrowNotImplementedError:
+                        continue
+                matched = pc.fill_null(match(array, pattern, ignore_case=ignorecase), False)
+                found = matched if found is None else pc.or_(found, matched)
+            if found is not None:
+                yield np.flatnonzero(found.to_numpy(zero_copy_only=False)).astype(np.uint64) + \
+                    np.uint64(self.starts[group])
+
+    def sort_indices(self, column, token=None):
+        """Row numbers in the order of the values of column, nulls last"""
+        chunks = []
+        for group in range(self.groups):
+            if token is not None:
+                token.check()
+            with self._lock:  # around the cache, the whole column is needed once
+                chunks.append(self._read(group, column))
+        if not chunks:
+            return np.zeros(0, dtype=np.uint64)
+        values = pa.chunked_array(chunks)
+        return pc.array_sort_indices(values, null_placement="at_end").to_numpy().astype(np.uint64)
+
+
+class ParquetFile(ColumnarFile):
+    """Parquet file, a row group of a column is the unit of reading"""
+
+    def _open(self):
+        self._file = pq.ParquetFile(self.filename, memory_map=True)
+        self.schema = self._file.schema_arrow
+
+    def _grouprows(self):
+        metadata = self._file.metadata
+        return [metadata.row_group(n).num_rows for n in range(metadata.num_row_groups)]
+
+    def _read(self, group, column):
+        table = self._file.read_row_group(group, columns=[self.columns[column]], use_threads=False)
+        return table.column(0).combine_chunks()
+
+    def close(self):
+        ColumnarFile.close(self)
+        self._file.close()
+
+
+class ArrowFile(ColumnarFile):
+    """Arrow IPC file, which Feather version 2 is, memory mapped so that a record batch costs nothing to read"""
+
+    def _open(self):
+        self._source = pa.memory_map(self.filename)
+        self._file = pa.ipc.open_file(self._source)
+        self.schema = self._file.schema
+
+    def _grouprows(self):
+        return [self._file.get_batch(n).num_rows for n in range(self._file.num_record_batches)]
+
+    def _read(self, group, column):
+        return self._file.get_batch(group).column(column)
+
+    def close(self):
+        ColumnarFile.close(self)
+        self._source.close()
+
+
+class ColumnarError(ValueError):
+    """A file which starts like a columnar file but cannot be read as one"""
+
+
+def open_columnar(filename):
+    """ColumnarFile for filename, picked by its first bytes and not its name, None for any other file.
+
+    Raises ColumnarError if pyarrow is missing or cannot read the file.
+    """
+    with open(filename, "rb") as myfile:
+        magic = myfile.read(6)
+    if magic.startswith(PARQUET_MAGIC):
+        cls = ParquetFile
+    elif magic == ARROW_MAGIC:
+        cls = ArrowFile
+    else:
+        return None
+    try:
+        return cls(filename)
+    except ImportError as e:
+        raise ColumnarError(str(e)) from e
+    except pa.ArrowException as e:  # pyarrow is there, ColumnarFile checks it first
+        raise ColumnarError(f"{filename} is not a readable {cls.__name__}. {e}") from e
@@ -0,0 +1,393 @@
+import bisect
+import difflib
+import hashlib
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from grep import split_ranges
+from lineindex import LineScanner
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+NEWLINE = ord("\n")
+BLOCKLINES = 1024  # average lines per block
+SPACING = 16 * 1024 ** 2  # a block ends at least every so many bytes
+MAXLINES = 100_000  # lines of both files in a changed region beyond which it is not diffed line by line
+WIDTH = 8  # bytes taken from the start, middle and end of a line for its cut hash
+MULTIPLIERS = np.random.default_rng(0x6469).integers(0, 2 ** 64 - 1, size=3 * WIDTH + 2, dtype=np.uint64,
+                                                     endpoint=True) | np.uint64(1)
+
+
+def block_cuts(data, position, newlines, blocklines=BLOCKLINES, spacing=SPACING):
+    """Indices into newlines of the lines which end a block of lines.
+
+    A line ends a block when a hash of its length and of bytes at its start, middle and
+    end is a multiple of blocklines. Blocks so are about blocklines lines long and cut
+    by content alone, lines inserted into a file only change the block they land in.
+    data starts at byte position of the file, on a line. Where lines are too alike to
+    be told apart that way the line holding every spacing-th byte of the file ends a block too.
+    """
+    if not len(newlines):
+        return np.zeros(0, dtype=np.int64)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = newlines.astype(np.int64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    middles = starts + (ends - starts) // 2
+    mixed = (ends - starts).astype(np.uint64) * MULTIPLIERS[0]
+    for k in range(WIDTH):
+        mixed += raw[np.minimum(starts + k, ends)] * MULTIPLIERS[1 + k]
+        mixed += raw[np.minimum(middles + k, ends)] * MULTIPLIERS[1 + WIDTH + k]
+        mixed += raw[np.maximum(ends - 1 - k, starts)] * MULTIPLIERS[1 + 2 * WIDTH + k]
+    del raw
+    mixed ^= mixed >> np.uint64(29)
+    mixed *= MULTIPLIERS[-1]
+    cuts = np.flatnonzero((mixed >> np.uint64(32)) % np.uint64(blocklines) == 0)
+    marks = np.arange(-(-position // spacing) * spacing, position + len(data), spacing) - position
+    forced = np.searchsorted(ends, marks)
+    return np.union1d(cuts, forced[forced < len(ends)])
+
+
+class BlockHasher:
+    """LineScanner consumer hashing the blocks of lines block_cuts cuts the file into.
+
+    ends holds the number of the line after each block, offsets the byte offset after it.
+    A block still open at the end of a chunk is continued in the next one.
+    """
+
+    def __init__(self, blocklines=BLOCKLINES, spacing=SPACING):
+        self.blocklines = blocklines
+        self.spacing = spacing
+        self.ends = []
+        self.offsets = []
+        self.hashes = []
+        self._pending = None
+
+    def _digest(self, data):
+        if self._pending is None:
+            digest = hashlib.blake2b(data, digest_size=8).digest()
+        else:
+            self._pending.update(data)
+            digest, self._pending = self._pending.digest(), None
+        return int.from_bytes(digest, "little")
+
+    def feed(self, chunk, position, firstline, newlines):
+        last = 0
+        for n in block_cuts(chunk, position, newlines, self.blocklines, self.spacing).tolist():
+            end = int(newlines[n]) + 1
+            self.hashes.append(self._digest(chunk[last:end]))
+            self.ends.append(firstline + n + 1)
+            self.offsets.append(position + end)
+            last = end
+        if last < len(chunk):
+            if self._pending is None:
+                self._pending = hashlib.blake2b(digest_size=8)
+            self._pending.update(chunk[last:])
+
+    def finish(self, linecount, size):
+        """Block ends and hashes, as arrays, with the last block which ended at the end of the file"""
+        if self._pending is not None:
+            self.hashes.append(self._digest(b""))
+            self.ends.append(linecount)
+            self.offsets.append(size)
+        return np.array(self.ends, dtype=np.uint64), np.array(self.hashes, dtype=np.uint64)
+
+
+def hash_range(filename, start, end, blocklines, spacing):
+    """Blocks ending in start:end of a file: their end offsets, their end lines counted from start, their hashes.
+
+    The hash of the first block is only right when the range before ended on a block. The
+    newline count of the range comes last.
+    """
+    with open(filename, "rb") as myfile, mmap.mmap(myfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with memoryview(mm)[start:end] as data:
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == NEWLINE)
+            hasher = BlockHasher(blocklines, spacing)
+            hasher.feed(data, start, 0, newlines)
+            hasher._pending = None
+    return hasher.offsets, hasher.ends, hasher.hashes, len(newlines)
+
+
+def _hash_bytes(fd, start, end, readsize=16 * 1024 ** 2):
+    digest = hashlib.blake2b(digest_size=8)
+    while start < end:
+        data = os.pread(fd, min(readsize, end - start), start)
+        if not data:
+            break
+        digest.update(data)
+        start += len(data)
+    return int.from_bytes(digest.digest(), "little")
+
+
+@METRICS.timed("block_hashes")
+def block_hashes(large, blocklines=BLOCKLINES, spacing=SPACING, workers=None, rangesize=64 * 1024 ** 2,
+                 token=None, progress=None):
+    """Line numbers after every block of lines of a LargeFile and the hashes of the blocks.
+
+    Ranges of a plain file are hashed by a pool of processes, blocks crossing from one
+    range into the next are hashed again once both are done. Compressed files are read
+    in a single pass. The hashes are kept in the index cache.
+    """
+    name = f"blocks-{blocklines}-{spacing}"
+    cached = large.cache.load_array(name)
+    if cached is not None:
+        return np.array(cached[0]), np.array(cached[1])
+    index = large.index()
+    linecount, size = len(index), int(index[len(index)])
+    source = large.source
+    if source.compressed:
+        hasher = BlockHasher(blocklines, spacing)
+        LineScanner(source, consumers=[hasher], token=token, progress=progress).run()
+        ends, hashes = hasher.finish(linecount, size)
+    else:
+        ends, hashes = _hash_ranges(source.filename, split_ranges(source.filename, rangesize), size, linecount,
+                                    blocklines, spacing, workers, token, progress)
+    try:
+        large.cache.save_array(name, np.stack([ends, hashes]))
+    except OSError as e:
+        logger.warning(f"Could not save block hashes. {e}")
+    return ends, hashes
+
+
+def _hash_ranges(filename, ranges, size, linecount, blocklines, spacing, workers, token, progress):
+    ends, hashes = [], []
+    carry, firstline = 0, 0  # byte offset the open block starts at, line number the range starts at
+    results = _range_results(filename, ranges, blocklines, spacing, workers)
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        for (start, end), (offsets, lines, digests, newlines) in zip(ranges, results):
+            if token is not None:
+                token.check()
+            if offsets:
+                if carry < start:
+                    digests[0] = _hash_bytes(fd, carry, offsets[0])
+                ends += [firstline + line for line in lines]
+                hashes += digests
+                carry = offsets[-1]
+            firstline += newlines
+            if progress is not None:
+                progress(end, size)
+        if carry < size:
+            ends.append(linecount)
+            hashes.append(_hash_bytes(fd, carry, size))
+    finally:
+        results.close()  # cancels the ranges not hashed yet
+        os.close(fd)
+    return np.array(ends, dtype=np.uint64), np.array(hashes, dtype=np.uint64)
+
+
+def _range_results(filename, ranges, blocklines, spacing, workers):
+    """Yield what hash_range gives for each range, in order"""
+    if len(ranges) == 1:  # not worth starting processes
+        yield hash_range(filename, *ranges[0], blocklines, spacing)
+        return
+    if not ranges:
+        return
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(ranges))) as pool:
+        futures = [pool.submit(hash_range, filename, start, end, blocklines, spacing) for start, end in ranges]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _longest_chain(values):
+    """Positions of the longest strictly increasing subsequence of values"""
+    tails, tailpositions, previous = [], [], [-1] * len(values)
+    for position, value in enumerate(values):
+        n = bisect.bisect_left(tails, value)
+        if n:
+            previous[position] = tailpositions[n - 1]
+        if n == len(tails):
+            tails.append(value)
+            tailpositions.append(position)
+        else:
+            tails[n] = value
+            tailpositions[n] = position
+    chain = []
+    position = tailpositions[-1] if tailpositions else -1
+    while position >= 0:
+        chain.append(position)
+        position = previous[position]
+    return chain[::-1]
+
+
+def match_blocks(a, b):
+    """Runs (i, j, n) of equal blocks, a[i:i + n] == b[j:j + n], in order in both sequences of hashes.
+
+    Like patience diff, blocks occurring once in each are paired up and the longest chain
+    of pairs in the same order in both anchors the runs, which grow over equal neighbours.
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    ua, ia, ca = np.unique(a, return_index=True, return_counts=True)
+    ub, ib, cb = np.unique(b, return_index=True, return_counts=True)
+    _, xa, xb = np.intersect1d(ua[ca == 1], ub[cb == 1], assume_unique=True, return_indices=True)
+    pairs = sorted(zip(ia[ca == 1][xa].tolist(), ib[cb == 1][xb].tolist()))
+    anchors = [pairs[n] for n in _longest_chain([j for _, j in pairs])]
+
+    a, b = a.tolist(), b.tolist()
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    runs = [(0, 0, prefix)] if prefix else []
+    i0 = j0 = prefix  # end of the last run
+    for i, j in anchors + [(len(a), len(b))]:
+        if i < i0 or j < j0:  # taken in by the run before
+            continue
+        back = 0
+        while i - back > i0 and j - back > j0 and a[i - back - 1] == b[j - back - 1]:
+            back += 1
+        ahead = 0
+        while i + ahead < len(a) and j + ahead < len(b) and a[i + ahead] == b[j + ahead]:
+            ahead += 1
+        if back + ahead:
+            runs.append((i - back, j - back, back + ahead))
+        i0, j0 = i + ahead, j + ahead
+    return runs
+
+
+def changed_regions(ends_a, ends_b, runs):
+    """Line ranges (a1, a2, b1, b2) of the files between the runs of equal blocks"""
+    starts_a = np.concatenate(([0], ends_a)).astype(np.int64).tolist()
+    starts_b = np.concatenate(([0], ends_b)).astype(np.int64).tolist()
+    regions = []
+    i = j = 0
+    for ri, rj, n in runs + [(len(ends_a), len(ends_b), 0)]:
+        if ri > i or rj > j:
+            regions.append((starts_a[i], starts_a[ri], starts_b[j], starts_b[rj]))
+        i, j = ri + n, rj + n
+    return regions
+
+
+def diff_region(fetch_a, fetch_b, a1, a2, b1, b2):
+    """difflib opcodes, without the equal ones, of the lines a1:a2 and b1:b2 of two files"""
+    lines_a = fetch_a(a1, a2 - a1) if a2 > a1 else []
+    lines_b = fetch_b(b1, b2 - b1) if b2 > b1 else []
+    matcher = difflib.SequenceMatcher(None, lines_a, lines_b)
+    return [(tag, a1 + i1, a1 + i2, b1 + j1, b1 + j2)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def _unified_range(start, stop):
+    """Lines start:stop as a unified diff counts them, from 1 and an empty range by the line before"""
+    if stop - start == 1:
+        return str(start + 1)
+    return f"{start + (stop > start)},{stop - start}"
+
+
+class _Changed:
+    """The lines of one side of a FileDiff which differ, for LineView marks"""
+
+    def __init__(self, starts, stops):
+        keep = stops > starts
+        self.starts = starts[keep]
+        self.stops = stops[keep]
+
+    def __contains__(self, line):
+        n = int(np.searchsorted(self.starts, line, side="right")) - 1
+        return n >= 0 and line < self.stops[n]
+
+
+class FileDiff:
+    """Differences between two files, as difflib opcodes without the equal ones.
+
+    Each hunk is (tag, a1, a2, b1, b2): lines a1:a2 of the first file are replaced by, or
+    deleted for, or lines b1:b2 of the second inserted. Hunks are in the order of both
+    files. coarse counts changed regions too large to diff line by line, they are single
+    replace hunks.
+    """
+
+    def __init__(self, hunks, linecounts, coarse=0):
+        self.tags = [hunk[0] for hunk in hunks]
+        self.ranges = np.array([hunk[1:] for hunk in hunks], dtype=np.int64).reshape(-1, 4)
+        self.linecounts = linecounts
+        self.coarse = coarse
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, n):
+        return (self.tags[n],) + tuple(self.ranges[n].tolist())
+
+    def __iter__(self):
+        for tag, ranges in zip(self.tags, self.ranges.tolist()):
+            yield (tag,) + tuple(ranges)
+
+    def __repr__(self):
+        return f"<FileDiff {len(self)} hunks, {self.linecounts[0]} and {self.linecounts[1]} lines>"
+
+    def summary(self):
+        return {"hunks": len(self), "deleted": int((self.ranges[:, 1] - self.ranges[:, 0]).sum()),
+                "inserted": int((self.ranges[:, 3] - self.ranges[:, 2]).sum()), "coarse": self.coarse}
+
+    def changed(self, side):
+        """The changed lines of the first (0) or second (1) file, supporting in"""
+        return _Changed(self.ranges[:, 2 * side], self.ranges[:, 2 * side + 1])
+
+    def counterpart(self, line, side=0):
+        """Line of the other file to show next to line of file side"""
+        starts = self.ranges[:, 2 * side]
+        n = int(np.searchsorted(starts, line, side="right")) - 1
+        if n < 0:
+            return line
+        s1, s2 = self.ranges[n, 2 * side:2 * side + 2].tolist()
+        o1, o2 = self.ranges[n, 2 - 2 * side:4 - 2 * side].tolist()
+        if line < s2:
+            return o1 + min(line - s1, max(o2 - o1 - 1, 0))
+        return o2 + line - s2
+
+    def next_hunk(self, line, side=0):
+        """Number of the first hunk starting after line of file side, None after the last"""
+        n = int(np.searchsorted(self.ranges[:, 2 * side], line, side="right"))
+        return n if n < len(self) else None
+
+    def previous_hunk(self, line, side=0):
+        """Number of the last hunk starting before line of file side, None before the first"""
+        n = int(np.searchsorted(self.ranges[:, 2 * side], line, side="left")) - 1
+        return n if n >= 0 else None
+
+    def unified(self, fetch_a, fetch_b, piece=4096):
+        """Yield the lines of the differences in unified diff format without context, lines counted from 1"""
+        for tag, a1, a2, b1, b2 in self:
+            yield f"@@ -{_unified_range(a1, a2)} +{_unified_range(b1, b2)} @@"
+            for prefix, fetch, start, stop in (("-", fetch_a, a1, a2), ("+", fetch_b, b1, b2)):
+                for position in range(start, stop, piece):
+                    for line in fetch(position, min(piece, stop - position)):
+                        yield prefix + line
+
+
+@METRICS.timed("diff_files")
+def diff_files(a, b, blocklines=BLOCKLINES, maxlines=MAXLINES, workers=None, token=None, progress=None):
+    """FileDiff of two LargeFiles, in time linear in their size plus what their changed regions cost.
+
+    Both files are cut into blocks of lines whose hashes are matched up, see match_blocks.
+    Only the regions between equal blocks are read and diffed line by line, regions of
+    more than maxlines lines are taken as replaced as a whole.
+    """
+    sizes = [a.source.estimated_size(), b.source.estimated_size()]
+    hashed = []
+    for n, large in enumerate((a, b)):
+        step = None
+        if progress is not None:
+            step = lambda done, total, offset=sum(sizes[:n]): progress(offset + done, sum(sizes))
+        hashed.append(block_hashes(large, blocklines, workers=workers, token=token, progress=step))
+    (ends_a, hashes_a), (ends_b, hashes_b) = hashed
+    runs = match_blocks(hashes_a, hashes_b)
+
+    hunks, coarse = [], 0
+    for a1, a2, b1, b2 in changed_regions(ends_a, ends_b, runs):
+        if token is not None:
+            token.check()
+        if a2 - a1 + b2 - b1 > maxlines:
+            hunks.append(("replace" if a2 > a1 and b2 > b1 else "delete" if a2 > a1 else "insert", a1, a2, b1, b2))
+            coarse += 1
+        else:
+            hunks += diff_region(a.lines, b.lines, a1, a2, b1, b2)
+    logger.debug(f"{len(hashes_a)} and {len(hashes_b)} blocks, {len(runs)} equal runs, {len(hunks)} hunks")
+    return FileDiff(hunks, (len(a.index()), len(b.index())), coarse)
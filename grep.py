@@ -0,0 +1,174 @@
+import logging
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bytesource import ByteSource, without_bom
+from jobs import CancelToken
+
+logger = logging.getLogger(__name__)
+
+NEWLINE = ord("\n")
+
+
+def split_ranges(filename, rangesize):
+    """Byte ranges of about rangesize bytes covering the file, each ending after a newline"""
+    ranges = []
+    with open(filename, "rb") as myfile:
+        size = os.fstat(myfile.fileno()).st_size
+        if size == 0:
+            return ranges
+        with mmap.mmap(myfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = mm.find(b"\n", min(start + rangesize, size) - 1)
+                end = size if end < 0 else end + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def find_lines(buffer, start, end, pattern, regex, ignorecase, encoding="utf-8"):
+    """Lines in buffer[start:end] matching pattern, relative to the first line of the range, and the newline count.
+
+    A plain pattern is looked for in the bytes. A regex, or ignoring case, needs the text:
+    the range is decoded, which it can be as it starts and ends at line boundaries, and
+    its CRLF line ends made LF so that $ matches at the end of those lines too.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8, count=end - start, offset=start)
+    newlines = np.flatnonzero(data == NEWLINE)
+    del data
+
+    if regex or ignorecase:
+        lines = _find_text_lines(buffer, start, end, pattern, regex, ignorecase, encoding)
+        return np.array(lines, dtype=np.uint64), len(newlines)
+
+    if isinstance(pattern, str):
+        pattern = pattern.encode(without_bom(encoding))
+    positions = []
+    position = buffer.find(pattern, start, end)
+    while position >= 0:
+        positions.append(position)
+        nextline = buffer.find(b"\n", position, end)
+        if nextline < 0:
+            break
+        position = buffer.find(pattern, nextline + 1, end)
+
+    lines = np.searchsorted(newlines, np.array(positions, dtype=np.int64) - start)
+    return np.unique(lines).astype(np.uint64), len(newlines)
+
+
+def _find_text_lines(buffer, start, end, pattern, regex, ignorecase, encoding):
+    if isinstance(pattern, bytes):
+        pattern = pattern.decode(encoding)
+    text = bytes(buffer[start:end]).decode(encoding, errors="replace")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").removesuffix("\r")
+    flags = (re.IGNORECASE if ignorecase else 0) | re.MULTILINE
+    if text.isascii() and pattern.isascii():  # matches the same and much faster, \b and \w above all
+        flags |= re.ASCII
+    compiled = re.compile(pattern if regex else re.escape(pattern), flags)
+    lines = []
+    line, counted = 0, 0
+    position = 0
+    while True:
+        match = compiled.search(text, position)
+        if match is None:
+            break
+        line += text.count("\n", counted, match.start())
+        lines.append(line)
+        # one hit per line is enough, carry on at the next line
+        position = text.find("\n", match.start())
+        if position < 0:
+            break
+        position += 1
+        counted = match.start()
+    return lines
+
+
+def scan_range(filename, start, end, pattern, regex, ignorecase, encoding="utf-8"):
+    """Lines in start:end of a file matching pattern, relative to the first line of the range, and the newline count"""
+    with open(filename, "rb") as myfile, mmap.mmap(myfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return find_lines(mm, start, end, pattern, regex, ignorecase, encoding)
+
+
+class ParallelGrep:
+    """Search a file with a pool of processes without any index.
+
+    The file is cut into ranges of rangesize bytes on line boundaries, which are scanned
+    in parallel. Iterating yields, in file order, an array of the matching line numbers
+    of each range as soon as it and all ranges before it are done. cancel, or cancelling
+    token, stops the iteration after the range in progress.
+    filename may also be a ByteSource, a compressed one is decompressed and searched in one pass.
+    """
+
+    def __init__(self, filename, pattern, regex=False, ignorecase=False, workers=None,
+                 rangesize=64 * 1024 ** 2, encoding="utf-8", token=None, progress=None):
+        self.filename = filename
+        self.pattern = pattern.encode(without_bom(encoding)) if isinstance(pattern, str) else pattern
+        self.regex = regex
+        self.ignorecase = ignorecase
+        self.encoding = encoding
+        self.workers = workers or os.cpu_count()
+        self.rangesize = rangesize
+        self.token = token or CancelToken()
+        self.progress = progress  # progress(done, total) in bytes after every range
+
+    def cancel(self):
+        self.token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def _decompressed(self):
+        """Search the blocks of a compressed source one after the other"""
+        firstline = 0
+        for position, block in self.filename.blocks(blocksize=self.rangesize):
+            if self.cancelled:
+                break
+            block = bytes(block)
+            lines, newlines = find_lines(block, 0, len(block), self.pattern, self.regex, self.ignorecase,
+                                         self.encoding)
+            yield lines + np.uint64(firstline)
+            firstline += newlines
+            if self.progress is not None:
+                self.progress(position + len(block), self.filename.estimated_size())
+
+    def __iter__(self):
+        filename = self.filename
+        if isinstance(filename, ByteSource):
+            if filename.compressed:
+                yield from self._decompressed()
+                return
+            filename = filename.filename
+        ranges = split_ranges(filename, self.rangesize)
+        if not ranges:
+            return
+        logger.debug(f"Searching {len(ranges)} ranges with {self.workers} processes")
+        if len(ranges) == 1:  # not worth starting processes
+            lines, _ = scan_range(filename, *ranges[0], self.pattern, self.regex, self.ignorecase, self.encoding)
+            yield lines
+            if self.progress is not None:
+                self.progress(ranges[0][1], ranges[0][1])
+            return
+
+        firstline = 0
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges))) as pool:
+            futures = [pool.submit(scan_range, filename, start, end, self.pattern, self.regex,
+                                   self.ignorecase, self.encoding) for start, end in ranges]
+            try:
+                for future, (_, end) in zip(futures, ranges):
+                    if self.cancelled:
+                        break
+                    lines, newlines = future.result()
+                    yield lines + np.uint64(firstline)
+                    firstline += newlines
+                    if self.progress is not None:
+                        self.progress(end, ranges[-1][1])
+            finally:
+                for future in futures:
+                    future.cancel()
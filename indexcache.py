@@ -0,0 +1,198 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from lineindex import LineIndex
+from searchindex import InvertedIndex
+
+logger = logging.getLogger(__name__)
+
+DIALECT_ATTRS = ("delimiter", "quotechar", "escapechar", "doublequote", "skipinitialspace",
+                 "lineterminator", "quoting")
+
+
+def default_cachedir():
+    """Directory holding the index of every file opened so far"""
+    if os.environ.get("LFV_CACHE_DIR"):
+        return Path(os.environ["LFV_CACHE_DIR"])
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "largefileviewer"
+
+
+def dialect_to_dict(dialect):
+    if dialect is None:
+        return None
+    return {attr: getattr(dialect, attr) for attr in DIALECT_ATTRS}
+
+
+def dialect_from_dict(attrs):
+    if attrs is None:
+        return None
+    return type("cached", (csv.Dialect,), dict(attrs))
+
+
+class IndexCache:
+    """Persist the index of a file so that reopening an unchanged file skips the scan.
+
+    Each file gets its own entry in the cache directory, named after the hash of its path.
+    An entry is only used while size, mtime and a hash of the head and tail of the file
+    still match, any change to the file makes it stale. Taking that fingerprint reads the
+    file, the methods accept one taken already so that a load or save takes it once.
+    """
+
+    VERSION = 7
+    SAMPLE = 64 * 1024
+
+    def __init__(self, filename, cachedir=None):
+        self.filename = os.path.abspath(filename)
+        self.cachedir = Path(cachedir) if cachedir else default_cachedir()
+        self.entry = self.cachedir / hashlib.sha1(self.filename.encode("utf-8")).hexdigest()
+
+    def builddir(self):
+        """Scratch directory to build parts of the index in, save moves them into the entry"""
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkdtemp(prefix="build-", dir=self.cachedir)
+
+    def fingerprint(self):
+        """Identity of the current content of the file"""
+        stat = os.stat(self.filename)
+        digest = hashlib.sha1()
+        with open(self.filename, "rb") as myfile:
+            digest.update(myfile.read(self.SAMPLE))
+            if stat.st_size > self.SAMPLE:
+                myfile.seek(max(self.SAMPLE, stat.st_size - self.SAMPLE))
+                digest.update(myfile.read(self.SAMPLE))
+        return {"path": self.filename, "size": stat.st_size, "mtime": stat.st_mtime_ns,
+                "digest": digest.hexdigest()}
+
+    def _meta(self, fingerprint=None):
+        """Meta data of the entry if it is still valid for the file, or for fingerprint if given"""
+        try:
+            with open(self.entry / "meta.json") as metafile:
+                meta = json.load(metafile)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("version") != self.VERSION:
+            logger.info(f"Index cache of {self.filename} has version {meta.get('version')}, ignoring it.")
+            return None
+        if meta.get("fingerprint") != (fingerprint or self.fingerprint()):
+            logger.info(f"Index cache of {self.filename} is stale.")
+            return None
+        return meta
+
+    def arrayfile(self, name, fingerprint=None):
+        """Path to store an array derived from the file next to its index, None if there is no valid index"""
+        if self._meta(fingerprint) is None:
+            return None
+        return self.entry / f"{name}.npy"
+
+    def save_array(self, name, array, fingerprint=None):
+        path = self.arrayfile(name, fingerprint)
+        if path is not None:
+            np.save(path, array)
+
+    def load_array(self, name, fingerprint=None):
+        path = self.arrayfile(name, fingerprint)
+        if path is None or not path.exists():
+            return None
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load {path}. {e}")
+            return None
+
+    def save_json(self, name, value, fingerprint=None):
+        """Store something derived from the file which JSON can hold next to its index"""
+        if self._meta(fingerprint) is None:
+            return
+        tmp = self.entry / f"{name}.json.tmp"
+        with open(tmp, "w") as jsonfile:
+            json.dump(value, jsonfile)
+        os.replace(tmp, self.entry / f"{name}.json")
+
+    def load_json(self, name, fingerprint=None):
+        if self._meta(fingerprint) is None:
+            return None
+        try:
+            with open(self.entry / f"{name}.json") as jsonfile:
+                return json.load(jsonfile)
+        except (OSError, ValueError):
+            return None
+
+    def save_index(self, name, index, fingerprint=None):
+        """Store a LineIndex derived from the file next to its line index"""
+        fingerprint = fingerprint or self.fingerprint()
+        self.save_array(f"{name}_anchors", index.anchors, fingerprint)
+        self.save_array(f"{name}_deltas", index.deltas, fingerprint)
+
+    def load_index(self, name, fingerprint=None):
+        fingerprint = fingerprint or self.fingerprint()
+        anchors = self.load_array(f"{name}_anchors", fingerprint)
+        deltas = self.load_array(f"{name}_deltas", fingerprint)
+        if anchors is None or deltas is None:
+            return None
+        return LineIndex(anchors, deltas)
+
+    def save_searchindex(self, searchindex, fingerprint=None):
+        """Move the files of an InvertedIndex of the file into its entry, True if there is a valid one"""
+        if self._meta(fingerprint) is None:
+            return False
+        shutil.rmtree(self.entry / "search", ignore_errors=True)
+        searchindex.move(str(self.entry / "search"))
+        return True
+
+    def load_searchindex(self, fingerprint=None):
+        """The InvertedIndex saved with the index, None if there is none or the index is stale"""
+        if self._meta(fingerprint) is None or not (self.entry / "search" / "postings.npy").exists():
+            return None
+        try:
+            return InvertedIndex(str(self.entry / "search"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Search index cache of {self.filename} is damaged. {e}")
+            return None
+
+    def load(self):
+        """Return the cached index as a dict, or None if there is none or it is stale.
+
+        Its fingerprint is that of the file, to pass to the loads of what is stored next to the index.
+        """
+        meta = self._meta()
+        if meta is None:
+            return None
+
+        try:
+            anchors = np.load(self.entry / "anchors.npy", mmap_mode="r")
+            deltas = np.load(self.entry / "deltas.npy", mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Index cache of {self.filename} is damaged. {e}")
+            return None
+
+        properties = meta["properties"]
+        properties["dialect"] = dialect_from_dict(properties["dialect"])
+        logger.debug(f"Loaded index of {self.filename} from {self.entry}")
+        return {"file_index": LineIndex(anchors, deltas), "total_lines": meta["total_lines"],
+                "properties": properties, "fingerprint": meta["fingerprint"]}
+
+    def save(self, file_index, properties, fingerprint=None):
+        """Store the index, fingerprint is taken before the scan so that changes during it are caught"""
+        properties = dict(properties, dialect=dialect_to_dict(properties.get("dialect")))
+        meta = {"version": self.VERSION, "fingerprint": fingerprint or self.fingerprint(),
+                "total_lines": len(file_index), "properties": properties}
+
+        shutil.rmtree(self.entry, ignore_errors=True)
+        self.entry.mkdir(parents=True, exist_ok=True)
+        np.save(self.entry / "anchors.npy", file_index.anchors)
+        np.save(self.entry / "deltas.npy", file_index.deltas)
+        # the meta file is written last, an entry without it is never loaded
+        tmp = self.entry / "meta.json.tmp"
+        with open(tmp, "w") as metafile:
+            json.dump(meta, metafile)
+        os.replace(tmp, self.entry / "meta.json")
+        logger.debug(f"Saved index of {self.filename} to {self.entry}")
@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+
+class Cancelled(Exception):
+    """Raised inside a job once its token is cancelled"""
+
+
+class CancelToken:
+    """Flag a running job polls to stop early, between two chunks of work"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+
+class Job:
+    """One unit of background work of a JobScheduler.
+
+    fn is called as fn(job, *args) in a worker thread. It reports how far it got with
+    job.progress(done, total) and hands results to the dispatcher with job.post, which
+    is how they get to the GUI thread. Once job.token is cancelled fn is expected to
+    return or raise Cancelled at its next check.
+    """
+
+    def __init__(self, scheduler, fn, args, priority, name, group, done):
+        self.scheduler = scheduler
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.name = name or getattr(fn, "__name__", "job")
+        self.group = group
+        self.done = done
+        self.token = CancelToken()
+        self.state = "queued"  # running, finished, cancelled or failed
+        self.processed = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = threading.Event()
+
+    def __repr__(self):
+        return f"<Job {self.name} {self.state}>"
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def cancel(self):
+        self.token.cancel()
+
+    def progress(self, processed, total=None):
+        self.processed = processed
+        if total is not None:
+            self.total = total
+
+    @property
+    def fraction(self):
+        return min(self.processed / self.total, 1.0) if self.total else None
+
+    def post(self, callback, *args):
+        """Have the dispatcher call callback(*args), unless the job is cancelled by then"""
+        self.scheduler.dispatch(self, callback, args)
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+class JobScheduler:
+    """Run jobs on at most workers threads, the lowest priority value first.
+
+    Jobs share a group, usually the file they work on, so that everything belonging to a
+    file can be cancelled at once when another one is opened. dispatch(job, callback, args)
+    delivers what jobs post; by default the callback runs right away in the worker thread.
+    """
+
+    def __init__(self, workers=2, dispatch=None):
+        self.workers = workers
+        self.dispatch = dispatch or (lambda job, callback, args: None if job.cancelled else callback(*args))
+        self._queue = []
+        self._running = []
+        self._threads = []
+        self._counter = itertools.count()
+        self._lock = threading.Condition()
+
+    def submit(self, fn, *args, priority=NORMAL, name=None, group=None, done=None):
+        """Queue fn(job, *args), done(result) is posted once it returns"""
+        job = Job(self, fn, args, priority, name, group, done)
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            if len(self._threads) - len(self._running) < len(self._queue) and len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"jobs-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._lock.notify()
+        logger.debug(f"Queued {job}")
+        return job
+
+    def _next(self):
+        with self._lock:
+            while True:
+                while self._queue:
+                    _, _, job = heapq.heappop(self._queue)
+                    if job.cancelled:
+                        job.state = "cancelled"
+                        job.finished.set()
+                        continue
+                    job.state = "running"
+                    self._running.append(job)
+                    return job
+                self._lock.wait()
+
+    def _work(self):
+        while True:
+            job = self._next()
+            job.started = time.perf_counter()
+            try:
+                job.result = job.fn(job, *job.args)
+                job.state = "cancelled" if job.cancelled else "finished"
+            except Cancelled:
+                job.state = "cancelled"
+            except Exception as e:
+                job.state = "failed"
+                job.error = e
+                logger.exception(f"{job} failed")
+            with self._lock:
+                self._running.remove(job)
+            elapsed = time.perf_counter() - job.started
+            METRICS.observe(f"job_{job.name}", elapsed)
+            logger.debug(f"{job} after {elapsed:.3f} s")
+            if job.state == "finished" and job.done is not None:
+                job.post(job.done, job.result)
+            job.finished.set()
+
+    def jobs(self, group=None):
+        """Running and queued jobs, of group only if given"""
+        with self._lock:
+            jobs = self._running + [job for _, _, job in sorted(self._queue)]
+        return [job for job in jobs if group is None or job.group == group]
+
+    def cancel(self, group=None):
+        """Cancel the jobs of group, or every job, and return them"""
+        with self._lock:
+            queued = [entry for entry in self._queue if group is None or entry[2].group == group]
+            for entry in queued:  # no worker ever sees these
+                self._queue.remove(entry)
+                entry[2].cancel()
+                entry[2].state = "cancelled"
+                entry[2].finished.set()
+            heapq.heapify(self._queue)
+            running = [job for job in self._running if group is None or job.group == group]
+        for job in running:
+            job.cancel()
+        return running + [job for _, _, job in queued]
+
+    def wait(self, jobs, timeout=None):
+        """Wait for jobs to stop, True if they all did within timeout seconds"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for job in jobs:
+            remaining = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            if not job.wait(remaining):
+                return False
+        return True
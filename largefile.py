@@ -0,0 +1,341 @@
+import argparse
+import logging
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from bytesource import open_source, without_bom
+from filediff import diff_files
+from grep import ParallelGrep
+from indexcache import IndexCache
+from lineindex import Chunk, LineScanner
+from jobs import Cancelled
+from metrics import METRICS, Profile, Sampler
+from schema import infer_schema
+from searchindex import SearchIndexer
+
+logger = logging.getLogger(__name__)
+
+
+class LargeFile:
+    """A text file of any size, plain or compressed, with its line and search index.
+
+    The index is taken from the index cache when the file has not changed since it was
+    built, else index() builds and saves it with one scan of the file. The search index
+    costs far more to build, it is only built, with a scan of its own, once a search asks
+    for it, or along with the line index by build_index(search=True)::
+
+        with LargeFile("big.csv") as large:
+            large.index()
+            print(large.line_count, large.lines(1000, 20), large.search("FAILED"))
+    """
+
+    def __init__(self, filename, encoding=None, cachedir=None, chunkcache=None):
+        self.filename = os.fspath(filename)
+        self.source = open_source(self.filename, encoding)
+        self.cache = IndexCache(self.filename, cachedir)
+        self.chunkcache = chunkcache  # ChunkCache shared with other files, if any
+        self.file_index = None
+        self.searchindex = None
+        self.properties = None
+        self._scratch = None  # directory of a search index the cache did not take
+
+    def __repr__(self):
+        lines = "not indexed" if self.file_index is None else f"{len(self.file_index)} lines"
+        return f"<LargeFile {self.filename}, {lines}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.searchindex is not None:
+            self.searchindex.close()
+        if self._scratch is not None:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+        self.source.close()
+
+    @property
+    def encoding(self):
+        return self.source.encoding
+
+    def file_properties(self):
+        """Dialect, header and column types, inferred once from samples of the file"""
+        if self.properties is None:
+            self.properties = infer_schema(self.source)
+        return self.properties
+
+    def load_index(self):
+        """Take the index from the cache, True if it held a valid one"""
+        cached = self.cache.load()
+        if cached is None:
+            return False
+        self.properties = cached["properties"]
+        if self.source.compressed:
+            checkpoints = self.cache.load_array("checkpoints", cached["fingerprint"])
+            if checkpoints is not None:
+                self.source.restore_checkpoints(checkpoints, size=cached["file_index"][len(cached["file_index"])])
+        self.file_index = cached["file_index"]
+        return True
+
+    def load_searchindex(self):
+        """Take the search index from the cache, True if it held one for the current line index"""
+        if self.searchindex is not None:
+            return True
+        searchindex = self.cache.load_searchindex() if self.file_index is not None else None
+        if searchindex is None:
+            return False
+        self._set_searchindex(searchindex)
+        return True
+
+    def needs_snapshots(self):
+        """Whether reads far into the compressed file are slow until it is decompressed once more"""
+        return self.source.snapshots and len(self.source.export_checkpoints()) < 2
+
+    def _set_searchindex(self, searchindex):
+        self.searchindex = searchindex
+        self.searchindex.encoding = without_bom(self.encoding)
+
+    @METRICS.timed("build_index")
+    def build_index(self, token=None, progress=None, started=None, indexed=None, search=False):
+        """Index lines, and with search build the search index in the same pass, then save them to the cache.
+
+        started(index) is called with the line index while it is still growing, indexed(index)
+        as soon as it is complete, before the search index is. Returns the line index.
+        """
+        properties = self.file_properties()
+        fingerprint = self.cache.fingerprint()
+        consumers = [SearchIndexer(directory=self.cache.builddir(), token=token)] if search else []
+        try:
+            scanner = LineScanner(self.source, consumers=consumers, token=token, progress=progress)
+            if started is not None:
+                started(scanner.index)
+            fileindex = scanner.run()
+            if indexed is not None:
+                indexed(fileindex)
+            searchindex = consumers[0].finish() if search else None
+            if token is not None:
+                token.check()
+        except Cancelled:
+            for searchindexer in consumers:
+                shutil.rmtree(searchindexer.directory, ignore_errors=True)
+            raise
+
+        try:
+            self.cache.save(fileindex, properties, fingerprint)
+            if self.source.compressed:
+                self.cache.save_array("checkpoints", self.source.export_checkpoints(), fingerprint)
+        except OSError as e:
+            logger.warning(f"Could not save index cache. {e}")
+        self.file_index = fileindex
+        if search:
+            self._save_searchindex(searchindex)
+        return fileindex
+
+    @METRICS.timed("build_searchindex")
+    def build_searchindex(self, token=None, progress=None):
+        """Build the search index of the lines of the line index with a scan of the file and save it to the cache"""
+        index = self.index()
+        builddir = self.cache.builddir()
+        try:
+            searchindexer = SearchIndexer(directory=builddir, token=token)
+            LineScanner(self.source, consumers=[searchindexer], stop=int(index[len(index)]), token=token,
+                        progress=progress).run()
+            searchindex = searchindexer.finish()
+        except Cancelled:
+            shutil.rmtree(builddir, ignore_errors=True)
+            raise
+        self._save_searchindex(searchindex)
+        return searchindex
+
+    def _save_searchindex(self, searchindex):
+        try:
+            if not self.cache.save_searchindex(searchindex):
+                self._scratch = searchindex.directory  # no valid entry to keep it in, removed on close
+        except OSError as e:
+            logger.warning(f"Could not save search index cache. {e}")
+        self._set_searchindex(searchindex)
+
+    def index(self):
+        """The line index, loaded from the cache or built"""
+        if self.file_index is None and not self.load_index():
+            self.build_index()
+        return self.file_index
+
+    def search_index(self, token=None, progress=None):
+        """The search index, loaded from the cache or built"""
+        self.index()
+        if not self.load_searchindex():
+            self.build_searchindex(token=token, progress=progress)
+        return self.searchindex
+
+    @property
+    def line_count(self):
+        return len(self.index())
+
+    def lines(self, start, nlines, index=None):
+        """Text of up to nlines lines starting at line start, by default of the complete index"""
+        index = self.index() if index is None else index
+        if start >= len(index):
+            return []
+        with METRICS.timer("lines"):
+            return Chunk.read(self.source, index, start, nlines, self.chunkcache).texts(self.encoding)
+
+    def grep(self, pattern, regex=False, ignorecase=False, token=None, progress=None):
+        """Yield, in file order, arrays of the numbers of the lines matching pattern, scanning the whole file"""
+        yield from ParallelGrep(self.source, pattern, regex=regex, ignorecase=ignorecase, encoding=self.encoding,
+                                token=token, progress=progress)
+
+    def search(self, text, regex=False, ignorecase=False, token=None, progress=None):
+        """Sorted numbers of the lines matching text.
+
+        Plain text is looked up in the search index, built first if need be, its terms must
+        all occur and "quoted terms" as a phrase. Regular expressions and case insensitive
+        searches scan the file.
+        """
+        if not regex and not ignorecase:
+            searchindex = self.search_index(token=token, progress=progress)
+            with METRICS.timer("search_index"):
+                return searchindex.query(text, fetch=self.lines)
+        with METRICS.timer("search_grep"):
+            found = list(self.grep(text, regex=regex, ignorecase=ignorecase, token=token, progress=progress))
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.uint64)
+
+    def diff(self, other, token=None, progress=None):
+        """FileDiff of this file and another LargeFile, see filediff.diff_files"""
+        return diff_files(self, other, token=token, progress=progress)
+
+
+def _slice(text):
+    start, _, stop = text.partition(":")
+    return int(start or 0), int(stop) if stop else None
+
+
+USAGE = """examples:
+  python largefile.py index big.csv other.log.gz    build indexes ahead, e.g. overnight
+  python largefile.py count big.csv
+  python largefile.py lines big.csv 1000000 20
+  python largefile.py range big.csv 1000000:1000020
+  python largefile.py search -n big.csv FAILED
+  python largefile.py diff extract-old.csv extract-new.csv
+  python largefile.py --metrics prometheus --profile index.prof index big.csv
+"""
+
+
+def main(argv=None):
+    """Command line interface, returns the exit status"""
+    parser = argparse.ArgumentParser(prog="largefile", description="Index large text files and print lines of them.",
+                                     epilog=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true", help="log what is going on")
+    parser.add_argument("--encoding", help="encoding of the files, detected if not given")
+    parser.add_argument("--cachedir", help="index cache directory")
+    parser.add_argument("--metrics", choices=["json", "prometheus"],
+                        help="print what was measured to stderr at the end")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the command into FILE, as cProfile stats or, named *.folded, as sampled stacks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("index", help="build the line and search indexes of files which lack them")
+    command.add_argument("files", nargs="+")
+    command.add_argument("--force", action="store_true", help="rebuild indexes which are still valid")
+    command = commands.add_parser("count", help="print the number of lines")
+    command.add_argument("files", nargs="+")
+    command = commands.add_parser("lines", help="print nlines lines from line start on, counted from 0")
+    command.add_argument("file")
+    command.add_argument("start", type=int)
+    command.add_argument("nlines", type=int, nargs="?", default=1)
+    command = commands.add_parser("range", help="print the lines start:stop, like a Python slice")
+    command.add_argument("file")
+    command.add_argument("slice", type=_slice)
+    command = commands.add_parser("search", help="print the numbers of the lines matching a pattern")
+    command.add_argument("file")
+    command.add_argument("pattern")
+    command.add_argument("-E", "--regex", action="store_true", help="pattern is a regular expression")
+    command.add_argument("-i", "--ignore-case", action="store_true")
+    command.add_argument("-n", "--with-lines", action="store_true", help="print the lines too")
+    command = commands.add_parser("diff", help="print how two files differ, as a unified diff without context")
+    command.add_argument("file")
+    command.add_argument("other")
+    command.add_argument("-q", "--brief", action="store_true", help="only print how much differs")
+    args = parser.parse_args(argv)
+
+    FORMAT = '%(asctime)s - %(name)20s - %(funcName)20s - %(levelname)8s - %(message)s'
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format=FORMAT)
+    if args.metrics:
+        METRICS.enable()
+    profiler = None
+    if args.profile:
+        profiler = Sampler() if args.profile.endswith(".folded") else Profile()
+        profiler.start()
+    try:
+        return _run(args, sys.stdout)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            if isinstance(profiler, Sampler):
+                with open(args.profile, "w") as folded:
+                    folded.write(profiler.folded())
+            else:
+                profiler.save(args.profile)
+        if args.metrics:
+            sys.stderr.write(METRICS.to_json(indent=1) + "\n" if args.metrics == "json" else METRICS.to_prometheus())
+
+
+def _run(args, out):
+    if args.command in ("index", "count"):
+        for filename in args.files:
+            with LargeFile(filename, encoding=args.encoding, cachedir=args.cachedir) as large:
+                if args.command == "count":
+                    out.write(f"{large.line_count}\t{filename}\n")
+                elif args.force or not large.load_index():
+                    large.build_index(search=True)
+                    logger.info(f"Indexed {large}")
+                elif not large.load_searchindex():
+                    large.build_searchindex()
+                    logger.info(f"Built the search index of {large}")
+        return 0
+
+    if args.command == "diff":
+        with LargeFile(args.file, encoding=args.encoding, cachedir=args.cachedir) as large, \
+                LargeFile(args.other, encoding=args.encoding, cachedir=args.cachedir) as other:
+            diff = large.diff(other)
+            if not len(diff):
+                return 0
+            if args.brief:
+                summary = diff.summary()
+                out.write(f"{summary['hunks']} differences, {summary['deleted']} lines deleted, "
+                          f"{summary['inserted']} inserted\n")
+                return 1
+            out.write(f"--- {args.file}\n+++ {args.other}\n")
+            for line in diff.unified(large.lines, other.lines):
+                out.write(line + "\n")
+        return 1
+
+    with LargeFile(args.file, encoding=args.encoding, cachedir=args.cachedir) as large:
+        if args.command == "search":
+            found = large.search(args.pattern, regex=args.regex, ignorecase=args.ignore_case)
+            for linenumber in found.tolist():
+                text = f"\t{large.lines(linenumber, 1)[0]}" if args.with_lines else ""
+                out.write(f"{linenumber}{text}\n")
+            return 0 if len(found) else 1
+        if args.command == "lines":
+            start, stop = args.start, args.start + args.nlines
+        else:
+            start, stop = args.slice
+        count = large.line_count
+        start, stop, _ = slice(start, stop).indices(count)
+        for position in range(start, stop, 4096):
+            for line in large.lines(position, min(4096, stop - position)):
+                out.write(line + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except BrokenPipeError:  # the reader, like head, has seen enough
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
@@ -0,0 +1,303 @@
+import logging
+
+import numpy as np
+
+from bytesource import open_source
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+NEWLINE = ord("\n")
+WIDER = {np.dtype(np.uint16): np.dtype(np.uint32), np.dtype(np.uint32): np.dtype(np.uint64)}
+
+
+class LineIndex:
+    """Byte offset of the start of every line in a file.
+
+    Offsets are stored as a 64 bit anchor every BLOCK lines plus a small delta to that anchor
+    for every line, about two bytes per line, and any line resolves in O(1).
+    There is one extra entry at the end, the length of the indexed bytes,
+    so that line n always spans index[n]:index[n + 1].
+
+    One thread may append while others read: the entry count is raised only after the
+    entries are written and grown arrays are swapped in whole, so a reader sees a
+    consistent shorter index.
+    """
+
+    SHIFT = 6
+    BLOCK = 1 << SHIFT
+
+    def __init__(self, anchors=None, deltas=None):
+        if anchors is None:
+            anchors = np.zeros(1, dtype=np.uint64)
+            deltas = np.zeros(1, dtype=np.uint16)
+        self._anchors = anchors
+        self._deltas = deltas
+        self._count = len(deltas)  # entries in use, lines + 1
+
+    @classmethod
+    def from_offsets(cls, offsets):
+        index = cls(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint16))
+        index.append(offsets)
+        return index
+
+    @property
+    def anchors(self):
+        return self._anchors[:(self._count + self.BLOCK - 1) >> self.SHIFT]
+
+    @property
+    def deltas(self):
+        return self._deltas[:self._count]
+
+    @property
+    def nbytes(self):
+        return self.anchors.nbytes + self.deltas.nbytes
+
+    def __len__(self):
+        return self._count - 1
+
+    def __getitem__(self, linenumber):
+        if not 0 <= linenumber < self._count:
+            raise IndexError(f"line {linenumber} is not in the index")
+        return int(self._anchors[linenumber >> self.SHIFT]) + int(self._deltas[linenumber])
+
+    def __repr__(self):
+        return f"<LineIndex {len(self)} lines>"
+
+    def offsets(self, start=0, stop=None):
+        """Offsets of the entries start to stop as an array"""
+        stop = self._count if stop is None else min(stop, self._count)
+        lines = np.arange(start, stop)
+        return self._anchors[lines >> self.SHIFT] + self._deltas[start:stop].astype(np.uint64)
+
+    def line_at(self, offset):
+        """Number of the line containing the byte offset, len(self) for the end of the index"""
+        block = max(int(np.searchsorted(self.anchors, offset, side="right")) - 1, 0)
+        start = block << self.SHIFT
+        offsets = self.offsets(start, start + self.BLOCK)
+        return start + max(int(np.searchsorted(offsets, offset, side="right")) - 1, 0)
+
+    @staticmethod
+    def _reserve(array, used, needed, dtype=None):
+        dtype = dtype or array.dtype
+        if len(array) >= needed and array.dtype == dtype and array.flags.writeable:
+            return array
+        grown = np.empty(max(needed, 2 * len(array)), dtype=dtype)
+        grown[:used] = array[:used]
+        return grown
+
+    def append(self, offsets):
+        """Add entries at the end, offsets are absolute and ascending"""
+        offsets = np.asarray(offsets, dtype=np.uint64)
+        if not len(offsets):
+            return
+        lines = np.arange(self._count, self._count + len(offsets))
+        nanchors = len(self.anchors)
+        newanchors = offsets[lines % self.BLOCK == 0]
+        self._anchors = self._reserve(self._anchors, nanchors, nanchors + len(newanchors))
+        self._anchors[nanchors:nanchors + len(newanchors)] = newanchors
+
+        deltas = offsets - self._anchors[lines >> self.SHIFT]
+        dtype = self._deltas.dtype
+        largest = int(deltas.max())
+        while np.iinfo(dtype).max < largest:  # lines too long for the deltas, widen all of them
+            dtype = WIDER[dtype]
+        self._deltas = self._reserve(self._deltas, self._count, self._count + len(offsets), dtype)
+        self._deltas[self._count:self._count + len(offsets)] = deltas
+        self._count += len(offsets)
+
+    def truncate(self, count):
+        """Keep only the first count entries"""
+        self._count = min(count, self._count)
+
+    def extend(self, tail):
+        """Append the index of bytes scanned after this one, tail starts at the offset of one of our lines"""
+        start = tail[0]
+        linenumber = self.line_at(start)
+        assert self[linenumber] == start, "tail does not start on a line boundary"
+        self.truncate(linenumber)
+        self.append(tail.offsets())
+
+    def span(self, linenumber, nlines=1):
+        """Byte range covering nlines starting at linenumber"""
+        start = min(linenumber, len(self))
+        stop = min(linenumber + nlines, len(self))
+        return self[start], self[stop]
+
+
+class Chunk:
+    """A stretch of a file as a memoryview and the offsets of the lines in it.
+
+    Nothing is decoded up front: text(n) decodes line n alone, without its newline and
+    a carriage return before it, so showing a page costs the page and not the chunk.
+    """
+
+    def __init__(self, data, bounds, firstline=0):
+        self.data = data
+        self.bounds = bounds  # line n is data[bounds[n]:bounds[n + 1]]
+        self.firstline = firstline
+
+    @classmethod
+    def scan(cls, data, firstline=0):
+        """Chunk of data cut at its newlines, a last line without one included"""
+        bounds = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == NEWLINE) + 1
+        if len(data) and (not len(bounds) or bounds[-1] != len(data)):
+            bounds = np.append(bounds, len(data))
+        return cls(data, np.insert(bounds, 0, 0).astype(np.int64), firstline)
+
+    @classmethod
+    def read(cls, source, index, start, nlines, cache=None):
+        """Chunk of the indexed lines start to start + nlines of a ByteSource, through a ChunkCache if given"""
+        with METRICS.timer("chunk_read"):
+            stop = min(start + nlines, len(index))
+            offsets = index.offsets(start, stop + 1)
+            begin, end = int(offsets[0]), int(offsets[-1])
+            data = source.view(begin, end - begin) if cache is None else cache.view(source, begin, end - begin)
+            return cls(data, offsets.astype(np.int64) - begin, start)
+
+    def __len__(self):
+        return max(len(self.bounds) - 1, 0)
+
+    def __repr__(self):
+        return f"<Chunk {len(self)} lines from line {self.firstline}>"
+
+    def line(self, n):
+        """Bytes of line n, without line ending"""
+        line = self.data[self.bounds[n]:self.bounds[n + 1]]
+        if line[-1:] == b"\n":
+            line = line[:-1]
+        if line[-1:] == b"\r":
+            line = line[:-1]
+        return line
+
+    def text(self, n, encoding="utf-8"):
+        return str(self.line(n), encoding, errors="replace")
+
+    def texts(self, encoding="utf-8", start=0, stop=None):
+        """Text of the lines start to stop"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        return [self.text(n, encoding) for n in range(start, stop)]
+
+
+class LineScanner:
+    """Scan a file once and share every chunk of bytes with a set of consumers.
+
+    filename is a path or an open ByteSource, compressed files are decompressed on the way.
+    Newlines are counted on the raw bytes, no decoding takes place.
+    Chunks always end on a line boundary. Each consumer gets
+    ``consumer.feed(chunk, position, firstline, newlines)`` where chunk is a memoryview,
+    position its byte offset in the file, firstline the number of its first line and
+    newlines the positions of the newline characters relative to the chunk.
+
+    token is checked before every chunk and consumer, a cancelled one ends the scan with
+    its Cancelled exception. progress(done, total) is called with the bytes scanned so far.
+    The LineIndex being built is the index attribute, other threads can use the lines
+    indexed so far while run is going.
+    """
+
+    def __init__(self, filename, consumers=(), chunksize=16 * 1024 ** 2, start=0, firstline=0, stop=None,
+                 token=None, progress=None):
+        self.filename = filename
+        self.consumers = list(consumers)
+        self.chunksize = chunksize
+        self.start = start  # byte offset of a line to start the scan at
+        self.firstline = firstline  # line number of that line
+        self.stop = stop  # only index the lines starting before this byte offset
+        self.token = token
+        self.progress = progress
+        self.index = LineIndex.from_offsets([start])
+
+    def run(self):
+        """Scan the file and return its LineIndex"""
+        logger.debug(f"Scanning file from byte {self.start}...")
+        index = self.index
+        lines = self.firstline
+        timers = [f"scan_feed_{type(consumer).__name__}" for consumer in self.consumers]
+
+        source = open_source(self.filename)
+        try:
+            end = self.start
+            for position, chunk in source.blocks(self.start, self.stop, self.chunksize):
+                if self.token is not None:
+                    self.token.check()
+                with METRICS.timer("scan_newlines"):
+                    newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == NEWLINE)
+                    index.append(newlines.astype(np.uint64) + np.uint64(position + 1))
+                for consumer, timer in zip(self.consumers, timers):
+                    if self.token is not None:
+                        self.token.check()
+                    with METRICS.timer(timer):
+                        consumer.feed(chunk, position, lines, newlines)
+                lines += len(newlines)
+                end = position + len(chunk)
+                METRICS.count("scan_bytes", len(chunk))
+                METRICS.gauge("scan_lines", lines)
+                if self.progress is not None:
+                    size = source.estimated_size()
+                    total = (size if self.stop is None else min(self.stop, size)) - self.start
+                    self.progress(min(end - self.start, total), total)
+        finally:
+            if source is not self.filename:
+                source.close()
+
+        if index[len(index)] != end and (self.stop is None or end < self.stop):  # last line without newline
+            index.append([end])
+        logger.debug(f"Scanning file...Done. {len(index)} lines.")
+        return index
+
+
+def scan_tail(filename, index, consumers=(), token=None):
+    """Index the bytes appended to a file since index was built.
+
+    A last line without a newline may have been completed since, it is scanned again.
+    Returns a LineIndex to pass to index.extend, its first line is the first new or changed one.
+    """
+    start = len(index)
+    if start:
+        with open(filename, "rb") as myfile:
+            myfile.seek(index[start] - 1)
+            if myfile.read(1) != b"\n":
+                start -= 1
+
+    return LineScanner(filename, consumers, start=index[start], firstline=start, token=token).run()
+
+
+def sample_lines(filename, samples=16, samplesize=64 * 1024):
+    """Offsets and average line lengths of samples spread evenly over the file.
+
+    Only the head of a compressed file is sampled, getting further into it means decompressing everything before.
+    """
+    found = []
+    source = open_source(filename)
+    try:
+        size = source.size
+        if source.compressed:
+            size, samples = samplesize, 1
+        for n in range(samples):
+            offset = (size - samplesize) * n // max(samples - 1, 1) if size > samplesize else 0
+            data = source.read(offset, samplesize)
+            newlines = data.count(b"\n")
+            if newlines:
+                found.append((offset, len(data) / newlines))
+            if size <= samplesize:
+                break
+    finally:
+        if source is not filename:
+            source.close()
+    return found
+
+
+def estimate_linecount(indexed_lines, indexed_bytes, size, samples):
+    """Lines in a file of size bytes with the first indexed_bytes holding indexed_lines lines.
+
+    The rest is counted with the average line length of the samples taken beyond the indexed part,
+    so the estimate gets more exact as indexing goes on.
+    """
+    remaining = size - indexed_bytes
+    if remaining <= 0:
+        return indexed_lines
+    lengths = [length for offset, length in samples if offset >= indexed_bytes] or \
+        [length for _, length in samples]
+    if not lengths:
+        return indexed_lines + 1
+    return indexed_lines + max(int(remaining / (sum(lengths) / len(lengths))), 1)
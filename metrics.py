@@ -0,0 +1,277 @@
+import bisect
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)  # upper bounds in seconds of the timer histograms
+
+
+class _NoTimer:
+    """What timer gives while metrics are off, entering and leaving it does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOTIMER = _NoTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Counters, gauges and timers of what the viewer does, kept only while enabled.
+
+    Every call returns at once while disabled, the default, so that the hot paths can stay
+    instrumented for the price of checking one attribute. Timers keep the count, sum and
+    maximum of the durations and a histogram of them. Collectors are asked for gauges when
+    a snapshot is taken, for what is counted elsewhere anyway, like the hits of a ChunkCache.
+    Set LFV_METRICS=1 to have them enabled from the start.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._collectors = {}
+        self.reset()
+
+    def __repr__(self):
+        state = "on" if self.enabled else "off"
+        return f"<Metrics {state}, {len(self._counters)} counters, {len(self._timers)} timers>"
+
+    def reset(self):
+        with self._lock:
+            self._counters = defaultdict(int)
+            self._gauges = {}
+            self._timers = {}  # name: [count, sum, max, counts per bucket]
+            self.since = time.time()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] += n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Take in one duration of timer name"""
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = [0, 0.0, 0.0, [0] * (len(BUCKETS) + 1)]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+            timer[3][bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def timer(self, name):
+        """Context manager timing what runs inside it"""
+        return _Timer(self, name) if self.enabled else NOTIMER
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function, under its qualified name by default"""
+        def decorate(fn):
+            label = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(label, time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+    def collect(self, name, collector):
+        """Have collector() give a dict of gauges, prefixed with name, for every snapshot. None removes it."""
+        if collector is None:
+            self._collectors.pop(name, None)
+        else:
+            self._collectors[name] = collector
+
+    def snapshot(self):
+        """Everything counted so far as a dict of plain values"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timers = {name: [count, total, peak, list(buckets)]
+                      for name, (count, total, peak, buckets) in self._timers.items()}
+        if self.enabled:
+            for prefix, collector in list(self._collectors.items()):
+                try:
+                    gauges.update((f"{prefix}_{key}", value) for key, value in collector().items())
+                except Exception:
+                    logger.exception(f"Collecting {prefix} metrics failed")
+        return {"since": self.since, "seconds": time.time() - self.since, "counters": counters, "gauges": gauges,
+                "timers": {name: {"count": count, "sum": total, "mean": total / count if count else 0.0, "max": peak,
+                                  "buckets": dict(zip([str(le) for le in BUCKETS] + ["+Inf"], _cumulative(buckets)))}
+                           for name, (count, total, peak, buckets) in timers.items()}}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="lfv"):
+        """The snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = _metricname(prefix, name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            if isinstance(value, (int, float)) and value is not None:
+                metric = _metricname(prefix, name)
+                lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        for name, timer in sorted(snapshot["timers"].items()):
+            metric = _metricname(prefix, name) + "_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            lines += [f'{metric}_bucket{{le="{le}"}} {count}' for le, count in timer["buckets"].items()]
+            lines += [f"{metric}_sum {timer['sum']}", f"{metric}_count {timer['count']}"]
+        return "\n".join(lines) + "\n"
+
+
+def _cumulative(counts):
+    total, found = 0, []
+    for count in counts:
+        total += count
+        found.append(total)
+    return found
+
+
+def _metricname(prefix, name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}").lower()
+
+
+METRICS = Metrics(enabled=bool(os.environ.get("LFV_METRICS")))
+
+
+class Profile:
+    """cProfile of what runs in the calling thread between start and stop, or in a with block"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self, sort="cumulative", limit=30):
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def save(self, path):
+        """Write the stats for pstats, snakeviz and the like"""
+        self.profile.dump_stats(path)
+
+
+class Sampler:
+    """Sampling profiler taking the stacks of every thread each interval seconds.
+
+    It runs in a thread of its own and costs the sampled threads next to nothing, and unlike
+    cProfile it sees the background jobs too. folded() gives the stacks in the format
+    flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="Sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, limit=30):
+        """Functions by the share of samples they were running in, and on top of the stack"""
+        inclusive, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            own[frames[-1] if frames else stack] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        total = max(sum(self.stacks.values()), 1)
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms", f"{'total':>7} {'self':>7}  function"]
+        for frame, count in inclusive.most_common(limit):
+            lines.append(f"{count / total:7.1%} {own[frame] / total:7.1%}  {frame}")
+        return "\n".join(lines) + "\n"
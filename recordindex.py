@@ -0,0 +1,181 @@
+import csv
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bytesource import open_source, without_bom
+from grep import split_ranges
+from lineindex import LineIndex, LineScanner, NEWLINE
+
+logger = logging.getLogger(__name__)
+
+
+def quote_parity(data, quote, newlines=None):
+    """Parity of the quotes before every newline in data, and of all quotes in it.
+
+    A newline ends a record if its parity is even when data starts outside quotes, odd when
+    it starts inside a quoted field. Both answers come out of the one pass, which lets ranges
+    of a file be scanned before the quote state they start in is known. Doubled quotes
+    inside a field count twice and leave the parity alone.
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    if newlines is None:
+        newlines = np.flatnonzero(array == NEWLINE)
+    quotes = np.flatnonzero(array == quote)
+    return newlines, (np.searchsorted(quotes, newlines) & 1).astype(np.uint8), len(quotes) & 1
+
+
+def scan_range(filename, start, end, quote):
+    """Record ends in start:end of a file for either quote state at start, and the parity of the range.
+
+    Ends are the offsets just after the newlines, first for a range starting outside quotes, then inside.
+    """
+    with open(filename, "rb") as myfile, mmap.mmap(myfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+        newlines, parities, parity = quote_parity(data, quote)
+        del data
+    ends = newlines.astype(np.uint64) + np.uint64(start + 1)
+    return ends[parities == 0], ends[parities == 1], parity
+
+
+class RecordIndexer:
+    """LineScanner consumer which collects the offsets of the lines that start a record"""
+
+    def __init__(self, quote, start=0):
+        self.quote = quote
+        self.inside = False  # whether the scan is inside a quoted field
+        self.index = LineIndex.from_offsets([start])
+
+    def feed(self, chunk, position, firstline, newlines):
+        newlines, parities, parity = quote_parity(chunk, self.quote, newlines)
+        ends = newlines[parities == int(self.inside)]
+        self.index.append(ends.astype(np.uint64) + np.uint64(position + 1))
+        self.inside ^= bool(parity)
+
+    def finish(self, end):
+        if self.index[len(self.index)] != end:  # last record without newline
+            self.index.append([end])
+        return self.index
+
+
+def complete_end(filename, start, end, quote=None):
+    """Where the complete rows of a growing file end, given start:end of its last line, or record with quote.
+
+    The last line may still lack its newline and the last record may end inside a quoted
+    field, then it ends at start, else at end.
+    """
+    if start == end:
+        return end
+    with open(filename, "rb") as myfile:
+        if quote is None:
+            myfile.seek(end - 1)
+            return end if myfile.read(1) == b"\n" else start
+        myfile.seek(start)
+        data = myfile.read(end - start)
+    return end if data.endswith(b"\n") and not quote_parity(data, quote)[2] else start
+
+
+def scan_tail_records(filename, records, quote, token=None):
+    """Index the records appended to a file since records was built.
+
+    A last record which was not complete may have been continued since, it is scanned again.
+    Returns a LineIndex to pass to records.extend, its first record is the first new or changed one.
+    """
+    start = len(records)
+    if start and complete_end(filename, int(records[start - 1]), int(records[start]), quote) < records[start]:
+        start -= 1
+    begin = int(records[start])
+    indexer = RecordIndexer(quote, begin)
+    index = LineScanner(filename, consumers=[indexer], start=begin, firstline=start, token=token).run()
+    return indexer.finish(index[len(index)])
+
+
+def record_quote(dialect, encoding="utf-8"):
+    """The byte that quotes fields in dialect, None if records cannot span lines"""
+    if dialect is None or dialect.quoting == csv.QUOTE_NONE or not dialect.quotechar:
+        return None
+    quote = dialect.quotechar.encode(without_bom(encoding))
+    return quote[0] if len(quote) == 1 else None
+
+
+def index_records(filename, dialect, workers=None, rangesize=64 * 1024 ** 2, token=None, progress=None):
+    """LineIndex of the records of a delimited file, which differ from its lines where quoted fields hold newlines.
+
+    The file is cut into ranges that are scanned in parallel processes, each for both quote
+    states it may start in. The actual states are then resolved front to back from the
+    parity of each range. Compressed files are scanned in one pass. Returns None if the
+    dialect does not quote, then every line is a record. Escaped quotes (escapechar) are
+    not told apart from quotes.
+    """
+    source = open_source(filename)
+    try:
+        quote = record_quote(dialect, source.encoding)
+        if quote is None:
+            return None
+        if source.compressed:
+            indexer = RecordIndexer(quote)
+            LineScanner(source, consumers=[indexer], token=token, progress=progress).run()
+            return indexer.finish(source.size)
+        size = source.size
+    finally:
+        if source is not filename:
+            source.close()
+
+    path = source.filename
+    index = LineIndex.from_offsets([0])
+    ranges = split_ranges(path, rangesize)
+    inside = 0
+    if len(ranges) == 1:  # not worth starting processes
+        outside_ends, inside_ends, parity = scan_range(path, *ranges[0], quote)
+        index.append(inside_ends if inside else outside_ends)
+    elif ranges:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            futures = [pool.submit(scan_range, path, start, end, quote) for start, end in ranges]
+            try:
+                for future, (_, end) in zip(futures, ranges):
+                    if token is not None:
+                        token.check()
+                    outside_ends, inside_ends, parity = future.result()
+                    index.append(inside_ends if inside else outside_ends)
+                    inside ^= parity
+                    if progress is not None:
+                        progress(end, size)
+            finally:
+                for future in futures:
+                    future.cancel()
+    if index[len(index)] != size:  # last record without newline
+        index.append([size])
+    logger.debug(f"{len(index)} records in {path}")
+    return index
+
+
+def feed_records(filename, records, consumer, blocksize=16 * 1024 ** 2, token=None, progress=None):
+    """Feed a LineScanner consumer blocks of whole records instead of lines.
+
+    firstline is the number of the first record of a block, newlines the positions of the
+    newlines which end its records.
+    """
+    source = open_source(filename)
+    try:
+        first, total = 0, records[len(records)]
+        while first < len(records):
+            if token is not None:
+                token.check()
+            begin = records[first]
+            last = max(records.line_at(begin + blocksize), first + 1)
+            ends = records.offsets(first + 1, last + 1).astype(np.int64) - begin
+            data = source.read(begin, int(ends[-1]))
+            if not data.endswith(b"\n"):  # the last record has no newline
+                ends = ends[:-1]
+            consumer.feed(memoryview(data), begin, first, ends - 1)
+            end = begin + len(data)
+            first = last
+            if progress is not None:
+                progress(end, total)
+    finally:
+        if source is not filename:
+            source.close()
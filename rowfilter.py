@@ -0,0 +1,212 @@
+import csv
+import io
+import logging
+import re
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    import pandas as pd
+except ImportError:  # filtering parses with pandas
+    pd = None
+
+from lineindex import LineScanner
+from recordindex import feed_records
+
+logger = logging.getLogger(__name__)
+
+NUMERIC = ("int64", "float64")
+AND = re.compile(r'"[^"]*"|\s+(and)\s+', re.IGNORECASE)  # quoted runs are matched whole, to skip an and in them
+CONDITION = re.compile(r'\s*("[^"]+"|\S+?)\s*(==|!=|<=|>=|<|>|~|\s+in\s+|\s+between\s+)\s*(.*?)\s*$', re.IGNORECASE)
+
+Predicate = namedtuple("Predicate", "column op value")
+
+
+class FilterError(ValueError):
+    """A filter which cannot be parsed or does not fit the file"""
+
+
+def _unquote(text):
+    text = text.strip()
+    return text[1:-1] if len(text) > 1 and text[0] == text[-1] == '"' else text
+
+
+def _conditions(text):
+    """The conditions of a filter, split at every and outside quotes"""
+    conditions, start = [], 0
+    for match in AND.finditer(text):
+        if match.group(1):
+            conditions.append(text[start:match.start()])
+            start = match.end()
+    return conditions + [text[start:]]
+
+
+def parse_filter(text, header, dtypes=None):
+    """Predicates of a filter like ``status == FAILED and amount between 10, 20``.
+
+    Conditions are joined by and. A column is named by its header or by its number, values
+    may be quoted. ~ matches a regular expression, in takes a comma separated list and
+    between the two inclusive bounds of a range. Given the column types, the values compared
+    with a numeric column have to be numbers.
+    """
+    dtypes = list(dtypes or [])
+    predicates = []
+    for condition in _conditions(text.strip()):
+        if not condition:
+            continue
+        match = CONDITION.match(condition)
+        if match is None:
+            raise FilterError(f"Cannot read the condition {condition!r}.")
+        name, op, value = _unquote(match.group(1)), match.group(2).strip().lower(), match.group(3)
+        if name in header:
+            column = header.index(name)
+        elif name.isdigit() and int(name) < len(header):
+            column = int(name)
+        else:
+            raise FilterError(f"There is no column {name!r}.")
+        if op in ("in", "between"):
+            value = tuple(_unquote(v) for v in next(csv.reader([value], skipinitialspace=True)))
+            if op == "between" and len(value) != 2:
+                raise FilterError(f"between takes two bounds, not {value!r}.")
+        else:
+            value = _unquote(value)
+            if op == "~":
+                try:
+                    re.compile(value)
+                except re.error as e:
+                    raise FilterError(f"{value!r} is no regular expression: {e}") from e
+        if op != "~" and column < len(dtypes) and dtypes[column] in NUMERIC:
+            for number in value if isinstance(value, tuple) else (value,):
+                try:
+                    float(number)
+                except ValueError:
+                    raise FilterError(f"{number!r} is no number, column {name!r} holds numbers.") from None
+        predicates.append(Predicate(column, op, value))
+    return predicates
+
+
+def evaluate(predicate, values, dtype):
+    """Boolean array of the rows whose value of the column satisfies predicate, values is a pandas Series"""
+    op, value = predicate.op, predicate.value
+    if op == "~":
+        return values.astype(str).str.contains(value, regex=True, na=False).to_numpy(dtype=bool)
+    numeric = dtype in NUMERIC
+    if numeric:
+        values = pd.to_numeric(values, errors="coerce")
+        try:
+            value = tuple(float(v) for v in value) if isinstance(value, tuple) else float(value)
+        except ValueError as e:
+            raise FilterError(f"{predicate.value!r} is no number, column {predicate.column} holds numbers.") from e
+    else:
+        values = values.fillna("").astype(str)
+    if op == "==":
+        mask = values == value
+    elif op == "!=":
+        mask = values != value
+    elif op == "<":
+        mask = values < value
+    elif op == "<=":
+        mask = values <= value
+    elif op == ">":
+        mask = values > value
+    elif op == ">=":
+        mask = values >= value
+    elif op == "in":
+        mask = values.isin(value)
+    else:
+        mask = (values >= value[0]) & (values <= value[1])
+    return mask.to_numpy(dtype=bool, na_value=False)
+
+
+def read_columns(data, columns, ncolumns, dialect, encoding="utf-8", nrows=None):
+    """The given columns of the rows in data as a DataFrame of strings, empty fields are empty strings.
+
+    pandas parses, only the columns asked for. If it finds a number of rows other than nrows,
+    or fails, the csv module does, which copes with whatever the dialect allows.
+    """
+    try:
+        with warnings.catch_warnings():  # fields beyond the header are dropped, which is fine here
+            warnings.simplefilter("ignore", pd.errors.ParserWarning)
+            frame = pd.read_csv(io.BytesIO(data), header=None, names=range(ncolumns), index_col=False,
+                                usecols=columns, dtype=str, sep=dialect.delimiter, quotechar=dialect.quotechar or '"',
+                                doublequote=dialect.doublequote, escapechar=dialect.escapechar,
+                                skipinitialspace=dialect.skipinitialspace, skip_blank_lines=False,
+                                keep_default_na=False, encoding=encoding, encoding_errors="replace", engine="c")
+        if nrows is None or len(frame) == nrows:
+            return frame
+        logger.debug(f"Parsing with the csv module, pandas found {len(frame)} of {nrows} rows.")
+    except (ValueError, pd.errors.ParserError) as e:
+        logger.debug(f"Parsing with the csv module, pandas could not: {e}")
+    rows = list(csv.reader(io.StringIO(data.decode(encoding, errors="replace"), newline=""), dialect))
+    return pd.DataFrame({column: [row[column] if column < len(row) else "" for row in rows] for column in columns})
+
+
+class RowFilter:
+    """LineScanner consumer which collects the rows matching each of a set of predicates.
+
+    Only the columns the predicates use are parsed, by pandas a chunk at a time and with the
+    types inferred for the whole file, so that every chunk is compared alike. Rows before
+    firstline, the header, never match. matches holds the row numbers per predicate.
+    """
+
+    def __init__(self, predicates, dialect, dtypes, firstline=0, encoding="utf-8", token=None):
+        if pd is None:
+            raise ImportError("Filtering needs the pandas package.")
+        self.predicates = list(predicates)
+        self.dialect = dialect or csv.excel
+        self.dtypes = list(dtypes or [])
+        self.firstline = firstline
+        self.encoding = encoding
+        self.token = token
+        self.columns = sorted({predicate.column for predicate in self.predicates})
+        self.ncolumns = max(len(self.dtypes), self.columns[-1] + 1) if self.columns else 0
+        self._found = [[] for _ in self.predicates]
+
+    def _dtype(self, column):
+        return self.dtypes[column] if column < len(self.dtypes) else "str"
+
+    def feed(self, chunk, position, firstline, newlines):
+        data = bytes(chunk)
+        nrows = len(newlines) + (1 if data and not data.endswith(b"\n") else 0)
+        frame = read_columns(data, self.columns, self.ncolumns, self.dialect, self.encoding, nrows)
+        skip = max(self.firstline - firstline, 0)
+        for predicate, found in zip(self.predicates, self._found):
+            if self.token is not None:
+                self.token.check()
+            mask = evaluate(predicate, frame[predicate.column], self._dtype(predicate.column))
+            found.append(np.flatnonzero(mask[skip:]).astype(np.uint64) + np.uint64(firstline + skip))
+
+    @property
+    def matches(self):
+        return [np.concatenate(found) if found else np.zeros(0, dtype=np.uint64) for found in self._found]
+
+
+def filter_rows(filename, predicates, dialect, dtypes, firstline=0, encoding="utf-8", records=None, token=None,
+                progress=None):
+    """Row numbers matching each predicate over the whole file, lines or, given their index, records"""
+    rowfilter = RowFilter(predicates, dialect, dtypes, firstline=firstline, encoding=encoding, token=token)
+    if records is None:
+        LineScanner(filename, consumers=[rowfilter], token=token, progress=progress).run()
+    else:
+        feed_records(filename, records, rowfilter, token=token, progress=progress)
+    return rowfilter.matches
+
+
+def filter_columnar(columnar, predicates, dtypes, token=None, progress=None):
+    """Row numbers of a ColumnarFile matching each predicate, a row group at a time"""
+    if pd is None:
+        raise ImportError("Filtering needs the pandas package.")
+    found = [[] for _ in predicates]
+    for group in range(columnar.groups):
+        for predicate, rows in zip(predicates, found):
+            if token is not None:
+                token.check()
+            values = pd.Series(columnar.group(group, predicate.column).to_pandas())
+            mask = evaluate(predicate, values, dtypes[predicate.column])
+            rows.append(np.flatnonzero(mask).astype(np.uint64) + np.uint64(columnar.starts[group]))
+        if progress is not None:
+            progress(group + 1, columnar.groups)
+    return [np.concatenate(rows) if rows else np.zeros(0, dtype=np.uint64) for rows in found]
+
@@ -0,0 +1,158 @@
+import csv
+import logging
+import re
+from collections import Counter
+from io import StringIO
+
+logger = logging.getLogger(__name__)
+
+DELIMITERS = [",", "\t", ";", "|", "~"]
+INT = re.compile(r"[+-]?\d+")
+FLOAT = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?(nan|inf|infinity)", re.IGNORECASE)
+NUMERIC = ("int64", "float64")
+
+
+def sample_text(source, samples=3, samplesize=64 * 1024):
+    """Whole lines of text from the head, the middle and the tail of a ByteSource.
+
+    Only the head of a compressed file is sampled, getting further into it means decompressing everything before.
+    """
+    size = source.size
+    if source.compressed or size is None or size <= samplesize * samples:
+        offsets = [0]
+    else:
+        offsets = [(size - samplesize) * n // (samples - 1) for n in range(samples)]
+    texts = []
+    for offset in offsets:
+        data = source.read(offset, samplesize)
+        if offset:  # most likely in the middle of a line
+            data = data[data.find(b"\n") + 1:]
+        if offset + samplesize < (size or 0) or source.compressed and len(data) == samplesize:
+            data = data[:data.rfind(b"\n") + 1]  # cut off in the middle of a line
+        texts.append(data.decode(source.encoding, errors="replace"))
+    return texts
+
+
+def parse_rows(texts, dialect):
+    """Fields of each of a list of texts, a line or a record apiece, exactly one row per text.
+
+    One reader parses them all unless a quote left open runs on into the texts after it, or a
+    field is too large for the csv module. Then each text is parsed on its own, and one which
+    cannot be is a row of a single field, the text itself.
+    """
+    try:
+        rows = list(csv.reader(texts, dialect))
+        if len(rows) == len(texts):
+            return rows
+    except csv.Error:
+        pass
+    return [_parse_row(text, dialect) for text in texts]
+
+
+def _parse_row(text, dialect):
+    try:
+        return next(csv.reader([text], dialect), [])
+    except csv.Error:
+        return [text]
+
+
+def _rows(texts, dialect):
+    rows = []
+    for text in texts:
+        rows.append([row for row in csv.reader(StringIO(text, newline=""), dialect) if row])
+    return rows
+
+
+def _aligned(text, dialect, columns):
+    """Rows of columns fields of a sample from inside the file, which may start inside a quoted field"""
+    best = []
+    for start in ("", dialect.quotechar or ""):
+        rows = [row for row in csv.reader(StringIO(start + text, newline=""), dialect) if len(row) == columns]
+        if len(rows) > len(best):
+            best = rows
+    return best[1:]  # the first one is most likely cut
+
+
+def _consistency(texts, dialect):
+    """Share of the sampled rows with the most common number of fields, and that number"""
+    try:
+        counts = Counter(len(row) for rows in _rows(texts, dialect) for row in rows)
+    except csv.Error:
+        return 0, 0
+    if not counts:
+        return 0, 0
+    fields, count = counts.most_common(1)[0]
+    return (count / sum(counts.values()), fields) if fields >= 2 else (0, 0)
+
+
+def infer_dialect(texts):
+    """Dialect which splits the lines of every sample into the same number of fields most consistently.
+
+    The sniffer only contributes the quote character, its guess of doubled quotes is checked
+    against the samples like the delimiter.
+    """
+    candidates = [type("sniffed", (csv.excel,), {"delimiter": delimiter}) for delimiter in DELIMITERS]
+    scores = [_consistency(texts, dialect) for dialect in candidates]
+    if max(scores) == (0, 0):  # a single column
+        return csv.excel
+    delimiter = candidates[scores.index(max(scores))].delimiter
+
+    attrs = {"delimiter": delimiter}
+    try:
+        sniffed = csv.Sniffer().sniff(texts[0][:64 * 1024], delimiters=[delimiter])
+        attrs.update(quotechar=sniffed.quotechar, skipinitialspace=sniffed.skipinitialspace)
+    except csv.Error:
+        pass
+    variants = [type("sniffed", (csv.excel,), dict(attrs, doublequote=doublequote)) for doublequote in (True, False)]
+    return max(variants, key=lambda dialect: _consistency(texts, dialect))
+
+
+def infer_dtype(values):
+    """int64, float64 or str for the values of a column, empty values are nulls"""
+    values = [value.strip() for value in values]
+    values = [value for value in values if value]
+    if not values:
+        return "str"
+    if all(INT.fullmatch(value) for value in values):
+        return "int64"
+    if all(FLOAT.fullmatch(value) for value in values):
+        return "float64"
+    return "str"
+
+
+def infer_schema(source):
+    """Dialect, header and column types of a delimited file, from samples spread over it.
+
+    Returns the file properties as a dict: dialect, has_header, header (the fields of the
+    first line, whether it is a header or not) and dtypes, one per column.
+    """
+    texts = sample_text(source)
+    dialect = infer_dialect(texts)
+    logger.debug(f"Delimiter is {dialect.delimiter!r}")
+    samples = _rows(texts, dialect)
+    head = samples[0]
+    if not head:
+        return {"dialect": dialect, "has_header": False, "header": [], "dtypes": []}
+
+    first = head[0]
+    columns = len(first)
+    rows = [row for row in head[1:] if len(row) == columns]
+    for text in texts[1:]:
+        rows.extend(_aligned(text, dialect, columns))
+    dtypes = [infer_dtype([row[n] for row in rows]) for n in range(columns)]
+
+    if any(dtype in NUMERIC for dtype in dtypes):
+        # a header names the numeric columns with something that is no number
+        has_header = any(dtype in NUMERIC and infer_dtype([first[n]]) == "str" and first[n].strip()
+                         for n, dtype in enumerate(dtypes))
+    else:
+        try:
+            has_header = csv.Sniffer().has_header("\n".join(texts[0].splitlines()[:50]))
+        except csv.Error:
+            has_header = False
+    if not has_header:  # the first line holds data too
+        dtypes = [infer_dtype([first[n]] + [row[n] for row in rows]) for n in range(columns)]
+    if columns < 2:
+        logger.warning("Header is likely not properly separated.")
+    logger.debug(f"Has header: {has_header}, columns {list(zip(first, dtypes))}")
+    return {"dialect": dialect, "has_header": has_header, "header": first, "dtypes": dtypes}
@@ -0,0 +1,419 @@
+import logging
+import os
+import re
+import shutil
+import string
+import tempfile
+from array import array
+from collections import defaultdict
+from bisect import bisect_left
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# bytes above 0x7f are kept so that utf-8 encoded words are not torn apart
+TERM = re.compile(rb"(?:[\w'\-\[]|[\x80-\xff])+")
+SEPARATOR = rb"[^\w'\-\[\x80-\xff]+"
+QUERY = re.compile(r'"([^"]*)"|(\S+)')
+# the bytes TERM matches, to find the terms of a chunk with numpy
+TERMBYTES = np.zeros(256, dtype=bool)
+TERMBYTES[list((string.ascii_letters + string.digits + "_'-[").encode())] = True
+TERMBYTES[0x80:] = True
+
+
+def _varints(gaps):
+    """Varint bytes of gaps, and the number of bytes of each"""
+    nbytes = np.ones(len(gaps), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        nbytes += gaps >= (np.uint64(1) << np.uint64(shift))
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max(initial=0))):
+        mask = nbytes > k
+        byte = (gaps[mask] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = byte | more
+    return out, nbytes
+
+
+def _unvarints(data):
+    """Values of the varints in the uint8 array data"""
+    last = data < 0x80
+    value = np.cumsum(last) - last  # which value every byte belongs to
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    position = np.arange(len(data)) - starts[value]
+    gaps = np.zeros(len(starts), dtype=np.uint64)
+    for k in range(int(position.max(initial=-1)) + 1):
+        mask = position == k
+        gaps[value[mask]] |= (data[mask] & 0x7f).astype(np.uint64) << np.uint64(7 * k)
+    return gaps
+
+
+def encode(values):
+    """Varint encode the gaps between sorted line numbers"""
+    if len(values) < 32:  # most terms are rare, numpy does not pay off for them
+        out = bytearray()
+        previous = 0
+        for value in values:
+            gap, previous = value - previous, value
+            while gap >= 0x80:
+                out.append(gap & 0x7f | 0x80)
+                gap >>= 7
+            out.append(gap)
+        return bytes(out)
+
+    values = np.asarray(values, dtype=np.uint64)
+    return _varints(np.diff(values, prepend=np.uint64(0)))[0].tobytes()
+
+
+def decode(data):
+    """Line numbers from a varint encoded posting list"""
+    if len(data) < 64:
+        values = []
+        value = shift = 0
+        for byte in bytes(data):
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                values.append(value)
+                value = shift = 0
+        return np.cumsum(np.array(values, dtype=np.uint64), dtype=np.uint64)
+
+    return np.cumsum(_unvarints(np.frombuffer(data, dtype=np.uint8)), dtype=np.uint64)
+
+
+def encode_lists(values, counts):
+    """Encode many posting lists at once, like encode each.
+
+    values holds the sorted line numbers of every list one after the other, counts how
+    many belong to each. Returns the encoded bytes and the offset of the end of every list in them.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    counts = np.asarray(counts, dtype=np.int64)
+    firsts = (np.cumsum(counts) - counts)[counts > 0]
+    gaps = np.diff(values, prepend=np.uint64(0))
+    gaps[firsts] = values[firsts]  # every list starts from 0
+    out, nbytes = _varints(gaps)
+    return out, np.concatenate(([0], np.cumsum(nbytes)))[np.cumsum(counts)].astype(np.uint64)
+
+
+def decode_lists(data, ends):
+    """The values and counts encode_lists took, from its bytes and the list ends in them"""
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = np.asarray(ends, dtype=np.int64)
+    gaps = _unvarints(data)
+    valueends = np.concatenate(([0], np.cumsum(data < 0x80)))[ends]
+    counts = np.diff(valueends, prepend=0)
+    totals = np.cumsum(gaps, dtype=np.uint64)
+    before = np.concatenate(([np.uint64(0)], totals))[valueends - counts]
+    return totals - np.repeat(before, counts), counts
+
+
+def _columns(keys):
+    """uint64 columns sorting like the bytes of keys, for np.lexsort, whose last key sorts first"""
+    length = keys.dtype.itemsize
+    width = -(-length // 8) * 8
+    data = np.zeros((len(keys), width), dtype=np.uint8)
+    data[:, :length] = keys.view(np.uint8).reshape(len(keys), length)
+    columns = data.view(">u8")
+    return [columns[:, k].astype(np.uint64) for k in reversed(range(width // 8))]
+
+
+def group_postings(keys, values, counts=None):
+    """Sorted unique keys with their posting lists, as encode_lists takes them.
+
+    keys is an array of terms of one length as np.void, counts[n] of the values belong to
+    keys[n], one each without counts. The values of equal keys stay in their order and have
+    to be ascending along it, repeated values are dropped.
+    """
+    columns = _columns(keys)
+    order = np.lexsort(columns)  # stable
+    first = np.ones(len(keys), dtype=bool)
+    for column in columns:
+        column = column[order]
+        first[1:] &= column[1:] == column[:-1]
+    first[1:] = ~first[1:]
+    unique = keys[order[first]]
+    inverse = np.cumsum(first) - 1  # number of the unique key of each key in order
+    if counts is None:
+        values, owners = values[order], inverse
+    else:
+        counts = np.asarray(counts, dtype=np.int64)
+        starts = (np.cumsum(counts) - counts)[order]
+        counts = counts[order]
+        values = values[np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())]
+        owners = np.repeat(inverse, counts)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = (owners[1:] != owners[:-1]) | (values[1:] != values[:-1])
+    return unique, values[keep], np.bincount(owners[keep], minlength=len(unique))
+
+
+class IndexWriter:
+    """Write the files of an InvertedIndex in directory, a batch of terms in sorted order at a time"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.termfile = open(os.path.join(directory, "terms.bin"), "wb")
+        self.postingfile = open(os.path.join(directory, "postings.bin"), "wb")
+        self.termoffsets = [np.zeros(1, dtype=np.uint64)]
+        self.postingoffsets = [np.zeros(1, dtype=np.uint64)]
+        self.terms = 0
+
+    def write(self, keys, values, counts):
+        """Add keys, terms of one length as np.void, with their posting lists as encode_lists takes them"""
+        data, ends = encode_lists(values, counts)
+        length = np.uint64(keys.dtype.itemsize)
+        self.termoffsets.append(self.termoffsets[-1][-1] + length * np.arange(1, len(keys) + 1, dtype=np.uint64))
+        self.postingoffsets.append(self.postingoffsets[-1][-1] + ends)
+        self.termfile.write(keys.tobytes())
+        self.postingfile.write(data.tobytes())
+        self.terms += len(keys)
+
+    def close(self):
+        self.termfile.close()
+        self.postingfile.close()
+        np.save(os.path.join(self.directory, "terms.npy"), np.concatenate(self.termoffsets))
+        np.save(os.path.join(self.directory, "postings.npy"), np.concatenate(self.postingoffsets))
+
+
+class SearchIndexer:
+    """Build an inverted index of the terms in the chunks of a LineScanner.
+
+    The terms of a chunk are found with numpy and kept, one array per term length, with
+    the line of each. Whenever they exceed budget bytes they are grouped into posting lists
+    and written out as a segment, an InvertedIndex of the lines so far. finish merges the
+    segments into an InvertedIndex in directory.
+    With an existing index the postings are added to its in memory part instead, which
+    is how lines appended to a followed file become searchable. A cancelled token stops
+    the merge of finish.
+    """
+
+    STEP = 4 * 1024 ** 2
+    BATCH = 1024 ** 2  # terms merged at a time
+
+    def __init__(self, directory=None, budget=256 * 1024 ** 2, index=None, token=None):
+        self.directory = directory
+        self.budget = budget
+        self.index = index
+        self.token = token
+        self.tokens = defaultdict(list)  # term length: [(terms as np.void, their lines), ...]
+        self.segments = []
+        self._size = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def feed(self, chunk, position, firstline, newlines):
+        # a slice of lines at a time, so that a cancelled token is noticed within a fraction of a second
+        start = line = 0
+        while start < len(chunk):
+            if self.token is not None:
+                self.token.check()
+            last = int(np.searchsorted(newlines, start + self.STEP))
+            end = int(newlines[last]) + 1 if last < len(newlines) else len(chunk)
+            self._feed(chunk[start:end], firstline + line, newlines[line:last + 1] - start)
+            start, line = end, last + 1
+
+    def _feed(self, chunk, firstline, newlines):
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        edges = np.flatnonzero(np.diff(TERMBYTES[data].view(np.int8), prepend=0, append=0))
+        if not len(edges):
+            return
+        starts, lengths = edges[0::2], edges[1::2] - edges[0::2]
+        linenumbers = np.searchsorted(newlines, starts).astype(np.uint64) + np.uint64(firstline)
+        for length in np.unique(lengths).tolist():
+            which = lengths == length
+            keys = data[starts[which, None] + np.arange(length)].view(np.dtype((np.void, length))).ravel()
+            if self.index is None:
+                self.tokens[length].append((keys, linenumbers[which]))
+                self._size += keys.nbytes + 8 * len(keys)
+            else:
+                self._add_pending(*group_postings(keys, linenumbers[which]))
+        if self._size > self.budget:
+            self.spill()
+
+    def _add_pending(self, keys, values, counts):
+        pending = self.index.pending
+        ends = np.cumsum(counts).tolist()
+        for term, begin, end in zip(keys.tolist(), [0] + ends[:-1], ends):
+            found = pending.get(term)
+            if found is None:
+                found = pending[term] = array("Q")
+            elif found and found[-1] == values[begin]:  # a line scanned again by scan_tail
+                begin += 1
+            found.frombytes(values[begin:end].tobytes())
+
+    def spill(self):
+        """Write the terms collected so far to a segment"""
+        path = tempfile.mkdtemp(prefix="segment-", dir=self.directory)
+        writer = IndexWriter(path)
+        for length in sorted(self.tokens):
+            found = self.tokens[length]
+            writer.write(*group_postings(np.concatenate([keys for keys, _ in found]),
+                                         np.concatenate([lines for _, lines in found])))
+        writer.close()
+        self.segments.append(path)
+        logger.debug(f"Wrote search index segment {len(self.segments)} with {writer.terms} terms")
+        self.tokens = defaultdict(list)
+        self._size = 0
+
+    def finish(self):
+        """Merge all segments into the InvertedIndex in directory"""
+        self.spill()
+        if len(self.segments) == 1:
+            for name in os.listdir(self.segments[0]):
+                os.replace(os.path.join(self.segments[0], name), os.path.join(self.directory, name))
+        else:
+            self._merge()
+        for path in self.segments:
+            shutil.rmtree(path)
+        self.segments = []
+        index = InvertedIndex(self.directory)
+        logger.debug(f"Search index has {len(index)} terms.")
+        return index
+
+    def _merge(self):
+        """Merge the segments a term length and at most BATCH terms at a time, earlier segments first"""
+        segments = [InvertedIndex(path) for path in self.segments]
+        writer = IndexWriter(self.directory)
+        lengths = [np.diff(segment._termoffsets).astype(np.int64) for segment in segments]
+        for length in np.unique(np.concatenate(lengths)).tolist():
+            ranges = [(int(np.searchsorted(found, length)), int(np.searchsorted(found, length, side="right")))
+                      for found in lengths]
+            keys = [segment.keys(*span, length) for segment, span in zip(segments, ranges)]
+            largest = max(keys, key=len)
+            splits = [largest[n] for n in range(self.BATCH, len(largest), self.BATCH)]
+            begins = [0] * len(segments)
+            for split in splits + [None]:
+                if self.token is not None:
+                    self.token.check()
+                batch, values, counts = [], [], []
+                for n, (segment, (first, _)) in enumerate(zip(segments, ranges)):
+                    end = len(keys[n]) if split is None else int(np.searchsorted(keys[n], split))
+                    batch.append(keys[n][begins[n]:end])
+                    found, found_counts = segment.postings(first + begins[n], first + end)
+                    values.append(found)
+                    counts.append(found_counts)
+                    begins[n] = end
+                writer.write(*group_postings(np.concatenate(batch), np.concatenate(values), np.concatenate(counts)))
+        writer.close()
+        for segment in segments:
+            segment.close()
+
+
+class InvertedIndex:
+    """Term dictionary with a varint delta encoded list of line numbers per term.
+
+    Terms are sorted by length and then by their bytes, so that the terms of one length can
+    be handled as one numpy array.
+    Everything lives in memory mapped files in directory, plus the pending postings of
+    lines indexed after the files were written. Terms are bytes, text queries are encoded
+    with the encoding of the indexed file.
+    """
+
+    encoding = "utf-8"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = {}
+        self._open()
+
+    def _open(self):
+        self._termoffsets = np.load(os.path.join(self.directory, "terms.npy"), mmap_mode="r")
+        self._postingoffsets = np.load(os.path.join(self.directory, "postings.npy"), mmap_mode="r")
+        self._terms = self._map("terms.bin")
+        self._postings = self._map("postings.bin")
+
+    def _map(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.getsize(path):
+            return b""
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def close(self):
+        self._termoffsets = self._postingoffsets = self._terms = self._postings = None
+
+    def move(self, directory):
+        """Move the files of the index to directory"""
+        self.close()
+        shutil.move(self.directory, directory)
+        self.directory = directory
+        self._open()
+
+    def __len__(self):
+        return len(self._termoffsets) - 1
+
+    def __repr__(self):
+        return f"<InvertedIndex {len(self)} terms>"
+
+    def term(self, n):
+        return bytes(self._terms[self._termoffsets[n]:self._termoffsets[n + 1]])
+
+    def _key(self, n):
+        return int(self._termoffsets[n + 1] - self._termoffsets[n]), self.term(n)
+
+    def _find(self, term):
+        n = bisect_left(range(len(self)), (len(term), term), key=self._key)
+        if n < len(self) and self.term(n) == term:
+            return n
+        return None
+
+    def keys(self, start, stop, length):
+        """Terms start to stop, which have to be length bytes long, as an array of np.void"""
+        begin, end = int(self._termoffsets[start]), int(self._termoffsets[stop])
+        data = np.frombuffer(self._terms, dtype=np.uint8, count=end - begin, offset=begin)
+        return data.view(np.dtype((np.void, length)))
+
+    def postings(self, start, stop):
+        """Line numbers of the terms start to stop one after the other, and how many belong to each"""
+        offsets = self._postingoffsets[start:stop + 1].astype(np.int64)
+        if len(offsets) < 2:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+        return decode_lists(self._postings[offsets[0]:offsets[-1]], offsets[1:] - offsets[0])
+
+    def lines(self, term):
+        """Sorted line numbers of every line containing term"""
+        if isinstance(term, str):
+            term = term.encode(self.encoding, errors="replace")
+        found = []
+        n = self._find(term)
+        if n is not None:
+            found.append(decode(self._postings[self._postingoffsets[n]:self._postingoffsets[n + 1]]))
+        if term in self.pending:
+            found.append(np.frombuffer(self.pending[term], dtype=np.uint64))
+        if not found:
+            return np.zeros(0, dtype=np.uint64)
+        return np.unique(np.concatenate(found))
+
+    def phrase(self, text, fetch=None):
+        """Lines containing the terms of text next to each other, fetch(line, 1) gives the text to verify"""
+        terms = TERM.findall(text.encode(self.encoding, errors="replace"))
+        if not terms:
+            return np.zeros(0, dtype=np.uint64)
+        candidates = self.lines(terms[0])
+        for term in terms[1:]:
+            candidates = np.intersect1d(candidates, self.lines(term), assume_unique=True)
+        if fetch is None or len(terms) == 1:
+            return candidates
+
+        pattern = re.compile(rb"(?<![\w'\-\[\x80-\xff])" + SEPARATOR.join(map(re.escape, terms)) +
+                             rb"(?![\w'\-\[\x80-\xff])")
+        return np.array([ln for ln in candidates.tolist()
+                         if pattern.search("".join(fetch(ln, 1)).encode(self.encoding, errors="replace"))], dtype=np.uint64)
+
+    def query(self, text, fetch=None):
+        """Lines matching text: terms must all occur, "quoted terms" as a phrase and OR joins alternatives.
+
+        Terms are cut into words as the lines were, a term like status=FAILED is the phrase of its words.
+        """
+        result = np.zeros(0, dtype=np.uint64)
+        for alternative in re.split(r"\s+OR\s+", text.strip()):
+            matched = None
+            for phrase, term in QUERY.findall(alternative):
+                if not phrase and not TERM.search(term.encode(self.encoding, errors="replace")):
+                    continue  # punctuation alone is in no index
+                lines = self.phrase(phrase or term, fetch)
+                matched = lines if matched is None else np.intersect1d(matched, lines, assume_unique=True)
+            if matched is not None:
+                result = np.union1d(result, matched)
+        return result
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class SearchResults:
+    """Line numbers of the hits of a search, kept sorted in a growing uint64 array.
+
+    Hits can be added in batches while a search is still running.
+    """
+
+    def __init__(self, lines=None):
+        self._lines = np.empty(1024, dtype=np.uint64)
+        self._count = 0
+        if lines is not None:
+            self.add(lines)
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return f"<SearchResults {self._count} hits>"
+
+    @property
+    def lines(self):
+        return self._lines[:self._count]
+
+    def add(self, lines):
+        lines = np.asarray(lines, dtype=np.uint64)
+        if not len(lines):
+            return
+        inorder = not self._count or lines[0] > self._lines[self._count - 1]
+        needed = self._count + len(lines)
+        if needed > len(self._lines):
+            grown = np.empty(max(needed, 2 * len(self._lines)), dtype=np.uint64)
+            grown[:self._count] = self._lines[:self._count]
+            self._lines = grown
+        self._lines[self._count:needed] = lines
+        self._count = needed
+        if not inorder:  # batches usually arrive in file order, sort only when they do not
+            merged = np.unique(self._lines[:needed])
+            self._count = len(merged)
+            self._lines[:self._count] = merged
+
+    def __contains__(self, linenumber):
+        lines = self.lines
+        n = int(np.searchsorted(lines, linenumber))
+        return n < len(lines) and lines[n] == linenumber
+
+    def position(self, linenumber):
+        """How many hits come before linenumber"""
+        return int(np.searchsorted(self.lines, linenumber))
+
+    def next(self, linenumber):
+        """First hit after linenumber, None if there is none"""
+        lines = self.lines
+        n = int(np.searchsorted(lines, linenumber, side="right"))
+        return int(lines[n]) if n < len(lines) else None
+
+    def previous(self, linenumber):
+        """Last hit before linenumber, None if there is none"""
+        lines = self.lines
+        n = int(np.searchsorted(lines, linenumber, side="left"))
+        return int(lines[n - 1]) if n else None
+
+    def density(self, bins, linecount):
+        """Number of hits in each of bins equal slices of linecount lines"""
+        if not linecount:
+            return np.zeros(bins, dtype=np.int64)
+        slices = (self.lines.astype(np.float64) * bins / linecount).astype(np.int64)
+        return np.bincount(np.minimum(slices, bins - 1), minlength=bins)
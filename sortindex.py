@@ -0,0 +1,181 @@
+import csv
+import heapq
+import itertools
+import logging
+import math
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from lineindex import LineScanner, NEWLINE
+from recordindex import feed_records
+from schema import parse_rows
+
+logger = logging.getLogger(__name__)
+
+
+class KeyExtractor:
+    """LineScanner consumer which collects one column of a delimited file in sorted runs.
+
+    Whenever the keys held exceed budget bytes they are sorted and spilled to a run file.
+    Keys are floats if numeric, strings otherwise. numeric is taken from the first chunk if it is None.
+    """
+
+    BATCH = 65536
+
+    def __init__(self, column, dialect, firstline=0, numeric=None, budget=256 * 1024 ** 2, tmpdir=None,
+                 encoding="utf-8", token=None):
+        self.column = column
+        self.dialect = dialect or csv.excel
+        self.firstline = firstline
+        self.budget = budget
+        self.tmpdir = tmpdir
+        self.encoding = encoding
+        self.token = token
+        self.numeric = numeric
+        self.count = 0
+        self.runs = []  # paths of spilled runs
+        self._keys = []
+        self._lines = []
+        self._size = 0
+
+    def _parse(self, key):
+        if not self.numeric:
+            return key
+        try:
+            return float(key)
+        except ValueError:
+            return math.nan
+
+    def feed(self, chunk, position, firstline, newlines):
+        skip = max(self.firstline - firstline, 0)
+        rows = parse_rows(_row_texts(chunk, newlines, self.encoding)[skip:], self.dialect)
+        keys = [row[self.column] if len(row) > self.column else "" for row in rows]
+        if self.numeric is None and keys:
+            try:
+                [float(k) for k in keys if k]
+                self.numeric = True
+            except ValueError:
+                self.numeric = False
+
+        self._keys.extend(self._parse(k) for k in keys)
+        self._lines.extend(range(firstline + skip, firstline + skip + len(keys)))
+        self.count += len(keys)
+        self._size += 16 * len(keys) if self.numeric else sum(len(k) + 64 for k in keys)
+        if self._size > self.budget:
+            self.spill()
+
+    def _sorted(self):
+        """Line numbers and keys of the collected run in key order, nan last"""
+        if self.numeric:
+            keys = np.array(self._keys, dtype=np.float64)
+            order = np.argsort(keys, kind="stable")
+            return np.array(self._lines, dtype=np.uint64)[order], keys[order]
+        order = sorted(range(len(self._keys)), key=self._keys.__getitem__)
+        lines = np.array(self._lines, dtype=np.uint64)[order]
+        return lines, [self._keys[i] for i in order]
+
+    def spill(self):
+        lines, keys = self._sorted()
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.tmpdir)
+        with os.fdopen(fd, "wb") as runfile:
+            for start in range(0, len(lines), self.BATCH):
+                batch = (keys[start:start + self.BATCH], lines[start:start + self.BATCH])
+                pickle.dump(batch, runfile, protocol=pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        logger.debug(f"Spilled sort run {len(self.runs)} of {len(lines)} keys to {path}")
+        self._keys, self._lines, self._size = [], [], 0
+
+    def _read(self, path):
+        with open(path, "rb") as runfile:
+            while True:
+                try:
+                    keys, lines = pickle.load(runfile)
+                except EOFError:
+                    return
+                yield from zip(self._order(keys), lines.tolist())
+
+    def _order(self, keys):
+        if self.numeric:  # nan compares false with everything, sort it after every number
+            return [(k != k, k) for k in keys.tolist()]
+        return keys
+
+    def permutation(self, out=None):
+        """Line numbers in key order, written to the .npy file out if given"""
+        result = np.lib.format.open_memmap(out, mode="w+", dtype=np.uint64, shape=(self.count,)) if out \
+            else np.empty(self.count, dtype=np.uint64)
+        if not self.runs:
+            result[:] = self._sorted()[0]
+            return result
+
+        if self._keys:
+            self.spill()
+        try:
+            merged = heapq.merge(*(self._read(path) for path in self.runs), key=lambda pair: pair[0])
+            position = 0
+            while True:
+                if self.token is not None:
+                    self.token.check()
+                batch = [line for _, line in itertools.islice(merged, self.BATCH)]
+                if not batch:
+                    break
+                result[position:position + len(batch)] = batch
+                position += len(batch)
+        finally:
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+        return result
+
+
+def _row_texts(chunk, newlines, encoding):
+    """Text of each row of a chunk as LineScanner and feed_records pass it, a row ends at each of newlines"""
+    data = bytes(chunk)
+    lines = data.decode(encoding, errors="replace").split("\n")
+    if not lines[-1]:
+        lines.pop()
+    allnewlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == NEWLINE)
+    if len(allnewlines) == len(newlines):  # every line is a row
+        return lines
+    texts, start = [], 0
+    for end in np.searchsorted(allnewlines, newlines).tolist():  # records hold newlines in quoted fields
+        texts.append("\n".join(lines[start:end + 1]))
+        start = end + 1
+    if start < len(lines):
+        texts.append("\n".join(lines[start:]))
+    return texts
+
+
+def sort_permutation(filename, column, dialect, firstline=0, numeric=None, budget=256 * 1024 ** 2, out=None,
+                     tmpdir=None, encoding="utf-8", records=None, token=None, progress=None):
+    """Line numbers of a delimited file ordered by the values of column, using at most about budget bytes.
+
+    Given the LineIndex of its records, the file is read record by record and they are numbered instead.
+    """
+    extractor = KeyExtractor(column, dialect, firstline=firstline, numeric=numeric, budget=budget, tmpdir=tmpdir,
+                             encoding=encoding, token=token)
+    try:
+        if records is None:
+            LineScanner(filename, consumers=[extractor], token=token, progress=progress).run()
+        else:
+            feed_records(filename, records, extractor, token=token, progress=progress)
+    except BaseException:
+        for path in extractor.runs:
+            os.remove(path)
+        raise
+    if out is None:
+        return extractor.permutation()
+
+    # a permutation which is cut short must never be picked up as the cached sort
+    tmp = f"{out}.tmp"
+    try:
+        permutation = extractor.permutation(tmp)
+        permutation.flush()
+        del permutation
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, out)
+    return np.load(out, mmap_mode="r")
@@ -1,20 +1,38 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import pyqtSignal
 
 import logging
 from pathlib import Path
 import os
-from functools import lru_cache
 
-from PandasModel import PandasModel
-import pandas as pd
+from FileTableModel import FileTableModel
+from ColumnarTableModel import ColumnarTableModel
+from LineView import LineView
+from lineindex import Chunk, LineIndex, LineScanner, scan_tail, sample_lines, estimate_linecount
+from indexcache import IndexCache, dialect_to_dict
+from largefile import LargeFile
+from chunkcache import ChunkCache
+from columnar import ColumnarError, open_columnar
+from schema import NUMERIC
+from recordindex import complete_end, index_records, record_quote, scan_tail_records
+from rowfilter import parse_filter, filter_rows, filter_columnar, FilterError
+from colstats import TableStats, column_stats, columnar_stats, stats_range
+from searchindex import SearchIndexer
+from sortindex import sort_permutation
+from jobs import JobScheduler, HIGH, NORMAL, LOW
+from searchresults import SearchResults
+from HitMap import HitMap
+from StatsPane import StatsPane
+from DiffView import DiffView
+from MetricsPanel import MetricsPanel
+from metrics import METRICS
 import csv
-from io import StringIO
-import re
+from collections import OrderedDict
 from functools import partial
+from io import StringIO
+
+import numpy as np
 
-FORMAT = '%(asctime)s - %(name)20s - %(funcName)20s - %(levelname)8s - %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=FORMAT)
 logger = logging.getLogger(__name__)
 
 
@@ -26,22 +44,50 @@ class Widget(QtWidgets.QWidget):
         self.initUI()
 
         self.chunksize = 2 * 1024 ** 2
-        self.linechunk = 10000
-        self.linenumseparator = '\t'
-
-        self.file_index_thread = FileIndex(filename='', linechunk=self.linechunk)
-        self.file_index_thread.signal.connect(self._file_index)
 
-        self.line_count_thread = LineCount(filename='')
-        self.line_count_thread.signal.connect(self._total_lines)
-
-        self.search_index_thread = SearchIndex(filename='')
-        self.search_index_thread.signal.connect(self._search_index)
+        self.jobevents = JobEvents(self)
+        self.jobs = JobScheduler(workers=3, dispatch=self.jobevents.dispatch)
+        self.scanjob = None
+        self.searchjob = None
+        self.followjob = None
+        self.grepjob = None
+        self.sortjob = None
+        self.recordjob = None
+        self.filterjob = None
+        self.statsjob = None
+        # (jobs, files) of files left while their jobs were still running, closed once the jobs stop
+        self.closing = []
+
+        self.followTimer = QtCore.QTimer(self)
+        self.followTimer.setInterval(1000)
+        self.followTimer.timeout.connect(self._follow_tick)
+
+        self.progressTimer = QtCore.QTimer(self)
+        self.progressTimer.setInterval(200)
+        self.progressTimer.timeout.connect(self._show_progress)
+        self.progressTimer.start()
+
+        self.sortbudget = 256 * 1024 ** 2
+
+        # recently shown blocks of the files, the neighbours of what is shown are read ahead
+        self.prefetcher = JobScheduler(workers=1)
+        self.chunkcache = ChunkCache(budget=64 * 1024 ** 2, chunksize=1024 ** 2, scheduler=self.prefetcher)
+        self.metricsPanel = None
+        self.diffView = None
+        METRICS.collect("chunkcache", self._cache_metrics)
+        METRICS.collect("file", self._file_metrics)
 
         self.fileName = None
+        self.largefile = None # LargeFile the text file is read and indexed through
+        self.source = None # ByteSource of the file, decompresses compressed files
+        self.columnar = None # ColumnarFile of a Parquet or Arrow file, which is not read as text
         self.fileFormat = None
         self.filesize = None
         self.file_index = None
+        self.head_index = None #index of the first chunk, until file_index is complete
+        self.partial_index = None #index the scan is still adding lines to
+        self.record_index = None #start of every record where quoted fields span lines, None while each line is one
+        self.samples = None #average line lengths across the file, for the line count estimate
         self.filelength = None #length of file in bytes
         self.chunklines = None
         self.linesize = None
@@ -52,9 +98,19 @@ class Widget(QtWidgets.QWidget):
         self.has_header = None
         self.delimiter = None
         self.dialect = None
+        self.dtypes = None # type of every column, inferred once for the whole file
         self.currentstartline = None #row number of the current chunk
         self.searchindex = None
-        self.line_numbers = self.linesnumberCheck.isChecked
+        self.results = None # hits of the last search
+        self.tablemodel = None
+        self.sortcache = {} # permutation of the data lines per sorted column
+        self.sortorder = None
+        self.filtercache = OrderedDict() # matching rows per filter condition
+        self.filterrows = None # rows matching the current filter
+        self.colstats = None # TableStats of the columns, over the whole file
+        self.rowstats = None # TableStats of the complete rows of a text file, those before statsend
+        self.tailstats = None # TableStats of a last row which may still grow, None if it is complete
+        self.statsend = None
 
     def initUI(self):
 
@@ -108,6 +164,14 @@ class Widget(QtWidgets.QWidget):
 
         self.linesnumberCheck = QtWidgets.QCheckBox("Line Numbers")
         hLayout.addWidget(self.linesnumberCheck)
+        self.linesnumberCheck.toggled.connect(lambda checked: self.textwnd.setLineNumbers(checked))
+
+        self.followCheck = QtWidgets.QCheckBox("Follow")
+        hLayout.addWidget(self.followCheck)
+        self.followCheck.toggled.connect(self.toggleFollow)
+
+        self.tailCheck = QtWidgets.QCheckBox("Stay at end")
+        hLayout.addWidget(self.tailCheck)
 
         self.searchEdit = QtWidgets.QLineEdit(self)
         self.searchEdit.setMinimumWidth(40)
@@ -121,6 +185,23 @@ class Widget(QtWidgets.QWidget):
         self.searchBtn.clicked.connect(self.search)
         self.searchBtn.setEnabled(False)
 
+        self.regexCheck = QtWidgets.QCheckBox("Regex")
+        hLayout.addWidget(self.regexCheck)
+
+        self.prevBtn = QtWidgets.QPushButton("<", self)
+        hLayout.addWidget(self.prevBtn)
+        self.prevBtn.setMaximumWidth(25)
+        self.prevBtn.setShortcut(QtGui.QKeySequence("Shift+F3"))
+        self.prevBtn.clicked.connect(self.previousHit)
+        self.prevBtn.setEnabled(False)
+
+        self.nextBtn = QtWidgets.QPushButton(">", self)
+        hLayout.addWidget(self.nextBtn)
+        self.nextBtn.setMaximumWidth(25)
+        self.nextBtn.setShortcut(QtGui.QKeySequence("F3"))
+        self.nextBtn.clicked.connect(self.nextHit)
+        self.nextBtn.setEnabled(False)
+
         self.rawBtn = QtWidgets.QPushButton("Show as file", self)
         hLayout.addWidget(self.rawBtn)
         self.rawBtn.setCheckable(True)
@@ -138,217 +219,247 @@ class Widget(QtWidgets.QWidget):
         self.tableBtn.setMaximumWidth(80)
         self.tableBtn.setEnabled(False)
 
-        vLayout.addLayout(hLayout)
+        self.statsBtn = QtWidgets.QPushButton("Stats", self)
+        hLayout.addWidget(self.statsBtn)
+        self.statsBtn.setCheckable(True)
+        self.statsBtn.clicked.connect(self.toggleStats)
+        self.statsBtn.setMinimumWidth(50)
+        self.statsBtn.setMaximumWidth(50)
+        self.statsBtn.setEnabled(False)
+
+        self.compareBtn = QtWidgets.QPushButton("Compare", self)
+        hLayout.addWidget(self.compareBtn)
+        self.compareBtn.clicked.connect(self.compareFile)
+        self.compareBtn.setMinimumWidth(60)
+        self.compareBtn.setMaximumWidth(60)
+        self.compareBtn.setEnabled(False)
+
+        self.metricsBtn = QtWidgets.QPushButton("Metrics", self)
+        hLayout.addWidget(self.metricsBtn)
+        self.metricsBtn.clicked.connect(self.showMetrics)
+        self.metricsBtn.setMinimumWidth(60)
+        self.metricsBtn.setMaximumWidth(60)
 
-        # self.linewnd = QtWidgets.QTextEdit(self)
-        # hLayoutText.addWidget(self.linewnd)
-        # self.linewnd.setReadOnly(True)
-        # self.linewnd.setWordWrapMode(False)
-        # self.linewnd.setFont(QtGui.QFont('Courier New', 10))
-        # self.linewnd.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
-        # self.linewnd.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
-        # self.linewnd.setMaximumWidth(60)
+        vLayout.addLayout(hLayout)
 
-        self.textwnd = QtWidgets.QTextEdit(self)
+        hLayoutFilter = QtWidgets.QHBoxLayout()
+        self.filterEdit = QtWidgets.QLineEdit(self)
+        self.filterEdit.setPlaceholderText("Filter rows, e.g. status == FAILED and amount between 10, 20")
+        self.filterEdit.returnPressed.connect(self.applyFilter)
+        hLayoutFilter.addWidget(self.filterEdit)
+
+        self.filterBtn = QtWidgets.QPushButton("Filter", self)
+        hLayoutFilter.addWidget(self.filterBtn)
+        self.filterBtn.setMinimumWidth(50)
+        self.filterBtn.setMaximumWidth(50)
+        self.filterBtn.clicked.connect(self.applyFilter)
+        self.filterBtn.setEnabled(False)
+
+        self.clearFilterBtn = QtWidgets.QPushButton("Clear", self)
+        hLayoutFilter.addWidget(self.clearFilterBtn)
+        self.clearFilterBtn.setMinimumWidth(50)
+        self.clearFilterBtn.setMaximumWidth(50)
+        self.clearFilterBtn.clicked.connect(self.clearFilter)
+        self.clearFilterBtn.setEnabled(False)
+        vLayout.addLayout(hLayoutFilter)
+
+        self.textwnd = LineView(self)
         hLayoutText.addWidget(self.textwnd)
-        self.textwnd.setReadOnly(True)
-        self.textwnd.setWordWrapMode(False)
-        self.textwnd.setFont(QtGui.QFont('Courier New', 10))
-        self.textwnd.ensureCursorVisible()
-        self.textwnd.setAcceptDrops(True)
+        self.textwnd.topLineChanged.connect(self._top_line)
+
+        self.hitmap = HitMap(self)
+        hLayoutText.addWidget(self.hitmap)
+        self.hitmap.lineClicked.connect(self.loadLine)
 
         self.pandasTv = QtWidgets.QTableView(self)
         self.pandasTv.setSortingEnabled(True)
         #self.pandasTv.setFont(QtGui.QFont('Courier New', 8))
         self.pandasTv.setFont(QtGui.QFont('Arial', 8))
         self.pandasTv.setWordWrap(False)
+        self.pandasTv.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
         self.pandasTv.setMinimumWidth(0)
         self.pandasTv.setMaximumWidth(0)
 
         hLayoutText.addWidget(self.pandasTv)
 
+        self.statsPane = StatsPane(self)
+        self.statsPane.hide()
+        hLayoutText.addWidget(self.statsPane)
+
         vLayout.addLayout(hLayoutText)
 
         self.statusBar = QtWidgets.QStatusBar()
         vLayout.addWidget(self.statusBar)
 
+        self.estimateLabel = QtWidgets.QLabel(self) # line count estimate while the file is indexed
+        self.statusBar.addPermanentWidget(self.estimateLabel)
 
-    def _chunklines(self):
-        """How many lines of text are in one chunk of bytes"""
-        text = self.textwnd.toPlainText()
-        lines_in_chunk = len(text.split("\n"))
-        logger.debug("Lines in chunk: {}".format(lines_in_chunk))
-        return lines_in_chunk
+        self.progressBar = QtWidgets.QProgressBar(self)
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.setRange(0, 1000)
+        self.progressBar.hide()
+        self.statusBar.addPermanentWidget(self.progressBar)
 
-    def _filelength(self):
-        """How many bytes is the file long"""
-        with open(self.fileName, 'rb') as f:
-            f.seek(0, 2)  # move to end of file
-            length = f.tell()  # get current position
-        return length
-
-    def _line_numbers(self, text, linestart=0, return_as_text=True):
-        lineno = [n + linestart for n, _ in enumerate(text.split('\n'))]
-        if return_as_text:
-            strlines = [str(x) for x in lineno]
-            lines = '\n'.join(strlines)
-            return lines
-        else:
-            return lineno
 
-    def _add_line_numbers(self, text, linestart=0):
-        a = [[str(n + linestart), self.linenumseparator, _] for n, _ in enumerate(text.split('\n'))]
-        c = [''.join(b) for b in a]
-        d = '\n'.join(c)
-        return d
+    def _filelength(self):
+        """How many bytes is the file long, estimated for a compressed file which is not fully read yet"""
+        return self.source.estimated_size()
+
+    def _linecount(self):
+        """Lines the view spans, a compressed file cannot be seeked beyond the indexed part"""
+        if self.file_index is not None:
+            return len(self.file_index)
+        if self.source.compressed:
+            return len(self._index())
+        return self.estimated_lines
+
+    def _index(self):
+        """The most complete line index there is yet"""
+        if self.file_index is not None:
+            return self.file_index
+        if self.partial_index is not None and len(self.partial_index) > len(self.head_index):
+            return self.partial_index
+        return self.head_index
+
+    def lines(self, start, nlines):
+        """Text of up to nlines lines starting at line start, past the indexed lines at an estimated position"""
+        index = self._index()
+        if index is None:
+            return []
+        found = []
+        with METRICS.timer("view_lines"):
+            if start < len(index):
+                found = self.largefile.lines(start, nlines, index)
+            if self.file_index is None and not self.source.compressed and len(found) < nlines and \
+                    start + len(found) < self.estimated_lines:
+                found += self._seek_lines(start + len(found), nlines - len(found))
+        return found
+
+    def _seek_lines(self, start, nlines):
+        """Lines which are not indexed yet, their byte offset is interpolated between the end of the index and of the file"""
+        index = self._index()
+        indexed, indexed_bytes = len(index), index[len(index)]
+        total = max(self.estimated_lines, start + 1)
+        offset = indexed_bytes + (start - indexed) * (self.filelength - indexed_bytes) // max(total - indexed, 1)
+        window = int((nlines + 1) * self.linesize * 2) + 4096
+        atend = offset + window >= self.filelength
+        offset = max(min(offset, self.filelength - window), indexed_bytes)
+        chunk = Chunk.scan(self.chunkcache.view(self.source, offset, window))
+        METRICS.count("view_seeks")
+        first = 1 if offset > indexed_bytes else 0  # most likely in the middle of a line
+        stop = len(chunk) if atend else len(chunk) - 1  # the last line is cut off unless at the end
+        if atend:  # count back from the last line, so that the last page ends with it
+            first = max(first, stop - (total - start))
+        return chunk.texts(self.source.encoding, first, min(stop, first + nlines))
 
     def reset_fileproperties(self):
         self.dialect = None
         self.delimiter = None
         self.has_header = None
         self.header = None
+        self.dtypes = None
         self.file_index = None
+        self.head_index = None
+        self.partial_index = None
+        self.record_index = None
+        self.samples = None
         self.total_lines = None
         self.estimated_lines = None
+        self.estimateLabel.clear()
         self.currentstartline = None
         self.chunklines = None
         self.searchindex = None
-
-    def set_fileproperties(self, text):
-
-        row = text[:text.find("\n")]
-        samplerows = text[:text.find("\n", 5)]
-
-        try:
-            # self.dialect = csv.Sniffer().sniff(toprows[0], delimiters=["\t", ",", ";", "|", "||", "~"])
-            self.dialect = csv.Sniffer().sniff(row, delimiters=["\t", ",", ";", "|", "||", "~"])
-        except Exception as e:
-            logger.warning(e)
-        logger.debug(f"Dialect is {self.dialect}")
-        self.delimiter = self.dialect.delimiter
-        logger.debug(f"Delimiter is: {ord(self.delimiter)}")
-        self.has_header = csv.Sniffer().has_header(samplerows)
-        logger.debug(f"Has header: {self.has_header}")
-        self.header = row.split(self.delimiter)
-        if len(self.header) < 2:
-            logger.warning("Header is likely not properly separated.")
-        logger.debug(f"Header is: {self.header}")
+        self.tablemodel = None
+        self.sortcache = {}
+        self.sortorder = None
+        self.filtercache = OrderedDict()
+        self.filterrows = None
+        self.colstats = None
+        self.rowstats = None
+        self.tailstats = None
+        self.statsend = None
+        self.statsPane.clearStats()
+        self.columnar = None
+
+    def get_fileproperties(self):
+        return {'dialect': self.dialect, 'has_header': self.has_header, 'header': self.header, 'dtypes': self.dtypes}
+
+    def apply_fileproperties(self, properties):
+        self.dialect = properties['dialect']
+        self.delimiter = self.dialect.delimiter if self.dialect else None
+        self.has_header = properties['has_header']
+        self.header = properties['header']
+        self.dtypes = properties.get('dtypes')
+
+    def set_fileproperties(self):
+        """Infer dialect, header and column types once, from samples of the head, middle and tail of the file"""
+        self.apply_fileproperties(self.largefile.file_properties())
+        logger.debug(f"Dialect is {self.dialect}, has header: {self.has_header}, header is: {self.header}")
 
     def loadFirst(self):
-        """Load first chunk of bytes"""
+        """Show the first lines"""
         logger.debug("loadFirst")
 
-        if self.filelength <= self.chunksize:
-            logger.debug(f"EOF {self.filelength} <= chunksize {self.chunksize}")
-            text = self.reader(self.fileName, 0, os.SEEK_SET, nbytes=None)
-        else:
-            logger.debug(f"EOF {self.filelength} >  chunksize{self.chunksize}")
-            text = self.reader(self.fileName, 0, os.SEEK_SET, nbytes=self.chunksize)
-
         if not self.delimiter: # determine once the basic properties of this file, such as delimtier, quoting etc.
-            self.set_fileproperties(text)
+            self.set_fileproperties()
 
-        self.currentstartline = 0
-        if self.line_numbers():
-            text = self._add_line_numbers(text, linestart=self.currentstartline)
-        self.textwnd.setText(text)
+        self.textwnd.scrollToLine(0)
 
         if self.tableBtn.isChecked():
             self._show_as_table()
 
     def loadLast(self):
-        """Load last chunk of bytes"""
+        """Show the last lines"""
         logger.debug("loadLast")
-        if self.filelength >= self.chunksize:
-            logger.debug(f"EOF {self.filelength} >=  chunksize {self.chunksize}")
-            text = self.reader(self.fileName, -self.chunksize, from_what=os.SEEK_END, nbytes=self.chunksize)
-        else:
-            logger.debug(f"EOF {self.filelength} chunksize < {self.chunksize}")
-            text = self.reader(self.fileName, 0, from_what=os.SEEK_SET)
-
-        lastchunklines = self._chunklines()
-        logger.debug(f"Lines in the last chunk: {lastchunklines}")
-
-        if self.total_lines:
-            logger.debug(f"Total lines are known: {self.total_lines}")
-            self.currentstartline = self.total_lines - lastchunklines
-        else:
-            logger.debug(f"Lines are estimated: {self.estimated_lines}")
-            self.currentstartline = self.estimated_lines - lastchunklines
-        logger.debug(f"Last chunk startline: {self.currentstartline }")
-
-        if self.line_numbers():
-            text = self._add_line_numbers(text, linestart=self.currentstartline)
-
-        self.textwnd.setText(text)
-        self.textwnd.moveCursor(QtGui.QTextCursor.End)
+        self.textwnd.scrollToLine(self.textwnd.linecount - 1)
 
         if self.tableBtn.isChecked():
             self._show_as_table()
-            #self.pandasTv.moveCursor(QtGui.QTextCursor.End)
-
-    def currentchunk(self, linenumber):
-        """Given a line number, return the current index chunk to load"""
-
-        if linenumber > self.total_lines:
-            logger.warning("Line number requested is greater than total lines in file. Returning last line.")
-            linenumber = self.total_lines
-        elif linenumber < 0:
-            logger.warning("Line number requested is smaller than 0. Returning first line.")
-            linenumber = 0
-
-        logger.debug(f"Loading line {linenumber}")
-        if linenumber < self.linechunk:
-            lineschunk = 0
-        else:
-            lineschunk = linenumber // self.linechunk * self.linechunk + 1
-        return lineschunk
 
     def loadLine(self, linenumber=None):
         """Move to  record in file"""
         logger.debug("loadLine")
 
-        if not linenumber:
+        if linenumber is None or linenumber is False:  # called from the goto button
             linenumber = int(self.linenumberEdit.text())
 
-        self.currentstartline = self.currentchunk(linenumber) # find index chunk in which the line is located
-        logger.debug(f"Loading from index position {self.currentstartline}")
-
-        byteposition = self.file_index[self.currentstartline] #must be an index key
-        logger.debug(f"Byteposition in file {byteposition}")
-        text = self.reader(self.fileName, byteposition, from_what=os.SEEK_SET, nbytes=self.chunksize)
-        # self.linewnd.setText(self._line_numbers(text, linenumber))
-        if self.line_numbers():
-            text = self._add_line_numbers(text, linestart=self.currentstartline)
-        self.textwnd.setText(text)
-
-        # move cursor to selected line
-        if self.currentstartline == 0:
-            offset = linenumber % self.linechunk # we are starting the index at 0 not at 1, hence first chunk is different
-        else:
-            offset = linenumber % self.linechunk - 1
-        logger.debug(f"Moving {offset} in current text window.")
-        cursor = self.textwnd.textCursor()
-        cursor.movePosition(QtGui.QTextCursor.Down, QtGui.QTextCursor.MoveAnchor, offset)
-        self.textwnd.setTextCursor(cursor)
+        linecount = self.textwnd.linecount
+        if linenumber >= linecount:
+            logger.warning("Line number requested is greater than total lines in file. Returning last line.")
+            linenumber = linecount - 1
+        elif linenumber < 0:
+            logger.warning("Line number requested is smaller than 0. Returning first line.")
+            linenumber = 0
+        self.textwnd.scrollToLine(linenumber)
+        if self.columnar is None and self.file_index is None and linenumber >= len(self._index()):
+            self.statusBar.showMessage(f"Line {linenumber} is not indexed yet, its position is estimated.")
 
         if self.tableBtn.isChecked():
             self._show_as_table()
 
-
+    def _top_line(self, linenumber):
+        self.currentstartline = linenumber
 
     def loadFile(self):
         """Load the file from file picker"""
         logger.debug("loadFile")
-        fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open File", "", "All Files (*);;CSV Files (*.csv);;TSV Files (*.txt; *.tsv);;Parquet Files (*.parc; *.parquet)");
-
-
-        if self.file_index_thread.isRunning():
-            self.file_index_thread.terminate()
-        if self.line_count_thread.isRunning():
-            self.line_count_thread.terminate()
-        if self.search_index_thread.isRunning():
-            self.search_index_thread.terminate()
+        fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open File", "", "All Files (*);;CSV Files (*.csv);;TSV Files (*.txt; *.tsv);;Parquet Files (*.parc; *.parquet);;Arrow Files (*.feather; *.arrow)");
+        if fileName:
+            self.openFile(fileName)
+
+    def openFile(self, fileName):
+        """Load and index a file"""
+        if self.fileName is not None:
+            # the jobs of the previous file stop at their next chunk, whatever they still post is dropped
+            cancelled = self.jobs.cancel(group=self.fileName) + self.prefetcher.cancel(group=self.fileName)
+            logger.debug(f"Cancelled {cancelled}")
+            previous = [file for file in (self.largefile, self.columnar) if file is not None]
+            if not self.jobs.wait(cancelled, timeout=1):
+                logger.warning(f"Jobs of {self.fileName} are still running, it is closed once they stop.")
+            self.closing.append((cancelled, previous))
+            self._close_stopped()
+        self.largefile = None
+        self.source = None
 
         self.reset_fileproperties()
 
@@ -357,30 +468,234 @@ class Widget(QtWidgets.QWidget):
 
         # self.pathLE.setText(self.fileName)
         self.setWindowTitle("Large File Reader " + self.fileName)
-        self.file_index_thread.filename = self.fileName
-        self.line_count_thread.filename = self.fileName
-        self.search_index_thread.filename = self.fileName
 
         self.fileFormat = Path(self.fileName).suffix
         logger.debug("File format is {}".format(self.fileFormat))
+        notreadable = None
+        try:
+            self.columnar = open_columnar(self.fileName)
+        except ColumnarError as e:
+            logger.warning(e)
+            notreadable = e
+        if self.columnar is not None:
+            self._open_columnar()
+            return
+        self.largefile = LargeFile(self.fileName, chunkcache=self.chunkcache)
+        self.source = self.largefile.source
+        logger.debug(f"Reading through {self.source}, encoding is {self.source.encoding}")
 
         self.filelength = self._filelength()
         logger.debug("File length in bytes is {}".format(self.filelength))
 
-        self.loadFirst()
+        cached = self.largefile.load_index()
+        if cached:
+            self.apply_fileproperties(self.largefile.properties)
+            if self.largefile.needs_snapshots():
+                # one long stream, reads far into it are slow until the snapshots are taken again
+                self.jobs.submit(take_snapshots, self.source, priority=LOW, name="Checkpointing",
+                                 group=self.fileName)
+
+        self.head_index = LineScanner(self.source, stop=self.chunksize).run()
+        self.chunklines = len(self.head_index)
         self.estimate_lines()
+        self.textwnd.setSource(self.lines, self._linecount())
 
-        self.chunklines = self._chunklines()
+        self.loadFirst()
 
-        self.file_index_thread.start(QtCore.QThread.HighestPriority)
-        self.line_count_thread.start(QtCore.QThread.HighPriority)
-        self.search_index_thread.start(QtCore.QThread.NormalPriority)
+        if cached:
+            self._file_index(self.largefile.file_index)
+            if self.largefile.load_searchindex():
+                self._search_index(self.largefile.searchindex)
+            self._find_records()
+        else:
+            self.scanjob = self.jobs.submit(scan_file, self.largefile, self._partial_index, self._file_index,
+                                            priority=HIGH, name="Indexing", group=self.fileName,
+                                            done=self._scanned)
 
         self.rawBtn.toggle()  # toggle view as file button
         self.rawBtn.setEnabled(True)
+        self.firstBtn.setEnabled(True)
         self.lastBtn.setEnabled(True)
+        self.gotoBtn.setEnabled(True)
+        self.tableBtn.setEnabled(True)
+        self.searchBtn.setEnabled(True)
+        self.filterBtn.setEnabled(True)
+        self.clearFilterBtn.setEnabled(True)
+        self.statsBtn.setEnabled(True)
+        self.compareBtn.setEnabled(True)
+        if notreadable is not None:
+            self.statusBar.showMessage(f"{notreadable} Showing it as text.")
+
+    def _open_columnar(self):
+        """Show a Parquet or Arrow file from its metadata, rows are read as they come into view"""
+        logger.debug(f"Reading {self.columnar}")
+        self.dialect = csv.excel
+        self.delimiter = self.dialect.delimiter
+        self.has_header = True
+        self.header = self.columnar.columns
+        self.dtypes = self.columnar.dtypes
+        self.filelength = os.path.getsize(self.fileName)
+        self._total_lines(self.columnar.num_rows + 1)
+        self.textwnd.setSource(self._columnar_lines, self.total_lines)
+        self.loadFirst()
+        self.statsjob = self.jobs.submit(stats_columnar, self.columnar, priority=LOW, name="Statistics",
+                                         group=self.fileName, done=self._stats_found)
+
+        self.rawBtn.toggle()  # toggle view as file button
+        self.rawBtn.setEnabled(True)
         self.firstBtn.setEnabled(True)
+        self.lastBtn.setEnabled(True)
+        self.gotoBtn.setEnabled(True)
         self.tableBtn.setEnabled(True)
+        self.searchBtn.setEnabled(True)
+        self.filterBtn.setEnabled(True)
+        self.clearFilterBtn.setEnabled(True)
+        self.statsBtn.setEnabled(True)
+        self.compareBtn.setEnabled(False)  # only text files are compared
+
+    def _columnar_lines(self, start, nlines):
+        """Rows of a columnar file as delimited lines, line 0 holds the column names"""
+        lines = []
+        if start == 0 and nlines:
+            lines.append(self.columnar.columns)
+            nlines -= 1
+        else:
+            start -= 1
+        rows = self.columnar.rows(start, nlines)
+        lines.extend(["" if value is None else str(value).replace("\n", " ") for value in row] for row in rows)
+        text = StringIO()
+        csv.writer(text, self.dialect, lineterminator="\n").writerows(lines)
+        return text.getvalue().split("\n")[:len(lines)]
+
+    def toggleFollow(self, checked):
+        if checked and (self.columnar is not None or self.source is not None and self.source.compressed):
+            self.statusBar.showMessage("Only uncompressed text files can be followed.")
+            self.followCheck.setChecked(False)
+        elif checked:
+            self.followTimer.start()
+        else:
+            self.followTimer.stop()
+
+    def _running(self, job):
+        return job is not None and not job.finished.is_set()
+
+    def _close_stopped(self):
+        """Close the files left behind whose jobs have all stopped"""
+        for entry in list(self.closing):
+            jobs, files = entry
+            if all(job.finished.is_set() for job in jobs):
+                self.closing.remove(entry)
+                for file in files:
+                    file.close()
+
+    def _show_progress(self):
+        """Show how far the running job of the current file got"""
+        self._close_stopped()
+        self._index_progress()
+        running = [job for job in self.jobs.jobs(self.fileName) if job.fraction is not None]
+        if not running:
+            self.progressBar.hide()
+            return
+        job = running[0]
+        self.progressBar.setFormat(f"{job.name} %p%")
+        self.progressBar.setValue(int(job.fraction * 1000))
+        self.progressBar.show()
+
+    def closeEvent(self, event):
+        cancelled = self.jobs.cancel() + self.prefetcher.cancel()
+        self.closing.append((cancelled, [file for file in (self.largefile, self.columnar) if file is not None]))
+        self.jobs.wait(cancelled, timeout=1)
+        self._close_stopped()
+        METRICS.collect("chunkcache", None)
+        METRICS.collect("file", None)
+        for window in (self.metricsPanel, self.diffView):
+            if window is not None:
+                window.close()
+        QtWidgets.QWidget.closeEvent(self, event)
+
+    def compareFile(self):
+        """Compare the file with another one picked, side by side"""
+        fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Compare With", os.path.dirname(self.fileName),
+                                                            "All Files (*)")
+        if fileName:
+            self.compareFiles(self.fileName, fileName)
+
+    def compareFiles(self, fileA, fileB):
+        if self.diffView is None:
+            self.diffView = DiffView(self.jobs, self.chunkcache, self)
+        self.diffView.compare(fileA, fileB)
+        self.diffView.show()
+        self.diffView.raise_()
+
+    def showMetrics(self):
+        if self.metricsPanel is None:
+            self.metricsPanel = MetricsPanel(METRICS, self)
+        self.metricsPanel.show()
+        self.metricsPanel.raise_()
+
+    def _cache_metrics(self):
+        cache = self.chunkcache
+        return {"hits": cache.hits, "misses": cache.misses, "bytes": cache.nbytes, "blocks": len(cache)}
+
+    def _file_metrics(self):
+        """Size of the current file and how far it is indexed, for the metrics"""
+        if self.source is None:
+            return {}
+        index = self._index()
+        found = {"bytes": self.source.estimated_size(), "estimated_lines": self.estimated_lines,
+                 "jobs_running": len(self.jobs.jobs(self.fileName))}
+        if index is not None:
+            found.update(indexed_lines=len(index), indexed_bytes=int(index[len(index)]))
+        return found
+
+    def _follow_tick(self):
+        """Index whatever got appended to the file since the last tick"""
+        if self.file_index is None or self._running(self.scanjob) or self._running(self.followjob):
+            return
+        if self._running(self.searchjob):  # it indexes the lines the file had when it started
+            return
+        if self._running(self.recordjob):  # the records have to catch up with the lines first
+            return
+
+        size = os.stat(self.fileName).st_size
+        indexed = self.file_index[len(self.file_index)]
+        if size < indexed:
+            logger.info(f"{self.fileName} shrank from {indexed} to {size} bytes, reloading it.")
+            self.openFile(self.fileName)
+        elif size > indexed:
+            self.followjob = self.jobs.submit(scan_appended, self.fileName, self.file_index, self.searchindex,
+                                              priority=HIGH, name="Following", group=self.fileName,
+                                              done=self._followed)
+
+    def _followed(self, tail):
+        self.file_index.extend(tail)
+        self.filelength = self.file_index[len(self.file_index)]
+        self._total_lines(len(self.file_index))
+        if self.record_index is not None:  # the appended lines may continue the last record
+            quote = record_quote(self.dialect, self.source.encoding)
+            self.recordjob = self.jobs.submit(scan_appended_records, self.fileName, self.record_index, quote,
+                                              priority=HIGH, name="Following", group=self.fileName,
+                                              done=self._records_appended)
+        else:
+            self._append_stats()
+        self.filtercache = OrderedDict()
+        self.filterrows = None
+        self.textwnd.setLineCount(len(self.file_index))
+        if self.tablemodel is not None and self.record_index is None:
+            self.tablemodel.setLineCount(len(self.file_index))
+        self.sortcache = {}
+        if self.tailCheck.isChecked():
+            self.loadLast()
+
+    def _records_appended(self, tail):
+        self.record_index.extend(tail)
+        self.statusBar.showMessage(f"Total lines: {self.total_lines}, records: {len(self.record_index)}")
+        self.filtercache = OrderedDict()
+        self.filterrows = None
+        self.sortcache = {}
+        if self.tablemodel is not None:
+            self.tablemodel.setLineCount(len(self.record_index))
+        self._append_stats()
 
     def toggleTextWnd(self):
         if self.rawBtn.isChecked():
@@ -389,15 +704,35 @@ class Widget(QtWidgets.QWidget):
             self.textwnd.setVisible(False)
 
     def estimate_lines(self):
-        """Estimate line count without iterating through file"""
-        logger.debug("estimate Lines")
-        self.filesize = Path(self.fileName).stat().st_size
-        text = self.textwnd.toPlainText()
-        linetext = text.split("\n")[1] + "\\r\\n"
-        self.linesize = len(linetext.encode('utf-8'))
-        self.estimated_lines = self.filesize // self.linesize
-        logger.debug("Estimate Lines: {}".format(self.estimated_lines))
-        self.statusBar.showMessage(f"Estimated lines: {self.estimated_lines}")
+        """Estimate line count from the lines indexed so far and samples of the rest of the file"""
+        if self.samples is None:
+            self.samples = sample_lines(self.fileName)
+        index = self._index()
+        indexed_bytes = index[len(index)]
+        self.filelength = self._filelength()
+        self.filesize = self.filelength
+        estimated = estimate_linecount(len(index), indexed_bytes, self.filelength, self.samples)
+        remaining = estimated - len(index)
+        self.linesize = max((self.filelength - indexed_bytes) / remaining if remaining
+                            else indexed_bytes / max(len(index), 1), 1)
+        if estimated != self.estimated_lines:
+            self.estimated_lines = estimated
+            self.estimateLabel.setText(f"Estimated lines: {self.estimated_lines}")
+
+    def _partial_index(self, index):
+        self.partial_index = index
+
+    def _index_progress(self):
+        """Let the view use the lines indexed so far and refine the line count estimate"""
+        if self.file_index is not None or self.partial_index is None:
+            return
+        self.estimate_lines()
+        linecount = self._linecount()
+        if self.textwnd.linecount != linecount:
+            self.textwnd.setLineCount(linecount)
+            self.hitmap.setResults(self.results, linecount)
+        if self.tablemodel is not None:
+            self.tablemodel.setLineCount(len(self._index()))
 
     def _total_lines(self, result):
         self.total_lines = result
@@ -405,177 +740,497 @@ class Widget(QtWidgets.QWidget):
 
     def _file_index(self, result):
         self.file_index = result
-        self.gotoBtn.setEnabled(True)
+        self.partial_index = None
+        self.estimateLabel.clear()
+        self._total_lines(len(self.file_index))
+        self.textwnd.setLineCount(len(self.file_index))
+        if self.tablemodel is not None:
+            self.tablemodel.setLineCount(len(self.file_index))
+        self.hitmap.setResults(self.results, len(self.file_index))
         logger.debug("File index created: {}".format(self.file_index))
 
-    def _first_dict_times(self, mydict, n):
-        i = 0
-        shortdict = {}
-        for k, v in mydict.items():
-            i += 1
-            shortdict[k] = v
-            if i == n:
-                return shortdict
+    def _scanned(self, file_index):
+        self._find_records()
 
     def _search_index(self, result):
         self.searchindex = result
         self.searchBtn.setEnabled(True)
-        searchindexstring = self._first_dict_times(self.searchindex, 5)
-        logger.debug("Search index created: {}".format(str(searchindexstring) + "..."))
+        logger.debug(f"Search index created: {self.searchindex}")
+
+    def _build_search_index(self):
+        """Build the search index in the background, for the plain searches after this one"""
+        if self.file_index is None or self._running(self.searchjob) or self._running(self.followjob):
+            return
+        self.searchjob = self.jobs.submit(index_search, self.largefile, priority=LOW, name="Search indexing",
+                                          group=self.fileName, done=self._search_index)
+
+    def _find_records(self):
+        """Find the records whose quoted fields span lines, from the index cache or with a scan"""
+        cache = IndexCache(self.fileName)
+        records = cache.load_index("records")
+        if records is not None:
+            self._records_found(records)
+        elif not self._running(self.recordjob):
+            self.recordjob = self.jobs.submit(scan_records, self.source, self.dialect, len(self.file_index), cache,
+                                              priority=NORMAL, name="Records", group=self.fileName,
+                                              done=self._records_found)
+
+    def _records_found(self, records):
+        self._record_index(records)
+        self._find_stats()
+
+    def _record_index(self, records):
+        """From now on the table shows a row per record, if records differ from lines"""
+        records = records if records is not None and len(records) else None
+        if records is None and self.record_index is None:
+            return
+        self.record_index = records
+        if self._running(self.sortjob):  # it numbers the rows the table had
+            self.sortjob.cancel()
+        self.sortcache = {}
+        self.sortorder = None
+        self.filtercache = OrderedDict()
+        self.filterrows = None
+        if self.record_index is not None:
+            self.statusBar.showMessage(f"Total lines: {self.total_lines}, records: {len(self.record_index)}")
+        if self.tablemodel is not None:
+            self.tablemodel = None
+            if self.tableBtn.isChecked():
+                self._show_as_table()
+
+    def _find_stats(self):
+        """Statistics of every column, from the index cache or with a pass over the file"""
+        cache = IndexCache(self.fileName)
+        firstrow = 1 if self.has_header else 0
+        key = {"firstrow": firstrow, "records": self.record_index is not None, "dtypes": self.dtypes}
+        last, quote = self._last_row()
+        self.rowstats = None
+        if self._running(self.statsjob):
+            self.statsjob.cancel()
+        cached = cache.load_json("stats")
+        if cached is not None and cached.get("key") == key and "end" in cached:
+            tail = None if cached["tail"] is None else TableStats.from_dict(cached["tail"])
+            self._file_stats_found(last[1], (TableStats.from_dict(cached["stats"]), tail, cached["end"]))
+            return
+        self.statsjob = self.jobs.submit(stats_file, self.source, self.dialect, self.dtypes or [], firstrow,
+                                         self.record_index, last, quote, cache, key, priority=LOW,
+                                         name="Statistics", group=self.fileName,
+                                         done=partial(self._file_stats_found, last[1]))
+
+    def _last_row(self):
+        """Byte range of the last row, which may still grow, and the quote byte if rows are records"""
+        if self.record_index is None:
+            index, quote = self.file_index, None
+        else:
+            index, quote = self.record_index, record_quote(self.dialect, self.source.encoding)
+        start, end = index.span(max(len(index) - 1, 0))
+        return (int(start), int(end)), quote
+
+    def _append_stats(self):
+        """Take the rows appended to a growing file into the statistics, the last one apart while it may grow"""
+        if self.rowstats is None or self._running(self.statsjob):
+            return
+        last, quote = self._last_row()
+        self.statsjob = self.jobs.submit(stats_appended, self.source, self.statsend, last, quote, self.dialect,
+                                         self.dtypes, 1 if self.has_header else 0, priority=LOW,
+                                         name="Statistics", group=self.fileName,
+                                         done=partial(self._stats_appended, last[1]))
+
+    def _file_stats_found(self, scanned, found):
+        self.rowstats, self.tailstats, self.statsend = found
+        self._row_stats_found(scanned)
+
+    def _stats_appended(self, scanned, found):
+        if self.rowstats is None:
+            return
+        stats, self.tailstats, self.statsend = found
+        self.rowstats.merge(stats)
+        self._row_stats_found(scanned)
+
+    def _row_stats_found(self, scanned):
+        """Show the statistics of the rows up to byte scanned, and take in the rows appended meanwhile"""
+        stats = self.rowstats
+        if self.tailstats is not None:
+            stats = TableStats.from_dict(stats.to_dict()).merge(self.tailstats)
+        self._stats_found(stats)
+        if self._last_row()[0][1] != scanned:
+            self._append_stats()
+
+    def _stats_found(self, stats):
+        self.colstats = stats
+        self.statsPane.setStats(self.header if self.has_header else [], stats.summary())
+
+    def toggleStats(self):
+        self.statsPane.setVisible(self.statsBtn.isChecked())
+
+    def records(self, start, nrecords):
+        """Text of up to nrecords records starting at record start, the newlines in quoted fields included"""
+        return Chunk.read(self.source, self.record_index, start, nrecords, self.chunkcache).texts(self.source.encoding)
+
+    def _record(self, linenumber):
+        """Number of the record line linenumber belongs to"""
+        if self.record_index is None or linenumber is None:
+            return linenumber
+        return self.record_index.line_at(self.file_index[min(linenumber, len(self.file_index))])
 
     def search(self):
+        """Look terms up in the search index, or scan the whole file for a regex or until the index is built"""
         searchterm = self.searchEdit.text()
-        foundlines = self.searchindex.get(searchterm, None)
-        import pdb; pdb.set_trace()
-        if foundlines:
-            self.statusBar.showMessage(f"{searchterm} is in lines {foundlines}.")
+        if self.grepjob is not None:
+            self.grepjob.cancel()
+        self._set_results(SearchResults())
+        if self.columnar is not None:
+            self.grepjob = self.jobs.submit(search_columnar, self.columnar, searchterm, self.regexCheck.isChecked(),
+                                            self._grep_hits, priority=NORMAL, name="Searching",
+                                            group=self.fileName, done=self._grep_done)
+            self.statusBar.showMessage(f"Searching for {searchterm}...")
+            return
+        if self.regexCheck.isChecked() or self.searchindex is None:
+            if not self.regexCheck.isChecked():
+                self._build_search_index()
+            self.grepjob = self.jobs.submit(grep_file, self.largefile, searchterm, self.regexCheck.isChecked(),
+                                            self._grep_hits, priority=NORMAL, name="Searching",
+                                            group=self.fileName, done=self._grep_done)
+            self.statusBar.showMessage(f"Searching for {searchterm}...")
+            return
+
+        self.results.add(self.searchindex.query(searchterm, fetch=self.lines))
+        if len(self.results):
+            self.statusBar.showMessage(f"{searchterm} is in {len(self.results)} lines.")
+            # go to first search term
+            self.loadLine(int(self.results.lines[0]))
         else:
             self.statusBar.showMessage(f"{searchterm} not found.")
-        # go to first search term
-        self.loadLine(foundlines[0])
+        self._hits_changed()
+
+    def _set_results(self, results):
+        self.results = results
+        self.textwnd.setMarks(results)
+        self.hitmap.setResults(results, self.textwnd.linecount)
+        self._hits_changed()
+
+    def _hits_changed(self):
+        found = self.results is not None and len(self.results) > 0
+        self.prevBtn.setEnabled(found)
+        self.nextBtn.setEnabled(found)
+        self.hitmap.update()
+        self.textwnd.viewport().update()
+
+    def _current_line(self):
+        if self.textwnd.currentline is not None:
+            return self.textwnd.currentline
+        return self.textwnd.topline
+
+    def nextHit(self):
+        target = self.results.next(self._current_line())
+        if target is None:
+            self.statusBar.showMessage("No more hits after this line.")
+            return
+        self.loadLine(target)
+        self.statusBar.showMessage(f"Hit {self.results.position(target) + 1} of {len(self.results)}.")
+
+    def previousHit(self):
+        target = self.results.previous(self._current_line())
+        if target is None:
+            self.statusBar.showMessage("No more hits before this line.")
+            return
+        self.loadLine(target)
+        self.statusBar.showMessage(f"Hit {self.results.position(target) + 1} of {len(self.results)}.")
+
+    def _grep_hits(self, lines):
+        if not len(self.results):
+            self.loadLine(int(lines[0]))
+        self.results.add(lines)
+        self._hits_changed()
+        self.statusBar.showMessage(f"Searching for {self.searchEdit.text()}... {len(self.results)} lines found.")
+
+    def _grep_done(self, pattern):
+        self.statusBar.showMessage(f"Search done, {pattern} is in {len(self.results)} lines.")
 
     def _show_as_table(self):
 
         if self.tableBtn.isChecked():
             self.pandasTv.show()
-
-            text = self.textwnd.toPlainText()
-            #lineno = self._line_numbers(text=text, linestart=self.currentstartline, return_as_text=False)
             self.pandasTv.setMaximumWidth(10000)
-            mydata = StringIO(text)
-            df = pd.read_csv(mydata, dialect=self.dialect, names=self.header, error_bad_lines=False)
-            # TODO fix the index in the table view. update the index without erroring in pandas model
-            #if self.total_lines:
-            #    rngIndex = pd.RangeIndex(start=self.currentstartline, stop=self.currentstartline + len(df), step=1)
-            #    df.index = rngIndex
-            #    logger.debug(rngIndex)
-            #    df.index = rngIndex
-            #import pdb; pdb.set_trace()
-            #logger.debug(df.index)
-            #logger.debug(df.head())
-            df = df.fillna('')
-            model = PandasModel(df)
-            self.pandasTv.setModel(model)
+
+            if self.tablemodel is None and self.columnar is not None:
+                self.tablemodel = ColumnarTableModel(self.columnar)
+                self.tablemodel.sortRequested.connect(self._sort_table)
+                self.pandasTv.setModel(self.tablemodel)
+            elif self.tablemodel is None:
+                if self.record_index is not None:
+                    fetch, rows = self.records, len(self.record_index)
+                else:
+                    fetch, rows = self.lines, len(self._index())
+                self.tablemodel = FileTableModel(fetch, rows, self.header, self.has_header, self.dialect, self.dtypes)
+                self.tablemodel.sortRequested.connect(self._sort_table)
+                self.pandasTv.setModel(self.tablemodel)
+
+            row = self.tablemodel.row(self._record(self.currentstartline))
+            if row is not None:
+                self.pandasTv.scrollTo(self.tablemodel.index(row, 0), QtWidgets.QAbstractItemView.PositionAtTop)
         else:
             self.pandasTv.hide()
 
-    @lru_cache(8)
-    def reader(self, file, offset, from_what=os.SEEK_SET, nbytes=None):
-        """
-        Read bytes from file using offsets
-
-        https://stackoverflow.com/questions/11696472/seek-function
-        :param offset:
-        :param from_what:
-        :param nbytes:
-        :return:
-        """
-
-        if from_what == os.SEEK_SET:
-            read_position = "start of file"
-        elif from_what == os.SEEK_END:
-            read_position = "end of file"
-        elif from_what == os.SEEK_CUR:
-            read_position = "current position in file"
-        else:
-            raise ValueError("from what must be valid os.SEEK type")
-        if nbytes:
-            read_bytes = f"{nbytes} bytes"
+    def _sort_table(self, column, ascending):
+        """Sort the whole file by column, the permutation is built once per column"""
+        if self.columnar is not None:
+            self.sortorder = (column, ascending)
+            if column in self.sortcache:
+                self._sorted(column, self.sortcache[column])
+            elif not self._running(self.sortjob):
+                self.statusBar.showMessage(f"Sorting by {self.tablemodel.headerData(column, QtCore.Qt.Horizontal)}...")
+                self.sortjob = self.jobs.submit(sort_columnar, self.columnar, column, priority=LOW, name="Sorting",
+                                                group=self.fileName, done=partial(self._sorted, column))
+            return
+        if self.file_index is None:
+            self.statusBar.showMessage("The table can be sorted once the file is indexed.")
+            return
+
+        self.sortorder = (column, ascending)
+        name = f"sort{column}" if self.record_index is None else f"recordsort{column}"
+        permutation = self.sortcache.get(column)
+        if permutation is None:
+            permutation = IndexCache(self.fileName).load_array(name)
+        if permutation is not None:
+            self._sorted(column, permutation)
+        elif not self._running(self.sortjob):
+            self.statusBar.showMessage(f"Sorting by {self.tablemodel.headerData(column, QtCore.Qt.Horizontal)}...")
+            out = IndexCache(self.fileName).arrayfile(name)
+            numeric = self.dtypes[column] in NUMERIC if self.dtypes and column < len(self.dtypes) else None
+            self.sortjob = self.jobs.submit(sort_file, self.source, column, self.dialect, self.tablemodel.firstrow,
+                                            numeric, self.record_index, self.sortbudget, out, priority=LOW,
+                                            name="Sorting",
+                                            group=self.fileName, done=partial(self._sorted, column))
+
+    def _sorted(self, column, permutation):
+        self.sortcache[column] = permutation
+        if self.tablemodel is None or self.sortorder is None or self.sortorder[0] != column:
+            return
+        self._apply_rowmap()
+        self.statusBar.showMessage(f"Sorted by {self.tablemodel.headerData(column, QtCore.Qt.Horizontal)}.")
+
+    def _apply_rowmap(self):
+        """Show the rows of the filter in the sort order, whichever of the two is set"""
+        rowmap = None
+        if self.sortorder is not None and self.sortorder[0] in self.sortcache:
+            column, ascending = self.sortorder
+            rowmap = self.sortcache[column] if ascending else self.sortcache[column][::-1]
+            if self.filterrows is not None:
+                rowmap = rowmap[np.isin(rowmap, self.filterrows)]
+        elif self.filterrows is not None:
+            rowmap = self.filterrows
+        self.tablemodel.setRowMap(rowmap)
+
+    def applyFilter(self):
+        """Show only the table rows matching the filter, which is evaluated over the whole file"""
+        text = self.filterEdit.text().strip()
+        if not text:
+            self.clearFilter()
+            return
+        if self.columnar is None and self.file_index is None:
+            self.statusBar.showMessage("The table can be filtered once the file is indexed.")
+            return
+        try:
+            predicates = parse_filter(text, list(self.header or []), self.dtypes)
+        except FilterError as e:
+            self.statusBar.showMessage(str(e))
+            return
+
+        # every condition is evaluated once, and kept for the next filter which uses it too
+        missing = [predicate for predicate in dict.fromkeys(predicates)
+                   if self._filterkey(predicate) not in self.filtercache]
+        if self._running(self.filterjob):
+            self.filterjob.cancel()
+        if not missing:
+            self._filtered(text, predicates, [], [])
+            return
+        self.statusBar.showMessage(f"Filtering by {text}...")
+        if self.columnar is not None:
+            self.filterjob = self.jobs.submit(filter_columnar_file, self.columnar, missing, self.dtypes,
+                                              priority=NORMAL, name="Filtering", group=self.fileName,
+                                              done=partial(self._filtered, text, predicates, missing))
         else:
-            read_bytes = f"all bytes"
-        logger.debug(f"Reading chunk  of {read_bytes} bytes at  {offset} from {read_position}")
-
-        with open(file, 'rb') as myfile:
-            myfile.seek(offset, from_what)
-            text = myfile.read(nbytes)
-            try:
-                text = text.decode("utf-8")
-            except Exception as e:
-                logger.warning(f"Could not encode file in unicode. {e}")
-                text = text.decode("latin1")
-
-        #make unix compatible
-        text = text.replace("\r\n", "\n")
-
-        if from_what == os.SEEK_END:
-            firstlineend = text.find("\n", 1)
-            text = text[firstlineend + 1:]
-        elif from_what == os.SEEK_CUR:
-            lastlinenend = text.rfind("\n")
-            text = text[:lastlinenend]
-
-        return text
-
-
-class FileIndex(QThread):
-    """Index the lines in a large file in a separate thread"""
-    signal = pyqtSignal('PyQt_PyObject')
-
-    def __init__(self, filename, linechunk=10000):
-        QThread.__init__(self)
-        self.linechunk = linechunk
-        self.filename = filename
-
-    def run(self):
-        logger.debug("Indexing file...")
-        assert self.filename != ''
-        with open(self.filename, 'r') as myfile:
-            fileindex = {n: myfile.tell() for n, _ in enumerate(iter(myfile.readline, '')) if n % self.linechunk == 1}
-        fileindex.pop(1, None)
-        fileindex[0] = 0
-        logger.debug("Indexing file...Done")
-        self.signal.emit(fileindex)
-
-
-class LineCount(QThread):
-    """Index the lines in a large file in a separate thread"""
-    signal = pyqtSignal('PyQt_PyObject')
-
-    def __init__(self, filename):
-        QThread.__init__(self)
-        self.filename = filename
-
-    def run(self):
-        logger.debug("Counting lines in file...")
-        assert self.filename != ''
-
-        with open(self.filename, 'r') as myfile:
-            for n, _ in enumerate(myfile):
-                pass
-        logger.debug(f"Counting lines in file...Done. {n} lines.")
-        self.signal.emit(n)
-
-class SearchIndex(QThread):
-    """Index the lines in a large file in a separate thread"""
-    signal = pyqtSignal('PyQt_PyObject')
-
-    def __init__(self, filename):
-        QThread.__init__(self)
-        self.filename = filename
-
-    def run(self):
-        logger.debug("Creating search index...")
-        assert self.filename != ''
-        do_not_index={}
-        searchindex = {}
-        itemsindexed = 0
-        with open(self.filename, 'r', encoding="utf-8") as myfile:
-            for ln, line in enumerate(myfile):
-                terms = re.findall(r"[\w'\-[0-9]+", line)
-                for t in terms:
-                    if not do_not_index.get(t, False):
-                        searchindex[t] = list(set(searchindex.get(t, []) + [ln])) #store line in which each searchindex lives
-                        if len(searchindex[t]) > 50:
-                            do_not_index[t] = True
-                if len(searchindex.keys()) % 100000 == 0:
-                    itemsindexed += 100000
-                    logger.debug(f"{itemsindexed} indexed.")
-        logger.debug(f"Creating search index...Done. {len(searchindex.keys())} items indexed.")
-        self.signal.emit(searchindex)
+            firstrow = 1 if self.has_header else 0
+            self.filterjob = self.jobs.submit(filter_file, self.source, missing, self.dialect, self.dtypes, firstrow,
+                                              self.record_index, priority=NORMAL, name="Filtering",
+                                              group=self.fileName,
+                                              done=partial(self._filtered, text, predicates, missing))
+
+    def _filterkey(self, predicate):
+        return predicate, self.record_index is not None
+
+    def _filtered(self, text, predicates, evaluated, matches):
+        for predicate, rows in zip(evaluated, matches):
+            self.filtercache[self._filterkey(predicate)] = rows
+            if len(self.filtercache) > 32:
+                self.filtercache.popitem(last=False)
+        rows = None
+        for predicate in predicates:
+            matched = self.filtercache[self._filterkey(predicate)]
+            self.filtercache.move_to_end(self._filterkey(predicate))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        self.filterrows = rows
+        if not self.tableBtn.isChecked():
+            self.tableBtn.setChecked(True)
+        self._show_as_table()
+        self._apply_rowmap()
+        self.statusBar.showMessage(f"{len(rows)} rows match {text}.")
+
+    def clearFilter(self):
+        if self._running(self.filterjob):
+            self.filterjob.cancel()
+        self.filterEdit.clear()
+        self.filterrows = None
+        if self.tablemodel is not None:
+            self._apply_rowmap()
+
+
+class JobEvents(QtCore.QObject):
+    """Hands what background jobs post over to the GUI thread"""
+    posted = pyqtSignal('PyQt_PyObject', 'PyQt_PyObject', 'PyQt_PyObject')
+
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.posted.connect(self._deliver)  # queued, the signal is emitted by worker threads
+
+    def dispatch(self, job, callback, args):
+        self.posted.emit(job, callback, args)
+
+    def _deliver(self, job, callback, args):
+        if not job.cancelled:
+            callback(*args)
+
+
+def scan_file(job, largefile, started, indexed):
+    """Index the lines of the file.
+
+    started(index) is posted with the index while it is still growing, indexed(index) once it is complete.
+    """
+    return largefile.build_index(token=job.token, progress=job.progress, started=partial(job.post, started),
+                                 indexed=partial(job.post, indexed))
+
+
+def index_search(job, largefile):
+    """Build the search index of the indexed lines of the file"""
+    return largefile.build_searchindex(token=job.token, progress=job.progress)
+
+
+def take_snapshots(job, source):
+    """Decompress the whole file once, for the checkpoints it leaves behind"""
+    for position, block in source.blocks():
+        job.token.check()
+        job.progress(position + len(block), source.estimated_size())
+
+
+def scan_appended(job, filename, file_index, searchindex):
+    """Index the lines appended to a file which is still growing"""
+    consumers = [] if searchindex is None else [SearchIndexer(index=searchindex)]
+    tail = scan_tail(filename, file_index, consumers=consumers, token=job.token)
+    logger.debug(f"Indexed {len(tail)} appended lines.")
+    return tail
+
+
+def grep_file(job, largefile, pattern, regex, hits):
+    """Scan the whole file for pattern and post hits(lines) as they come in"""
+    for lines in largefile.grep(pattern, regex=regex, token=job.token, progress=job.progress):
+        if len(lines):
+            job.post(hits, lines)
+    return pattern
+
+
+def search_columnar(job, columnar, pattern, regex, hits):
+    """Search the values of a columnar file, posting hits(lines) a row group at a time"""
+    for group, rows in enumerate(columnar.search(pattern, regex=regex, token=job.token)):
+        job.progress(group + 1, columnar.groups)
+        if len(rows):
+            job.post(hits, rows + np.uint64(1))  # line 0 holds the column names
+    return pattern
+
+
+def sort_columnar(job, columnar, column):
+    """Line numbers of the rows of a columnar file ordered by column"""
+    return columnar.sort_indices(column, token=job.token) + np.uint64(1)
+
+
+def sort_file(job, source, column, dialect, firstline, numeric, records, budget, out):
+    """Build the permutation which sorts the lines, or the records if given their index, of a file by one column"""
+    return sort_permutation(source, column, dialect, firstline=firstline, numeric=numeric, budget=budget, out=out,
+                            encoding=source.encoding, records=records, token=job.token, progress=job.progress)
+
+
+def filter_file(job, source, predicates, dialect, dtypes, firstline, records):
+    """Rows of a delimited file matching each predicate"""
+    return filter_rows(source, predicates, dialect, dtypes, firstline=firstline, encoding=source.encoding,
+                       records=records, token=job.token, progress=job.progress)
+
+
+def filter_columnar_file(job, columnar, predicates, dtypes):
+    """Line numbers of the rows of a columnar file matching each predicate"""
+    return [rows + np.uint64(1) for rows in filter_columnar(columnar, predicates, dtypes, token=job.token,
+                                                           progress=job.progress)]
+
+
+def stats_file(job, source, dialect, dtypes, firstline, records, last, quote, cache, key):
+    """Statistics of every column of a delimited file, saved to the index cache under key.
+
+    last is the byte range of the last row, which may still grow while the file is followed.
+    Returns the statistics of the complete rows, those of the last one if it is not and where the complete rows end.
+    """
+    end = last[1] if source.compressed else complete_end(source.filename, *last, quote)
+    stats = column_stats(source, dialect, dtypes, firstline=firstline, records=records, stop=end,
+                         token=job.token, progress=job.progress)
+    tail = None
+    if end < last[1]:
+        tail = stats_range(source.filename, end, last[1], dialect_to_dict(dialect), dtypes, firstline if not end else 0,
+                           source.encoding)
+    cache.save_json("stats", {"key": key, "stats": stats.to_dict(), "tail": None if tail is None else tail.to_dict(),
+                              "end": end})
+    return stats, tail, end
+
+
+def stats_columnar(job, columnar):
+    """Statistics of every column of a columnar file"""
+    return columnar_stats(columnar, token=job.token, progress=job.progress)
+
+
+def stats_appended(job, source, start, last, quote, dialect, dtypes, firstline):
+    """Statistics of the rows completed since byte start of a file which is still growing, to merge with those before.
+
+    last is the byte range of the last row, those of it come apart while it is not complete.
+    Returns them, those of the last row or None and where the complete rows end.
+    """
+    end = complete_end(source.filename, *last, quote)
+    attrs, dtypes = dialect_to_dict(dialect), dtypes or []
+    stats = TableStats(dtypes)
+    if end > start:
+        stats = stats_range(source.filename, start, end, attrs, dtypes, firstline if not start else 0, source.encoding)
+    tail = None
+    if last[1] > end:
+        tail = stats_range(source.filename, end, last[1], attrs, dtypes, firstline if not end else 0, source.encoding)
+    return stats, tail, end
+
+
+def scan_appended_records(job, filename, records, quote):
+    """Index the records appended to a file which is still growing"""
+    tail = scan_tail_records(filename, records, quote, token=job.token)
+    logger.debug(f"Indexed {len(tail)} appended records.")
+    return tail
+
+
+def scan_records(job, source, dialect, lines, cache):
+    """Index where the records of a file start, an empty index stands for every line being a record"""
+    records = index_records(source, dialect, token=job.token, progress=job.progress)
+    if records is None or len(records) == lines:
+        records = LineIndex()
+    cache.save_index("records", records)
+    return records
 
 
 if __name__ == "__main__":
     import sys
+    FORMAT = '%(asctime)s - %(name)20s - %(funcName)20s - %(levelname)8s - %(message)s'
+    logging.basicConfig(level=logging.DEBUG, format=FORMAT)
     app = QtWidgets.QApplication(sys.argv)
     app.processEvents()
     w = Widget()
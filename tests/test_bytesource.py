@@ -0,0 +1,29 @@
+import codecs
+import csv
+
+from bytesource import detect_encoding, open_source, without_bom
+from largefile import LargeFile
+from rowfilter import filter_rows, parse_filter
+from sortindex import sort_permutation
+
+
+def test_utf8_mark_is_not_part_of_the_text(tmp_path):
+    path = tmp_path / "bom.csv"
+    path.write_bytes(codecs.BOM_UTF8 + b"3,c\n1,a\n2,b\n")
+    assert detect_encoding(path.read_bytes()) == "utf-8-sig" and without_bom("utf-8-sig") == "utf-8"
+    with LargeFile(str(path), cachedir=tmp_path / "cache") as large:
+        assert large.lines(0, 3) == ["3,c", "1,a", "2,b"]
+        assert list(large.grep(r"^3,", regex=True))[0].tolist() == [0]
+        encoding = large.encoding
+    assert sort_permutation(str(path), 0, csv.excel, numeric=True, encoding=encoding).tolist() == [1, 2, 0]
+    dtypes = ["int64", "str"]
+    predicates = parse_filter("0 == 3", ["0", "1"], dtypes)
+    matched, = filter_rows(str(path), predicates, csv.excel, dtypes, encoding=encoding)
+    assert matched.tolist() == [0]
+
+
+def test_other_marks_are_transcoded_away(tmp_path):
+    path = tmp_path / "wide.csv"
+    path.write_bytes("1,ä\n".encode("utf-16"))
+    with open_source(str(path)) as source:
+        assert source.encoding == "utf-8" and bytes(source.read(0, 100)) == "1,ä\n".encode()
@@ -0,0 +1,29 @@
+import pytest
+
+from columnar import ArrowFile, ColumnarError, ParquetFile, open_columnar
+
+pa = pytest.importorskip("pyarrow")
+feather = pytest.importorskip("pyarrow.feather")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_picked_by_content_not_name(tmp_path):
+    table = pa.table({"n": [1, 2, 3], "s": ["a", "b", "c"]})
+    pq.write_table(table, tmp_path / "data.csv")
+    feather.write_feather(table, tmp_path / "data.txt")
+    (tmp_path / "text.parquet").write_text("n,s\n1,a\n")
+    parquet, arrow = open_columnar(tmp_path / "data.csv"), open_columnar(tmp_path / "data.txt")
+    try:
+        assert isinstance(parquet, ParquetFile) and parquet.num_rows == 3
+        assert isinstance(arrow, ArrowFile) and arrow.columns == ["n", "s"]
+    finally:
+        parquet.close()
+        arrow.close()
+    assert open_columnar(tmp_path / "text.parquet") is None
+
+
+def test_unreadable_columnar_file(tmp_path):
+    path = tmp_path / "cut.parquet"
+    path.write_bytes(b"PAR1")
+    with pytest.raises(ColumnarError):
+        open_columnar(path)
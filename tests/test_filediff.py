@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+import pytest
+
+from filediff import block_hashes, diff_files
+from largefile import LargeFile
+
+
+def apply(lines_a, hunks, lines_b):
+    """The second file rebuilt from the lines of the first and the hunks"""
+    out, position = [], 0
+    for tag, a1, a2, b1, b2 in hunks:
+        out += lines_a[position:a1] + lines_b[b1:b2]
+        position = a2
+    return out + lines_a[position:]
+
+
+def edited(rng, lines):
+    lines = list(lines)
+    for _ in range(rng.randrange(0, 30)):
+        at = rng.randrange(0, len(lines) + 1)
+        edit = rng.random()
+        if edit < 0.4:
+            lines[at:at] = [f"x{rng.random()}" for _ in range(rng.randrange(1, 50))]
+        elif edit < 0.7:
+            del lines[at:at + rng.randrange(1, 200)]
+        else:
+            lines[at:at + 3] = ["y"] * rng.randrange(0, 6)
+    return lines
+
+
+def write(path, lines, newline):
+    path.write_text("\n".join(lines) + ("\n" if newline else ""))
+    return str(path)
+
+
+@pytest.mark.parametrize("trial", range(12))
+def test_hunks_rebuild_the_second_file(tmp_path, trial):
+    rng = random.Random(trial)
+    lines = [str(rng.randrange(50 if trial % 3 == 0 else 10 ** 9)) for _ in range(rng.randrange(0, 3000))]
+    a = write(tmp_path / "a", lines, trial % 2)
+    b = write(tmp_path / "b", edited(rng, lines), trial % 4 < 2)
+    with LargeFile(a, cachedir=tmp_path / "cache") as large_a, LargeFile(b, cachedir=tmp_path / "cache") as large_b:
+        lines_a, lines_b = large_a.lines(0, 10 ** 9), large_b.lines(0, 10 ** 9)
+        diff = diff_files(large_a, large_b, blocklines=rng.choice([4, 16, 64]), maxlines=rng.choice([50, 10 ** 6]))
+    hunks = list(diff)
+    assert apply(lines_a, hunks, lines_b) == lines_b
+    assert all(a1 <= a2 and b1 <= b2 for _, a1, a2, b1, b2 in hunks)
+    assert all(x[2] <= y[1] and x[4] <= y[3] for x, y in zip(hunks, hunks[1:]))
+    assert diff.linecounts == (len(lines_a), len(lines_b))
+
+
+def test_same_files_have_no_hunks(tmp_path):
+    lines = [f"line {n}" for n in range(5000)]
+    a, b = write(tmp_path / "a", lines, True), write(tmp_path / "b", lines, True)
+    with LargeFile(a, cachedir=tmp_path / "cache") as large_a, LargeFile(b, cachedir=tmp_path / "cache") as large_b:
+        diff = diff_files(large_a, large_b, blocklines=16)
+    assert len(diff) == 0 and diff.counterpart(1234) == 1234
+
+
+def test_counterpart_and_unified(tmp_path):
+    lines = [f"line {n}" for n in range(100)]
+    other = lines[:10] + ["new"] + lines[10:50] + lines[60:]
+    a, b = write(tmp_path / "a", lines, True), write(tmp_path / "b", other, True)
+    with LargeFile(a, cachedir=tmp_path / "cache") as large_a, LargeFile(b, cachedir=tmp_path / "cache") as large_b:
+        diff = diff_files(large_a, large_b, blocklines=4)
+        unified = list(diff.unified(large_a.lines, large_b.lines))
+    assert list(diff) == [("insert", 10, 10, 10, 11), ("delete", 50, 60, 51, 51)]
+    assert diff.counterpart(5) == 5 and diff.counterpart(70) == 61 and diff.counterpart(11, side=1) == 10
+    assert unified[:2] == ["@@ -10,0 +11 @@", "+new"]
+    assert unified[2] == "@@ -51,10 +51,0 @@" and unified[3:] == [f"-line {n}" for n in range(50, 60)]
+    assert 55 in diff.changed(0) and 49 not in diff.changed(0) and 10 in diff.changed(1)
+
+
+def test_ranges_hash_like_one_pass(tmp_path):
+    rng = random.Random(5)
+    path = write(tmp_path / "a", [str(rng.randrange(10 ** 9)) * rng.randrange(1, 20) for _ in range(20000)], True)
+    with LargeFile(path, cachedir=tmp_path / "whole") as large:
+        ends, hashes = block_hashes(large, blocklines=16, spacing=4096)
+    with LargeFile(path, cachedir=tmp_path / "ranges") as large:
+        ranged_ends, ranged_hashes = block_hashes(large, blocklines=16, spacing=4096, workers=2, rangesize=50000)
+    assert np.array_equal(ends, ranged_ends) and np.array_equal(hashes, ranged_hashes)
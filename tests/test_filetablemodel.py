@@ -0,0 +1,31 @@
+import csv
+
+from FileTableModel import FileTableModel
+
+
+def model(lines, **kwargs):
+    return FileTableModel(lambda start, n: lines[start:start + n], len(lines), ["a", "b"], False, csv.excel,
+                          **kwargs)
+
+
+def cells(table, column):
+    return [table.data(table.index(row, column)) for row in range(table.rowCount())]
+
+
+def test_stray_quote_stays_in_its_row():
+    table = model(['1,"ab', "2,c", "3,d"])
+    assert cells(table, 0) == ["1", "2", "3"]
+    assert cells(table, 1) == ["ab", "c", "d"]
+
+
+def test_field_too_large_shows_the_raw_line():
+    large = "x" * (csv.field_size_limit() + 10)
+    table = model(["1,a", f'2,"{large}', "3,c"], blocksize=2)
+    assert cells(table, 0) == ["1", f'2,"{large}', "3"]
+    assert cells(table, 1) == ["a", "", "c"]
+
+
+def test_sorted_rows_follow_the_row_map():
+    table = model(["1,a", "2,b", "3,c"])
+    table.setRowMap([2, 0, 1])
+    assert cells(table, 1) == ["c", "a", "b"]
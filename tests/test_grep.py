@@ -0,0 +1,69 @@
+import gzip
+
+import numpy as np
+
+from bytesource import open_source
+from grep import ParallelGrep, find_lines, split_ranges
+
+
+def grep(path, pattern, **kwargs):
+    return np.concatenate(list(ParallelGrep(str(path), pattern, **kwargs)) or [np.array([], np.uint64)]).tolist()
+
+
+def test_split_ranges_end_after_newlines(tmp_path):
+    path = tmp_path / "lines.txt"
+    data = b"".join(b"line %d\n" % i for i in range(1000)) + b"no newline at the end"
+    path.write_bytes(data)
+    ranges = split_ranges(str(path), 100)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and data[end - 1:end] == b"\n"
+
+
+def test_ranges_count_lines_across_boundaries(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_bytes(b"".join(b"line %d\n" % i for i in range(5000)))
+    assert grep(path, "line 4999", rangesize=1000, workers=2) == [4999]
+    assert grep(path, r"^line \d*7$", regex=True, rangesize=1000, workers=2) == list(range(7, 5000, 10))
+
+
+def test_plain_pattern_one_hit_per_line():
+    data = b"abab\nxx\nab\n"
+    lines, newlines = find_lines(data, 0, len(data), b"ab", False, False)
+    assert lines.tolist() == [0, 2] and newlines == 3
+
+
+def test_regex_end_of_crlf_line(tmp_path):
+    path = tmp_path / "crlf.csv"
+    path.write_bytes(b"a;b\r\n17;34\r\n17;35\r\n17;34")
+    assert grep(path, "17;34$", regex=True) == [1, 3]
+
+
+def test_regex_non_ascii_characters(tmp_path):
+    path = tmp_path / "utf8.txt"
+    path.write_bytes("hello world 17;\nhallo wörld 17;\nwrld 17;\n".encode("utf-8"))
+    assert grep(path, r"w.rld 17;", regex=True) == [0, 1]
+    assert grep(path, r"^\w+ w\w+ ", regex=True) == [0, 1]
+
+
+def test_ignore_case_non_ascii(tmp_path):
+    path = tmp_path / "utf8.txt"
+    path.write_bytes("HELLO\nhéllo wörld\nHÉLLO WÖRLD!\n".encode("utf-8"))
+    assert grep(path, "HÉLLO WÖRLD", ignorecase=True) == [1, 2]
+    assert grep(path, "héllo", ignorecase=True) == [1, 2]
+
+
+def test_other_encoding(tmp_path):
+    path = tmp_path / "latin1.txt"
+    path.write_bytes("x\nwörld\n".encode("latin-1"))
+    assert grep(path, "WÖRLD", ignorecase=True, encoding="latin-1") == [1]
+
+
+def test_compressed_source_same_lines(tmp_path):
+    data = "".join(f"Zeile {i} ä\r\n" for i in range(3000)).encode("utf-8")
+    path = tmp_path / "lines.txt.gz"
+    path.write_bytes(gzip.compress(data))
+    with open_source(str(path)) as source:
+        found = np.concatenate(list(ParallelGrep(source, r"ZEILE \d*9 Ä$", regex=True, ignorecase=True,
+                                                 rangesize=4096))).tolist()
+    assert found == list(range(9, 3000, 10))
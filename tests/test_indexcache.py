@@ -0,0 +1,69 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from indexcache import IndexCache
+from lineindex import LineIndex, LineScanner
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"".join(b"%d,row %d\n" % (n, n) for n in range(1000)))
+    cache = IndexCache(str(path), cachedir=tmp_path / "cache")
+    index = LineScanner(str(path)).run()
+    cache.save(index, {"dialect": csv.excel, "has_header": False})
+    return path, cache, index
+
+
+def test_load_what_was_saved(indexed):
+    path, cache, index = indexed
+    cached = cache.load()
+    assert cached["file_index"].offsets().tolist() == index.offsets().tolist()
+    assert cached["total_lines"] == 1000
+    assert cached["properties"]["dialect"].delimiter == ","
+    assert cached["fingerprint"] == cache.fingerprint()
+    records = LineIndex.from_offsets([0, 100, 200])
+    cache.save_index("records", records)
+    assert cache.load_index("records").offsets().tolist() == [0, 100, 200]
+    cache.save_json("stats", {"end": 200})
+    assert cache.load_json("stats") == {"end": 200}
+
+
+@pytest.mark.parametrize("change", ["append", "rewrite", "touch"])
+def test_changed_file_is_stale(indexed, change):
+    path, cache, _ = indexed
+    cache.save_array("hashes", np.arange(10))
+    data = path.read_bytes()
+    if change == "append":
+        path.write_bytes(data + b"1000,row 1000\n")
+    elif change == "rewrite":  # same size and time, other content
+        stat = os.stat(path)
+        path.write_bytes(data.replace(b"0,row 0\n", b"0,row X\n", 1))
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    else:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load() is None
+    assert cache.load_array("hashes") is None
+    assert cache.load_json("stats") is None
+    assert cache.arrayfile("hashes") is None
+
+
+def test_other_version_is_ignored(indexed, monkeypatch):
+    _, cache, _ = indexed
+    monkeypatch.setattr(IndexCache, "VERSION", IndexCache.VERSION + 1)
+    assert cache.load() is None
+
+
+def test_fingerprint_taken_once(indexed, monkeypatch):
+    _, cache, index = indexed
+    fingerprint = cache.fingerprint()
+    calls = []
+    monkeypatch.setattr(cache, "fingerprint", lambda: calls.append(1) or fingerprint)
+    cache.save_index("records", index)
+    assert cache.load_index("records") is not None
+    assert len(calls) == 2
+    assert cache.load_array("records_anchors", fingerprint) is not None and len(calls) == 2
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from bytesource import open_source
+from lineindex import Chunk, LineIndex, LineScanner, scan_tail
+
+
+def random_offsets(count, longest, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([[0], np.cumsum(rng.integers(1, longest, size=count))]).astype(np.uint64)
+
+
+@pytest.mark.parametrize("longest", [100, 70000, 2 ** 33])
+def test_offsets_round_trip(longest):
+    offsets = random_offsets(1000, longest)
+    index = LineIndex.from_offsets(offsets)
+    assert len(index) == 1000
+    assert index.offsets().tolist() == offsets.tolist()
+    assert [index[n] for n in range(0, 1001, 37)] == offsets[::37].tolist()
+    assert len(index.anchors) == (1001 + LineIndex.BLOCK - 1) // LineIndex.BLOCK
+
+
+def test_deltas_widen_for_long_lines():
+    index = LineIndex.from_offsets(random_offsets(200, 100))
+    assert index.deltas.dtype == np.uint16
+    before = index.offsets().tolist()
+    end = before[-1]
+    index.append([end + 10, end + 10 + 2 ** 20, end + 10 + 2 ** 40])
+    assert index.deltas.dtype == np.uint64
+    assert index.offsets().tolist() == before + [end + 10, end + 10 + 2 ** 20, end + 10 + 2 ** 40]
+
+
+def test_appends_in_pieces_like_at_once():
+    offsets = random_offsets(5000, 300)
+    whole = LineIndex.from_offsets(offsets)
+    pieces = LineIndex.from_offsets(offsets[:1])
+    for start in range(1, len(offsets), 97):
+        pieces.append(offsets[start:start + 97])
+    assert pieces.anchors.tolist() == whole.anchors.tolist()
+    assert pieces.deltas.tolist() == whole.deltas.tolist()
+
+
+def test_line_at():
+    offsets = random_offsets(500, 50, seed=1)
+    index = LineIndex.from_offsets(offsets)
+    for n in range(0, 500, 7):
+        assert index.line_at(int(offsets[n])) == n
+        assert index.line_at(int(offsets[n + 1]) - 1) == n
+    assert index.line_at(int(offsets[-1])) == len(index)
+    assert index.span(3, 2) == (offsets[3], offsets[5])
+
+
+def test_readonly_arrays_are_copied_on_append():
+    offsets = random_offsets(100, 20)
+    saved = LineIndex.from_offsets(offsets)
+    anchors, deltas = saved.anchors.copy(), saved.deltas.copy()
+    anchors.flags.writeable = deltas.flags.writeable = False
+    index = LineIndex(anchors, deltas)
+    index.append([int(offsets[-1]) + 5])
+    assert index[len(index)] == int(offsets[-1]) + 5
+    assert index.offsets(0, 101).tolist() == offsets.tolist()
+
+
+@pytest.mark.parametrize("lines", [63, 64, 65, 200])
+def test_extend_truncates_at_the_tail(lines):
+    offsets = random_offsets(lines, 30, seed=2)
+    index = LineIndex.from_offsets(offsets)
+    tail = LineIndex.from_offsets([offsets[-2], offsets[-2] + 100, offsets[-2] + 150])
+    index.extend(tail)
+    assert index.offsets().tolist() == offsets[:-2].tolist() + [int(offsets[-2]) + n for n in (0, 100, 150)]
+    with pytest.raises(AssertionError):
+        index.extend(LineIndex.from_offsets([int(offsets[1]) + 1, int(offsets[1]) + 2]))
+
+
+def test_scanner_and_tail_of_a_growing_file(tmp_path):
+    path = tmp_path / "grow.txt"
+    path.write_bytes(b"one\ntwo\nthr")
+    index = LineScanner(str(path), chunksize=5).run()
+    assert index.offsets().tolist() == [0, 4, 8, 11]
+    with open(path, "ab") as out:
+        out.write(b"ee\n" + b"x" * 70000 + b"\nlast")
+    index.extend(scan_tail(str(path), index))
+    assert index.offsets().tolist() == [0, 4, 8, 14, 70015, 70019]
+    source = open_source(str(path))
+    try:
+        assert Chunk.read(source, index, 1, 3).texts()[:2] == ["two", "three"]
+    finally:
+        source.close()
@@ -0,0 +1,28 @@
+import pandas as pd
+from PyQt5 import QtCore
+
+from PandasModel import PandasModel
+
+
+def cell(model, row, column):
+    return model.data(model.index(row, column))
+
+
+def test_cells_and_headers():
+    model = PandasModel(pd.DataFrame({"n": range(1000), "name": [f"x{n}" for n in range(1000)]}), blocksize=64,
+                        maxblocks=2)
+    assert (model.rowCount(), model.columnCount()) == (1000, 2)
+    assert [cell(model, row, 0) for row in (0, 63, 64, 999)] == ["0", "63", "64", "999"]
+    assert cell(model, 500, 1) == "x500" and len(model._blocks) == 2
+    assert model.headerData(1, QtCore.Qt.Horizontal) == "name"
+    assert model.headerData(7, QtCore.Qt.Vertical) == "7"
+
+
+def test_set_data_and_sort_drop_formatted_blocks():
+    model = PandasModel(pd.DataFrame({"n": [3, 1, 2], "name": ["c", "a", "b"]}))
+    assert cell(model, 0, 0) == "3"
+    assert model.setData(model.index(0, 0), "5", QtCore.Qt.EditRole)
+    assert cell(model, 0, 0) == "5"
+    model.sort(0, QtCore.Qt.DescendingOrder)
+    assert [cell(model, row, 1) for row in range(3)] == ["c", "b", "a"]
+    assert model.headerData(0, QtCore.Qt.Vertical) == "0"
@@ -0,0 +1,92 @@
+import csv
+import io
+
+import numpy as np
+import pytest
+
+from lineindex import LineIndex, LineScanner
+from recordindex import RecordIndexer, complete_end, index_records, quote_parity, scan_tail_records
+
+
+def record_starts(text):
+    """Offsets of the records of text as the csv module reads them, and of its end"""
+    lines = [0]
+    for line in io.StringIO(text, newline=""):
+        lines.append(lines[-1] + len(line.encode()))
+    reader = csv.reader(io.StringIO(text, newline=""))
+    return [0] + [lines[reader.line_num] for _ in reader]
+
+
+def table(rows):
+    out = io.StringIO(newline="")
+    csv.writer(out, lineterminator="\n").writerows(rows)
+    return out.getvalue()
+
+
+@pytest.fixture
+def quoted(tmp_path):
+    rng = np.random.default_rng(3)
+    texts = ["plain", "two\nlines", 'say ""hi""\nand\nbye', "", "a,b", "\n"]
+    rows = [[n, rng.choice(texts), rng.choice(texts)] for n in range(2000)]
+    text = table(rows)
+    path = tmp_path / "quoted.csv"
+    path.write_bytes(text.encode())
+    return path, text
+
+
+def test_quote_parity():
+    data = b'a,"b\nc",d\n"e""\n"\n'
+    newlines, parities, parity = quote_parity(data, ord('"'))
+    assert newlines.tolist() == [4, 9, 14, 16]
+    assert parities.tolist() == [1, 0, 1, 0]
+    assert parity == 0
+
+
+@pytest.mark.parametrize("rangesize", [1, 7, 64, 1000, 1 << 20])
+def test_ranges_resolve_the_quote_state(quoted, rangesize):
+    path, text = quoted
+    records = index_records(str(path), csv.excel, workers=2, rangesize=rangesize)
+    assert records.offsets().tolist() == record_starts(text)
+
+
+def test_record_indexer_like_ranges(quoted):
+    path, text = quoted
+    indexer = RecordIndexer(ord('"'))
+    LineScanner(str(path), consumers=[indexer], chunksize=100).run()
+    assert indexer.finish(len(text.encode())).offsets().tolist() == record_starts(text)
+
+
+def test_no_records_without_quoting(quoted):
+    path, _ = quoted
+    dialect = type("NoQuote", (csv.excel,), {"quoting": csv.QUOTE_NONE})
+    assert index_records(str(path), dialect) is None
+
+
+def test_complete_end(tmp_path):
+    path = tmp_path / "grow.csv"
+    path.write_bytes(b'1,x\n2,"open\nstill')
+    assert complete_end(str(path), 0, 4) == 4
+    assert complete_end(str(path), 12, 17) == 12  # the last line lacks its newline
+    assert complete_end(str(path), 4, 17, ord('"')) == 4  # the record is inside a quoted field
+    path.write_bytes(b'1,x\n2,"open\nstill"\n')
+    assert complete_end(str(path), 4, 19, ord('"')) == 19
+    assert complete_end(str(path), 19, 19, ord('"')) == 19
+
+
+def test_scan_tail_records(tmp_path):
+    path = tmp_path / "grow.csv"
+    quote = ord('"')
+    path.write_bytes(b'1,"a\nb"\n2,"open')
+    records = index_records(str(path), csv.excel)
+    assert records.offsets().tolist() == [0, 8, 15]
+    with open(path, "ab") as out:
+        out.write(b'\nstill"\n3,x\n')
+    tail = scan_tail_records(str(path), records, quote)
+    assert tail[0] == 8  # the incomplete record is scanned again
+    records.extend(tail)
+    assert records.offsets().tolist() == [0, 8, 23, 27]
+    tail = scan_tail_records(str(path), records, quote)
+    assert len(tail) == 0 and tail[0] == 27
+    records.extend(tail)
+    assert len(records) == 3
+    assert isinstance(records, LineIndex)
@@ -0,0 +1,45 @@
+import csv
+
+import pytest
+
+from rowfilter import FilterError, Predicate, filter_rows, parse_filter
+
+HEADER = ["id", "name", "amount"]
+DTYPES = ["int64", "str", "float64"]
+
+
+def test_conditions_joined_by_and():
+    assert parse_filter("name == Smith AND amount between 10, 20", HEADER, DTYPES) == [
+        Predicate(1, "==", "Smith"), Predicate(2, "between", ("10", "20"))]
+
+
+def test_and_inside_quotes_is_part_of_the_value():
+    assert parse_filter('name == "Smith and Sons" and id > 3', HEADER, DTYPES) == [
+        Predicate(1, "==", "Smith and Sons"), Predicate(0, ">", "3")]
+    assert parse_filter('name in "A and B", C', HEADER) == [Predicate(1, "in", ("A and B", "C"))]
+
+
+@pytest.mark.parametrize("text", ["amount > abc", "id in 1, x", "2 between 1, two"])
+def test_numeric_columns_take_numbers(text):
+    with pytest.raises(FilterError, match="no number"):
+        parse_filter(text, HEADER, DTYPES)
+
+
+def test_numbers_only_checked_with_types():
+    assert parse_filter("amount > abc", HEADER) == [Predicate(2, ">", "abc")]
+    assert parse_filter("amount ~ ^1", HEADER, DTYPES) == [Predicate(2, "~", "^1")]
+
+
+def test_unknown_column_and_unreadable_condition():
+    with pytest.raises(FilterError, match="no column"):
+        parse_filter("bogus == 1", HEADER)
+    with pytest.raises(FilterError, match="Cannot read"):
+        parse_filter("name", HEADER)
+
+
+def test_filter_rows(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("id,name,amount\n1,Smith and Sons,5\n2,Jones,15\n3,Smith and Sons,25\n")
+    predicates = parse_filter('name == "Smith and Sons" and amount > 10', HEADER, DTYPES)
+    named, large = filter_rows(str(path), predicates, csv.excel, DTYPES, firstline=1)
+    assert named.tolist() == [1, 3] and large.tolist() == [2, 3]
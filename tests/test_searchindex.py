@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from lineindex import LineScanner
+from searchindex import TERM, InvertedIndex, SearchIndexer, decode, decode_lists, encode, encode_lists
+
+
+@pytest.mark.parametrize("values", [[], [0], [5, 6, 200, 70000], list(range(0, 3000, 7)),
+                                    [1, 2 ** 35, 2 ** 35 + 1, 2 ** 62]])
+def test_encode_decode(values):
+    assert decode(encode(values)).tolist() == values
+
+
+def test_encode_lists_like_encode():
+    lists = [[3], [], list(range(10, 500, 3)), [0, 1, 2 ** 40]]
+    data, ends = encode_lists(np.array(sum(lists, []), dtype=np.uint64), [len(found) for found in lists])
+    data = data.tobytes()
+    starts = [0] + ends.tolist()[:-1]
+    assert [data[start:end] for start, end in zip(starts, ends.tolist())] == [encode(found) for found in lists]
+    values, counts = decode_lists(data, ends)
+    assert values.tolist() == sum(lists, []) and counts.tolist() == [len(found) for found in lists]
+
+
+def build(path, tmp_path, **kwargs):
+    indexer = SearchIndexer(directory=str(tmp_path / "search"), **kwargs)
+    LineScanner(str(path), consumers=[indexer], chunksize=4096).run()
+    return indexer.finish()
+
+
+def expected(lines):
+    found = {}
+    for n, line in enumerate(lines):
+        for term in TERM.findall(line):
+            found.setdefault(term, []).append(n)
+    return {term: sorted(set(numbers)) for term, numbers in found.items()}
+
+
+def test_terms_and_lines(tmp_path):
+    rng = np.random.default_rng(1)
+    words = ["alpha", "wörld", "it's", "a-b", "[x", "日本語", "9", "x" * 40]
+    lines = [" ".join(rng.choice(words, size=rng.integers(0, 6))) + rng.choice(["", ",", ";"]) for _ in range(3000)]
+    path = tmp_path / "words.txt"
+    data = "\r\n".join(lines).encode("utf-8")
+    path.write_bytes(data)
+    index = build(path, tmp_path)
+    terms = expected(data.split(b"\n"))
+    assert len(index) == len(terms)
+    for term, numbers in terms.items():
+        assert index.lines(term).tolist() == numbers
+    assert index.lines("nothere").tolist() == []
+
+
+def test_segments_merge_like_one(tmp_path):
+    path = tmp_path / "ids.csv"
+    path.write_bytes(b"".join(b"%d,name%d,%d\n" % (i, i % 97, i * 7) for i in range(20000)))
+    whole = build(path, tmp_path / "whole")
+    SearchIndexer.BATCH, batch = 100, SearchIndexer.BATCH
+    try:
+        merged = build(path, tmp_path / "merged", budget=16 * 1024)
+    finally:
+        SearchIndexer.BATCH = batch
+    assert len(merged) == len(whole)
+    for n in range(0, len(whole), 37):
+        term = whole.term(n)
+        assert merged.term(n) == term
+        assert merged.lines(term).tolist() == whole.lines(term).tolist()
+    assert merged.query("name5 35").tolist() == [5]
+
+
+def test_pending_postings_of_a_followed_file(tmp_path):
+    path = tmp_path / "grow.txt"
+    path.write_bytes(b"one two\nthree\n")
+    index = build(path, tmp_path)
+    indexer = SearchIndexer(index=index)
+    indexer.feed(memoryview(b"two four\nfour\n"), 14, 2, np.array([8, 13]))
+    assert isinstance(index, InvertedIndex)
+    assert index.lines("two").tolist() == [0, 2]
+    assert index.lines("four").tolist() == [2, 3]
+    # a last line without newline which is scanned again once completed
+    indexer.feed(memoryview(b"four five\n"), 23, 3, np.array([9]))
+    assert index.lines("four").tolist() == [2, 3]
+    assert index.query('"four five"', fetch=lambda n, count: ["four five"]).tolist() == [3]
+
+
+def test_unquoted_terms_are_cut_into_words(tmp_path):
+    path = tmp_path / "log.txt"
+    lines = ["id=3 status=FAILED", "id=4 status=OK", "status is FAILED for id 33", "FAILED, retrying"]
+    path.write_text("\n".join(lines) + "\n")
+    index = build(path, tmp_path)
+
+    def fetch(n, count):
+        return lines[n:n + count]
+
+    assert index.query("status=FAILED", fetch=fetch).tolist() == [0]
+    assert index.query("status=FAILED", fetch=fetch).tolist() == index.query('"status=FAILED"', fetch=fetch).tolist()
+    assert index.query("id=3", fetch=fetch).tolist() == [0]
+    assert index.query("status=FAILED", fetch=None).tolist() == [0, 2]  # unverified phrase
+    assert index.query("FAILED, = id=4 OR retrying", fetch=fetch).tolist() == [3]
+    assert index.query("FAILED,", fetch=fetch).tolist() == [0, 2, 3]
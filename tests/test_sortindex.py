@@ -0,0 +1,49 @@
+import csv
+
+import numpy as np
+import pytest
+
+from recordindex import index_records
+from sortindex import sort_permutation
+
+
+@pytest.fixture
+def spanning(tmp_path):
+    """Rows numbered in reverse in their first column, row 1000 has a quoted field over two lines"""
+    lines = [f"{2000 - n},row {n}" for n in range(2000)]
+    lines[1000] = f'{2000 - 1000},"two\nlines"'
+    path = tmp_path / "spanning.csv"
+    path.write_text("id,text\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_lines_keep_their_numbers(spanning):
+    permutation = sort_permutation(spanning, 0, csv.excel, firstline=1, numeric=True).tolist()
+    assert sorted(permutation) == list(range(1, 2002))
+    # the continuation line has no number and sorts last, every other line by its own key
+    assert permutation[-1] == 1002
+    assert permutation[:3] == [2001, 2000, 1999]
+    assert permutation[999] == 1001 and permutation[998] == 1003
+
+
+def test_records_are_numbered(spanning, tmp_path):
+    records = index_records(spanning, csv.excel)
+    permutation = sort_permutation(spanning, 0, csv.excel, firstline=1, numeric=True, records=records,
+                                   budget=4096, tmpdir=str(tmp_path)).tolist()
+    assert permutation == list(range(2000, 0, -1))
+
+
+def test_stray_quote_stays_on_its_line(tmp_path):
+    path = tmp_path / "stray.csv"
+    path.write_text('3,"open\n1,a\n2,b\n')
+    assert sort_permutation(str(path), 0, csv.excel, numeric=True).tolist() == [1, 2, 0]
+
+
+def test_spilled_runs_merge_like_one(tmp_path):
+    rng = np.random.default_rng(4)
+    values = rng.integers(0, 1000, size=5000)
+    path = tmp_path / "values.csv"
+    path.write_text("".join(f"{value},x\n" for value in values))
+    whole = sort_permutation(str(path), 0, csv.excel, numeric=True)
+    spilled = sort_permutation(str(path), 0, csv.excel, numeric=True, budget=4096, tmpdir=str(tmp_path))
+    assert whole.tolist() == spilled.tolist() == np.argsort(values, kind="stable").tolist()